@@ -1,6 +1,7 @@
+import os
+
 from flask import Flask, render_template, request
 from flask_login import LoginManager, current_user
-from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail
 from flask_wtf.csrf import CSRFProtect
@@ -19,12 +20,6 @@ login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 
-# User loader for Flask-Login
-@login_manager.user_loader
-def load_user(id):
-    from app.models import User
-    return User.query.get(int(id))
-
 def create_app(config_class=Config):
     app = Flask(__name__, 
                 template_folder='../templates',
@@ -33,17 +28,31 @@ def create_app(config_class=Config):
     # Load configuration
     app.config.from_object(config_class)
     
-    # Register filters
-    from app.filters import format_datetime, timesince
+    # Register template filters
+    from app.filters import timesince, format_datetime, format_timedelta
     app.jinja_env.filters['format_datetime'] = format_datetime
     app.jinja_env.filters['timesince'] = timesince
+    app.jinja_env.filters['datetime'] = format_datetime  # Register as 'datetime' to match template usage
+    app.jinja_env.filters['timedelta'] = format_timedelta
     
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
     csrf.init_app(app)
-    migrate = Migrate(app, db)    # Configure CSRF for AJAX
+    
+    # Opt-in SQL profiler: query counts and N+1 candidates per request
+    if app.config.get('SQL_PROFILER'):
+        from app.profiler import init_profiler
+        init_profiler(app)
+    
+    # Only the flask CLI needs the migration commands, and importing alembic costs
+    # more than the rest of startup together
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    
+    # Configure CSRF for AJAX
     @app.before_request
     def csrf_protect():
         if request.method != 'GET':
@@ -55,7 +64,8 @@ def create_app(config_class=Config):
     @app.context_processor
     def inject_models():
         from app.models import Notification
-        return dict(Notification=Notification)
+        from app.notifications import unread_total
+        return dict(Notification=Notification, unread_notification_count=unread_total)
     
     # Register background tasks
     # Register blueprints first to ensure models are fully loaded
@@ -63,6 +73,10 @@ def create_app(config_class=Config):
     from app.admin_routes import admin_bp  # Import admin_bp first
     from app.routes import main_bp, teacher_bp, student_bp
     from app.group_routes import group_bp
+    from app.job_routes import job_bp
+    from app.event_routes import events_bp
+    from app import export  # Registers the export job handlers
+    from app import identity  # Registers the cached user_loader
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
@@ -70,20 +84,29 @@ def create_app(config_class=Config):
     app.register_blueprint(student_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(group_bp)
+    app.register_blueprint(job_bp)
+    app.register_blueprint(events_bp)
     
-    # Now initialize background tasks with a fully set up app
-    with app.app_context():
-        from app.background_tasks import register_task, start_scheduler
-        from app.notifications import notify_exam_deadline_approaching
-        
-        # Ensure database is initialized
-        db.create_all()
-        
-        # Register the notification task to run every hour
-        register_task(notify_exam_deadline_approaching, 3600, "exam_deadline_notifications")
-        
-    # Start the scheduler in the background
-        start_scheduler(app)
+    # One schema version query instead of create_all (tests create their own tables)
+    if not app.testing and app.config.get('SCHEMA_CHECK', True):
+        from app.schema import check_schema
+        with app.app_context():
+            check_schema()
+    
+    role = app.config.get('APP_ROLE', 'web')
+    
+    # Export jobs run in web processes: resubmit the ones a restart left queued. This waits for
+    # the first request so no pool threads exist yet when a preforking server forks its workers
+    if role in ('web', 'all'):
+        from app.jobs import recover_jobs_once
+        app.before_request(lambda: recover_jobs_once(app))
+    
+    # Periodic tasks belong to the worker role (scheduler.py); web processes skip them entirely
+    if role in ('worker', 'all'):
+        _register_scheduled_tasks(app)
+        if role == 'all' and not app.testing:
+            from app.background_tasks import start_scheduler
+            start_scheduler(app, leader=app.config.get('SCHEDULER_LEADER_CANDIDATE', True))
     
     # Error handlers
     @app.errorhandler(404)
@@ -109,14 +132,40 @@ def create_app(config_class=Config):
     @app.context_processor
     def inject_user():
         return dict(current_user=current_user)
-      # Register template filters
-    from app.filters import timesince, format_datetime, format_timedelta
-    app.jinja_env.filters['timesince'] = timesince
-    app.jinja_env.filters['datetime'] = format_datetime  # Register as 'datetime' to match template usage
-    app.jinja_env.filters['timedelta'] = format_timedelta  # Add timedelta filter
     
     return app
 
+def _register_scheduled_tasks(app):
+    """Register the periodic tasks (worker role only, so web processes never import them)"""
+    from app.background_tasks import register_task
+    from app.notifications import notify_exam_deadline_approaching, reconcile_unread_counts
+    from app.membership import reconcile_member_counts
+    from app.maintenance import cleanup_export_jobs
+    from app.question_import import cleanup_staged_imports
+    from app.digest import send_email_digests
+    from app.mailer import ensure_mail_workers
+    
+    # Deadline reminders run often enough to honour the shortest reminder offset
+    register_task(notify_exam_deadline_approaching, app.config.get('REMINDER_CHECK_INTERVAL', 120), "exam_deadline_notifications")
+    
+    # Repair any drift in the cached unread notification counters
+    register_task(reconcile_unread_counts, 6 * 3600, "unread_counter_reconcile")
+    
+    # Same for the cached group member counters
+    register_task(reconcile_member_counts, 6 * 3600, "member_counter_reconcile")
+    
+    # Remove expired export artifacts every hour
+    register_task(cleanup_export_jobs, 3600, "export_job_cleanup")
+    
+    # Drop question uploads that were staged but never confirmed
+    register_task(cleanup_staged_imports, 3600, "staged_import_cleanup")
+    
+    # Collapse pending digest items into one email per user and window
+    register_task(send_email_digests, app.config.get('DIGEST_CHECK_INTERVAL', 300), "email_digests")
+    
+    # Drain the email outbox after a restart (workers are also started on demand when mail is queued)
+    register_task(ensure_mail_workers, 60, "email_outbox_workers")
+
 # Import for render_template and current_user
 from flask import render_template
 from flask_login import current_user
\ No newline at end of file
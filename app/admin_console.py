@@ -0,0 +1,134 @@
+"""
+Admin console read model.
+The control center used to load every user, exam and attempt to render a few counts and
+two tables. The totals now come from three aggregate queries, reused for ADMIN_STATS_TTL
+seconds, and the user and exam tables are filtered and paged in SQL and served as
+fragments, so the page costs the same however large the platform grows.
+"""
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import case, func, or_
+
+from app.models import db, User, Exam, ExamAttempt
+
+_stats = None
+_stats_lock = threading.Lock()
+
+USER_ROLES = ('admin', 'teacher', 'student')
+EXAM_STATUSES = ('published', 'draft')
+
+
+def _count_platform():
+    users = dict(db.session.query(User.user_type, func.count(User.id)).group_by(User.user_type).all())
+    total_exams, published_exams = db.session.query(
+        func.count(Exam.id),
+        func.sum(case((Exam.is_published == True, 1), else_=0))
+    ).one()
+    total_attempts, completed_attempts = db.session.query(
+        func.count(ExamAttempt.id),
+        func.sum(case((ExamAttempt.is_completed == True, 1), else_=0))
+    ).one()
+    return {
+        'total_users': sum(users.values()),
+        'teachers': users.get('teacher', 0),
+        'students': users.get('student', 0),
+        'total_exams': total_exams,
+        'published_exams': int(published_exams or 0),
+        'total_attempts': total_attempts,
+        'completed_attempts': int(completed_attempts or 0)
+    }
+
+
+def platform_stats(refresh=False):
+    """
+    Users per role, exams and attempts, from aggregate queries cached for ADMIN_STATS_TTL seconds.
+
+    Returns:
+        dict: total_users, teachers, students, total_exams, published_exams,
+              total_attempts and completed_attempts
+    """
+    global _stats
+    ttl = current_app.config.get('ADMIN_STATS_TTL', 60)
+    now = time.monotonic()
+    with _stats_lock:
+        cached = _stats
+    if not refresh and ttl > 0 and cached is not None and now - cached[0] < ttl:
+        return cached[1]
+
+    stats = _count_platform()
+    with _stats_lock:
+        _stats = (now, stats)
+    return stats
+
+
+def clear_stats_cache():
+    global _stats
+    with _stats_lock:
+        _stats = None
+
+
+def recent_attempts(limit=5):
+    """The latest attempts as plain rows (student name, exam title, score...)"""
+    return db.session.query(
+        ExamAttempt.id,
+        ExamAttempt.completed_at,
+        ExamAttempt.score,
+        User.username,
+        Exam.title.label('exam_title')
+    ).join(User, ExamAttempt.student_id == User.id)\
+     .join(Exam, ExamAttempt.exam_id == Exam.id)\
+     .order_by(ExamAttempt.id.desc())\
+     .limit(limit)\
+     .all()
+
+
+def _page_size():
+    return current_app.config.get('ADMIN_TABLE_PAGE_SIZE', 25)
+
+
+def user_page(page=1, search=None, role=None):
+    """
+    One page of the user table.
+
+    Args:
+        page: 1-based page number
+        search: Prefix of a username or email (uses their indexes)
+        role: One of USER_ROLES to show only that role
+
+    Returns:
+        Pagination: Rows with id, username, email, user_type and created_at
+    """
+    query = db.session.query(User.id, User.username, User.email, User.user_type, User.created_at)
+    if search:
+        query = query.filter(or_(
+            User.username.startswith(search, autoescape=True),
+            User.email.startswith(search, autoescape=True)
+        ))
+    if role in USER_ROLES:
+        query = query.filter(User.user_type == role)
+    return query.order_by(User.id.desc()).paginate(page=page, per_page=_page_size(), error_out=False)
+
+
+def exam_page(page=1, search=None, status=None):
+    """
+    One page of the exam table.
+
+    Args:
+        page: 1-based page number
+        search: Prefix of the exam title
+        status: 'published' or 'draft'
+
+    Returns:
+        Pagination: Rows with id, title, is_published, created_at and creator_name
+    """
+    query = db.session.query(
+        Exam.id, Exam.title, Exam.is_published, Exam.created_at, User.username.label('creator_name')
+    ).outerjoin(User, Exam.creator_id == User.id)
+    if search:
+        query = query.filter(Exam.title.startswith(search, autoescape=True))
+    if status in EXAM_STATUSES:
+        query = query.filter(Exam.is_published == (status == 'published'))
+    return query.order_by(Exam.id.desc()).paginate(page=page, per_page=_page_size(), error_out=False)
@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app
-from flask_login import login_required, current_user
+from flask_login import login_required, login_user, current_user
 from sqlalchemy.exc import SQLAlchemyError
 from .decorators import admin_required
 from .models import (
@@ -7,8 +7,8 @@ from .models import (
     Answer, ExamReview, ActivityLog
 )
 from .forms import UserEditForm, CreateUserForm, ExamForm
+from . import admin_console
 from werkzeug.security import generate_password_hash
-import json
 from datetime import datetime
 
 # Create blueprint
@@ -61,6 +61,46 @@ def activity_logs():
     )
 
 
+@admin_bp.route('/activity-logs/export')
+@login_required
+@admin_required
+def export_activity_logs():
+    """Dump the filtered activity logs to CSV as a background export job"""
+    from app.jobs import enqueue_job
+    
+    params = {
+        'user_id': request.args.get('user_id', type=int),
+        'category': request.args.get('category') or None,
+        'action': request.args.get('action') or None,
+        'start_date': request.args.get('start_date') or None,
+        'end_date': request.args.get('end_date') or None
+    }
+    job = enqueue_job('activity_logs', params, current_user.id)
+    return redirect(url_for('jobs.view_job', job_id=job.id))
+
+
+@admin_bp.route('/users/table')
+@login_required
+@admin_required
+def users_table():
+    """User table fragment for the control center (paged and filtered in SQL)"""
+    search = request.args.get('q', '').strip() or None
+    role = request.args.get('role') or None
+    users = admin_console.user_page(request.args.get('page', 1, type=int), search, role)
+    return render_template('admin/_users_table.html', users=users, search=search, role=role)
+
+
+@admin_bp.route('/exams/table')
+@login_required
+@admin_required
+def exams_table():
+    """Exam table fragment for the control center (paged and filtered in SQL)"""
+    search = request.args.get('q', '').strip() or None
+    status = request.args.get('status') or None
+    exams = admin_console.exam_page(request.args.get('page', 1, type=int), search, status)
+    return render_template('admin/_exams_table.html', exams=exams, search=search, status=status)
+
+
 @admin_bp.route('/users/<int:user_id>/edit', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -78,6 +118,8 @@ def edit_user(user_id):
             user.email = form.email.data
             user.user_type = form.user_type.data
             db.session.commit()
+            if user.id == current_user.id:
+                login_user(user)  # A role change bumps the auth version; keep the admin signed in
             flash('User updated successfully!', 'success')
             return redirect(url_for('main.admin_dashboard'))
         except SQLAlchemyError as e:
@@ -106,6 +148,7 @@ def delete_user(user_id):
         Exam.query.filter_by(creator_id=user.id).delete()
         db.session.delete(user)
         db.session.commit()
+        admin_console.clear_stats_cache()
         flash('User deleted successfully!', 'success')
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -166,6 +209,7 @@ def delete_exam(exam_id):
             user_agent=str(request.user_agent)
         )
         
+        admin_console.clear_stats_cache()
         flash('Exam deleted successfully!', 'success')
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -183,6 +227,7 @@ def toggle_exam_publish(exam_id):
         exam.is_published = not exam.is_published
         db.session.commit()
         status = 'published' if exam.is_published else 'unpublished'
+        admin_console.clear_stats_cache()
         flash(f'Exam {status} successfully!', 'success')
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -214,6 +259,7 @@ def create_user():
             )
             db.session.add(user)
             db.session.commit()
+            admin_console.clear_stats_cache()
             flash('User created successfully!', 'success')
             return redirect(url_for('main.admin_dashboard'))
         except SQLAlchemyError as e:
@@ -238,6 +284,7 @@ def create_exam():
             )
             db.session.add(exam)
             db.session.commit()
+            admin_console.clear_stats_cache()
             flash('Exam created successfully!', 'success')
             return redirect(url_for('main.admin_dashboard'))
         except SQLAlchemyError as e:
@@ -250,58 +297,16 @@ def create_exam():
 @login_required
 @admin_required
 def backup_data():
+    from app.jobs import enqueue_job
     try:
-        # Get selected backup options
-        backup_users = 'backup_users' in request.form
-        backup_exams = 'backup_exams' in request.form
-        backup_attempts = 'backup_attempts' in request.form
-        
-        # Create backup timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_data = {}
+        # Incremental backups only write the primary-key blocks that changed since the last backup
+        mode = 'incremental' if request.form.get('mode') == 'incremental' else 'full'
+        params = {'mode': mode}
         
-        if backup_users:
-            users = User.query.all()
-            backup_data['users'] = [
-                {
-                    'username': user.username,
-                    'email': user.email,
-                    'user_type': user.user_type,
-                    'created_at': user.created_at.isoformat()
-                } for user in users
-            ]
-        
-        if backup_exams:
-            exams = Exam.query.all()
-            backup_data['exams'] = [
-                {
-                    'title': exam.title,
-                    'description': exam.description,
-                    'time_limit_minutes': exam.time_limit_minutes,
-                    'is_published': exam.is_published,
-                    'created_at': exam.created_at.isoformat()
-                } for exam in exams
-            ]
-        
-        if backup_attempts:
-            attempts = ExamAttempt.query.all()
-            backup_data['attempts'] = [
-                {
-                    'student_id': attempt.student_id,
-                    'exam_id': attempt.exam_id,
-                    'started_at': attempt.started_at.isoformat() if attempt.started_at else None,
-                    'completed_at': attempt.completed_at.isoformat() if attempt.completed_at else None,
-                    'score': attempt.score
-                } for attempt in attempts
-            ]
-        
-        # Create JSON file
-        backup_file = f'backup_{timestamp}.json'
-        with open(backup_file, 'w') as f:
-            json.dump(backup_data, f, indent=4)
-        
-        flash('Backup created successfully!', 'success')
-        return redirect(url_for('main.admin_dashboard'))
+        # The backup is written to the artifacts directory by the export workers
+        job = enqueue_job('backup', params, current_user.id)
+        flash('Backup started. You can download it once it completes.', 'info')
+        return redirect(url_for('jobs.view_job', job_id=job.id))
         
     except Exception as e:
         flash('Error creating backup: ' + str(e), 'danger')
@@ -319,6 +324,26 @@ def system_logs():
     ]
     return render_template('admin/system_logs.html', logs=logs)
 
+@admin_bp.route('/sql-profile', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def sql_profile():
+    """Recent requests seen by the SQL profiler, with their query counts and N+1 candidates"""
+    from app import profiler
+    if request.method == 'POST':
+        profiler.clear_profiles()
+        flash('SQL profile history cleared.', 'success')
+        return redirect(url_for('admin.sql_profile'))
+
+    sort = request.args.get('sort', 'recent')
+    return render_template('admin/sql_profile.html',
+                         enabled=current_app.config.get('SQL_PROFILER', False),
+                         threshold=current_app.config.get('SQL_PROFILER_N1_THRESHOLD', 3),
+                         log_path=current_app.config.get('SQL_PROFILER_LOG'),
+                         endpoints=profiler.endpoint_summary(),
+                         profiles=profiler.recent_profiles(sort),
+                         sort=sort)
+
 @admin_bp.route('/settings', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -339,26 +364,32 @@ def system_settings():
 @login_required
 @admin_required
 def send_mass_email():
+    from app.email import queue_mass_email
+    from app.fanout import enqueue_fanout
+    
+    recipient_group = request.form.get('recipient_group')
+    subject = (request.form.get('subject') or '').strip()
+    content = (request.form.get('content') or '').strip()
+    
+    if recipient_group not in ('all', 'teachers', 'students') or not subject or not content:
+        flash('Please choose recipients and enter a subject and message.', 'warning')
+        return redirect(url_for('main.admin_dashboard'))
+    
     try:
-        recipient_group = request.form.get('recipient_group')
-        subject = request.form.get('subject')
-        content = request.form.get('content')
-        
-        # Get recipients based on selected group
-        if recipient_group == 'all':
-            recipients = User.query.all()
-        elif recipient_group == 'teachers':
-            recipients = User.query.filter_by(user_type='teacher').all()
-        else:  # students
-            recipients = User.query.filter_by(user_type='student').all()
-        
-        # Send emails (implement actual email sending logic)
-        for recipient in recipients:
-            # Add to email queue or send directly
-            pass
-        
-        flash(f'Email sent to {len(recipients)} recipients!', 'success')
+        # Recipients are added to the outbox in chunks on the fan-out pool
+        enqueue_fanout(queue_mass_email, recipient_group, subject, content)
+        flash('Email queued for delivery.', 'success')
     except Exception as e:
         flash('Error sending email: ' + str(e), 'danger')
     
     return redirect(url_for('main.admin_dashboard'))
+
+
+@admin_bp.route('/email-outbox/metrics')
+@login_required
+@admin_required
+def email_outbox_metrics():
+    """Delivery metrics of the email outbox as JSON"""
+    from flask import jsonify
+    from app.mailer import mail_metrics
+    return jsonify(mail_metrics())
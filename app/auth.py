@@ -1,20 +1,21 @@
 from flask import (
     Blueprint, render_template, redirect, url_for,
-    flash, request, session
+    flash, request, session, current_app
 )
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.urls import url_parse
 from sqlalchemy import func
 
 from app.models import db, User, Exam, ExamAttempt
-from app.forms import LoginForm, RegistrationForm, PasswordUpdateForm
-from app.security import ip_rate_limit, reset_login_attempts
+from app.forms import LoginForm, RegistrationForm, PasswordUpdateForm, NotificationPreferencesForm
+from app.security import login_rate_limit, reset_login_attempts
+from app.passwords import verify_password
 
 # Create a Blueprint for authentication
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
-@ip_rate_limit()
+@login_rate_limit()
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
@@ -23,8 +24,12 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         
-        # Check if user exists and password is valid
-        if user is None or not user.check_password(form.password.data):
+        # Check if user exists and password is valid (verified on the password pool)
+        valid = user is not None and verify_password(user, form.password.data, request.remote_addr)
+        if valid is None:
+            flash('Many people are signing in right now. Please try again in a few seconds.', 'warning')
+            return render_template('auth/login.html', form=form), 503, {'Retry-After': '5'}
+        if not valid:
             flash('Invalid username or password', 'danger')
             return render_template('auth/login.html', form=form)
         
@@ -96,14 +101,16 @@ def register():
 @login_required
 def profile():
     form = PasswordUpdateForm()
+    preferences_form = NotificationPreferencesForm(email_frequency=current_user.email_frequency)
     
     # Get user specific stats
     if current_user.is_teacher():
         # For teachers - get total exams created
-        from app.models import Exam
-        total_exams = Exam.query.filter_by(creator_id=current_user.id).count()
+        from app.teacher_stats import exam_totals
+        total_exams, _ = exam_totals(current_user.id)
         return render_template('auth/profile.html', 
                              password_form=form,
+                             preferences_form=preferences_form,
                              total_exams=total_exams)
     
     elif current_user.is_student():
@@ -121,11 +128,31 @@ def profile():
         
         return render_template('auth/profile.html',
                              password_form=form,
+                             preferences_form=preferences_form,
                              completed_exams=completed_exams,
                              avg_score=avg_score)
     
     # For admin users
-    return render_template('auth/profile.html', password_form=form)
+    return render_template('auth/profile.html', password_form=form, preferences_form=preferences_form)
+
+
+@auth_bp.route('/notification-preferences', methods=['POST'])
+@login_required
+def update_notification_preferences():
+    form = NotificationPreferencesForm()
+    if form.validate_on_submit():
+        current_user.email_frequency = form.email_frequency.data
+        try:
+            db.session.commit()
+            flash('Your notification preferences have been saved.', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash('An error occurred while saving your preferences.', 'danger')
+            print(f"Preference update error: {str(e)}")
+    else:
+        flash('Please choose a valid email frequency.', 'danger')
+    
+    return redirect(url_for('auth.profile'))
 
 
 @auth_bp.route('/update-password', methods=['POST'])
@@ -133,10 +160,16 @@ def profile():
 def update_password():
     form = PasswordUpdateForm()
     if form.validate_on_submit():
-        if current_user.check_password(form.current_password.data):
+        valid = verify_password(current_user, form.current_password.data, request.remote_addr)
+        if valid is None:
+            flash('The server is busy. Please try again in a few seconds.', 'warning')
+        elif valid:
             current_user.set_password(form.new_password.data)
             try:
                 db.session.commit()
+                # The new auth version logs out every other session; keep this one
+                login_user(current_user._get_current_object(),
+                           remember=bool(request.cookies.get(current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'))))
                 flash('Your password has been updated successfully.', 'success')
                 return redirect(url_for('auth.profile'))
             except Exception as e:
@@ -1,13 +1,27 @@
 """
 Background task scheduler for the application.
-This runs periodic tasks in the background.
+Periodic tasks run on a single scheduler leader. Every process that starts the scheduler
+is a candidate: the leader holds a MySQL named lock (GET_LOCK), or an exclusive file lock
+when the database is not MySQL, and the other candidates retry periodically so one of
+them takes over when the leader exits. Due times are kept in a heap, tasks run on a
+bounded thread pool, and each run's last and next time is stored in scheduled_task_state
+so a new leader carries on where the previous one stopped instead of re-firing everything.
+
+Tasks registered with leader_only=False (per-process housekeeping such as in-memory
+caches) run in every process that starts the scheduler.
 """
 
+import heapq
+import os
+import signal
 import threading
 import time
 import logging
-from datetime import datetime, timedelta
-from typing import Callable, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from sqlalchemy import text
 
 # Configure logging
 logging.basicConfig(
@@ -18,100 +32,420 @@ logger = logging.getLogger(__name__)
 
 # Store for registered tasks
 tasks = {}
-running = False
-stop_event = threading.Event()
 
-def register_task(func: Callable, interval: int, name: str = None):
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def register_task(func: Callable, interval: int, name: str = None, leader_only: bool = True, timeout: int = None):
     """
     Register a task to be run at specified intervals.
-    
+
     Args:
         func: The function to run
         interval: Interval in seconds
         name: Optional name for the task (defaults to function name)
+        leader_only: Run only on the scheduler leader (False runs it in every process)
+        timeout: Seconds after which a run is reported as hung (defaults to SCHEDULER_TASK_TIMEOUT)
     """
     task_name = name or func.__name__
     tasks[task_name] = {
         'func': func,
         'interval': interval,
+        'leader_only': leader_only,
+        'timeout': timeout,
         'last_run': None,
-        'next_run': datetime.now()
+        'next_run': None
     }
     logger.info(f"Registered task: {task_name} to run every {interval} seconds")
     return task_name
 
-def start_scheduler(app):
+
+def _timestamp(value):
+    """Naive UTC datetime to epoch seconds"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class MySQLLeaderLock:
+    """Leadership through a MySQL named lock, held by one dedicated connection"""
+
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name[:64]
+        self.connection = None
+
+    def acquire(self):
+        connection = self.engine.connect()
+        try:
+            acquired = connection.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': self.name}).scalar() == 1
+        except Exception:
+            connection.close()
+            raise
+        if acquired:
+            self.connection = connection
+        else:
+            connection.close()
+        return acquired
+
+    def still_held(self):
+        if self.connection is None:
+            return False
+        try:
+            return self.connection.execute(
+                text("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"), {'name': self.name}
+            ).scalar() == 1
+        except Exception as e:
+            # The connection died, and the server released the lock with it
+            logger.warning(f"Lost the scheduler lock connection: {str(e)}")
+            self.connection.invalidate()
+            self.connection = None
+            return False
+
+    def release(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': self.name})
+            self.connection.close()
+        except Exception:
+            # Never hand a connection that may still hold the lock back to the pool
+            self.connection.invalidate()
+        self.connection = None
+
+
+class FileLeaderLock:
+    """Leadership through an exclusive lock on a local file (candidates on one host only)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        handle = open(self.path, 'a+')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self.handle = handle
+        return True
+
+    def still_held(self):
+        return self.handle is not None
+
+    def release(self):
+        if self.handle is not None:
+            # Closing the file releases the lock
+            self.handle.close()
+            self.handle = None
+
+
+def leader_lock(app):
+    """The leader lock for this app's database (needs an application context)"""
+    from app.models import db
+
+    kind = app.config.get('SCHEDULER_LOCK', 'auto')
+    engine = db.engine
+    if kind == 'mysql' or (kind == 'auto' and engine.dialect.name == 'mysql'):
+        return MySQLLeaderLock(engine, app.config.get('SCHEDULER_LOCK_NAME') or f"scheduler:{engine.url.database}")
+    return FileLeaderLock(app.config['SCHEDULER_LOCK_FILE'])
+
+
+class Scheduler:
+    """
+    Next-run heap plus a bounded worker pool.
+    A task is never run again while its previous run is still going.
+    """
+
+    def __init__(self, app, leader=True):
+        self.app = app
+        self.leader = leader  # Whether this process competes for leadership
+        self.is_leader = False
+        self.lock = None
+        self.heap = []
+        self.scheduled = set()
+        self.running = {}
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('SCHEDULER_WORKERS', 4),
+            thread_name_prefix='scheduler'
+        )
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='scheduler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def run(self):
+        """Main scheduler loop"""
+        if self.leader:
+            with self.app.app_context():
+                self.lock = leader_lock(self.app)
+        check_every = self.app.config.get('SCHEDULER_LEADER_CHECK_SECONDS', 30)
+
+        now = time.time()
+        for name, task in tasks.items():
+            if not task['leader_only']:
+                self._schedule(name, now)
+
+        next_check = 0.0
+        try:
+            while not self.stop_event.is_set():
+                # Cleared first so a run finishing while this pass works still wakes the next one
+                self.wake.clear()
+                if self.leader and time.monotonic() >= next_check:
+                    self._check_leadership()
+                    next_check = time.monotonic() + check_every
+                self._reap()
+                self._dispatch()
+                self.wake.wait(self._sleep_time(next_check))
+        finally:
+            self._lose_leadership()
+            self.executor.shutdown(wait=False)
+        logger.info("Background task scheduler stopped")
+
+    def _check_leadership(self):
+        try:
+            if self.is_leader:
+                if not self.lock.still_held():
+                    logger.warning("Scheduler lost leadership")
+                    self._lose_leadership()
+            elif self.lock.acquire():
+                self._become_leader()
+        except Exception as e:
+            logger.error(f"Scheduler leader election failed: {str(e)}")
+
+    def _become_leader(self):
+        from app.models import db, ScheduledTaskState
+
+        self.is_leader = True
+        states = {}
+        with self.app.app_context():
+            try:
+                states = {state.name: state for state in ScheduledTaskState.query.all()}
+            except Exception as e:
+                logger.error(f"Could not load scheduler state, running every task now: {str(e)}")
+            finally:
+                db.session.remove()
+
+        now = time.time()
+        for name, task in tasks.items():
+            if not task['leader_only'] or name in self.running:
+                continue
+            state = states.get(name)
+            due = now
+            if state is not None and state.next_run_at is not None:
+                due = _timestamp(state.next_run_at)
+                if state.last_run_at is not None:
+                    # The interval may have been shortened since the state was saved
+                    due = min(due, _timestamp(state.last_run_at) + task['interval'])
+            self._schedule(name, due)
+        logger.info("This process is now the scheduler leader")
+
+    def _lose_leadership(self):
+        if self.is_leader:
+            self.is_leader = False
+            self.heap = [entry for entry in self.heap if not tasks.get(entry[1], {}).get('leader_only')]
+            heapq.heapify(self.heap)
+            self.scheduled = {name for _, name in self.heap}
+        if self.lock is not None:
+            try:
+                self.lock.release()
+            except Exception as e:
+                logger.error(f"Could not release the scheduler lock: {str(e)}")
+
+    def _schedule(self, name, due):
+        if name not in self.scheduled:
+            heapq.heappush(self.heap, (due, name))
+            self.scheduled.add(name)
+
+    def _reap(self):
+        """Reschedule finished runs and report runs that exceeded their timeout"""
+        default_timeout = self.app.config.get('SCHEDULER_TASK_TIMEOUT', 600)
+        for name, run in list(self.running.items()):
+            task = tasks.get(name)
+            if run['future'].done():
+                del self.running[name]
+                if task and (self.is_leader or not task['leader_only']):
+                    self._schedule(name, run['submitted_at'] + task['interval'])
+            elif run['started'] is not None and not run['timed_out']:
+                timeout = (task and task['timeout']) or default_timeout
+                if time.monotonic() - run['started'] > timeout:
+                    # Threads cannot be killed; the task is skipped until this run returns
+                    run['timed_out'] = True
+                    logger.error(f"Task {name} has been running for more than {timeout} seconds")
+
+    def _dispatch(self):
+        now = time.time()
+        while self.heap and self.heap[0][0] <= now:
+            _, name = heapq.heappop(self.heap)
+            self.scheduled.discard(name)
+            task = tasks.get(name)
+            if task is None or name in self.running or (task['leader_only'] and not self.is_leader):
+                continue
+            run = {'future': None, 'submitted_at': now, 'started': None, 'timed_out': False}
+            self.running[name] = run
+            run['future'] = self.executor.submit(self._run_task, name, task, run)
+            run['future'].add_done_callback(lambda _: self.wake.set())
+
+    def _sleep_time(self, next_check):
+        waits = [60.0]
+        if self.leader:
+            waits.append(next_check - time.monotonic())
+        if self.heap:
+            waits.append(self.heap[0][0] - time.time())
+        if any(run['started'] is not None and not run['timed_out'] for run in self.running.values()):
+            waits.append(5.0)  # Look for hung runs
+        return max(min(waits), 0.0)
+
+    def _run_task(self, name, task, run):
+        """Run one task inside its own application context and record the outcome"""
+        from app.models import db
+
+        run['started'] = time.monotonic()
+        started_at = datetime.utcnow()
+        status, error = 'ok', None
+        logger.info(f"Running task: {name}")
+        with self.app.app_context():
+            try:
+                result = task['func']()
+                # Tasks may report failure with a (False, message) tuple
+                if isinstance(result, tuple) and result and result[0] is False:
+                    status, error = 'failed', str(result[1]) if len(result) > 1 else None
+                    logger.error(f"Task {name} reported failure: {error}")
+                else:
+                    logger.info(f"Task {name} completed successfully")
+            except Exception as e:
+                status, error = 'failed', str(e)
+                logger.error(f"Error running task {name}: {str(e)}")
+                try:
+                    # Clean up any failed db transactions
+                    db.session.rollback()
+                except Exception as db_error:
+                    logger.error(f"Failed to roll back transaction: {str(db_error)}")
+
+            task['last_run'] = started_at
+            task['next_run'] = started_at + timedelta(seconds=task['interval'])
+            if task['leader_only']:
+                _save_state(name, task, status, error, time.monotonic() - run['started'])
+            db.session.remove()
+
+
+def _save_state(name, task, status, error, duration):
+    from app.models import db, ScheduledTaskState
+
+    try:
+        state = db.session.get(ScheduledTaskState, name) or ScheduledTaskState(name=name, run_count=0)
+        state.last_run_at = task['last_run']
+        state.next_run_at = task['next_run']
+        state.last_status = status
+        state.last_error = error[:500] if error else None
+        state.last_duration_ms = int(duration * 1000)
+        state.run_count = (state.run_count or 0) + 1
+        db.session.add(state)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not save scheduler state for {name}: {str(e)}")
+
+
+def start_scheduler(app, leader=True):
     """
     Start the task scheduler in a background thread
-    
+
     Args:
         app: Flask application instance for context
+        leader: Compete for leadership (False runs only the per-process tasks)
     """
-    global running
-    if running:
-        logger.warning("Scheduler is already running")
-        return
-    
-    running = True
-    
-    # Run the scheduler in a separate thread
-    scheduler_thread = threading.Thread(target=_run_scheduler, args=(app,))
-    scheduler_thread.daemon = True  # Daemon thread will close when main thread exits
-    scheduler_thread.start()
-    
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            logger.warning("Scheduler is already running")
+            return _scheduler
+        _scheduler = Scheduler(app, leader).start()
     logger.info("Background task scheduler started")
+    return _scheduler
+
+def stop_scheduler(timeout=None):
+    """Stop the scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        scheduler, _scheduler = _scheduler, None
+    if scheduler is not None:
+        logger.info("Stopping background task scheduler")
+        scheduler.stop(timeout)
+
 
-def _run_scheduler(app):
+def run_scheduler_worker(app):
     """
-    Main scheduler loop - runs in a separate thread
-    
-    Args:
-        app: Flask application instance for context
+    Run the scheduler in the foreground (the standalone worker entry point).
+    Returns after SIGINT or SIGTERM.
     """
-    while not stop_event.is_set():
-        now = datetime.now()
-        
+    global _scheduler
+    scheduler = Scheduler(app, leader=True)
+    with _scheduler_lock:
+        _scheduler = scheduler
+
+    def _stop(signum, frame):
+        logger.info(f"Received signal {signum}, stopping the scheduler")
+        scheduler.stop()
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+    scheduler.run()
+
+
+def run_tasks_once(app, names=None):
+    """
+    Run leader tasks once if no scheduler leader is active (for cron-style invocation).
+
+    Returns:
+        bool: False if another process holds leadership and nothing was run
+    """
+    with app.app_context():
+        lock = leader_lock(app)
+    if not lock.acquire():
+        logger.info("Another scheduler is the leader; not running tasks")
+        return False
+    scheduler = Scheduler(app, leader=False)
+    try:
         for name, task in tasks.items():
-            # Check if it's time to run this task
-            if task['next_run'] <= now:
-                logger.info(f"Running task: {name}")
-                  # Run the task with app context
-                with app.app_context():
-                    try:
-                        # First verify database connection is available
-                        from app.models import db
-                        try:
-                            # Test the database connection before proceeding
-                            db.session.execute("SELECT 1").fetchone()
-                        except Exception as conn_error:
-                            logger.error(f"Database connection not available for task {name}: {str(conn_error)}")
-                            continue  # Skip this task execution
-                            
-                        # Run the task
-                        task['func']()
-                        logger.info(f"Task {name} completed successfully")
-                    except Exception as e:
-                        logger.error(f"Error running task {name}: {str(e)}")
-                        try:
-                            # Clean up any failed db transactions
-                            from app.models import db
-                            db.session.rollback()
-                        except Exception as db_error:
-                            logger.error(f"Failed to roll back transaction: {str(db_error)}")
-                
-                # Update last_run and schedule next run
-                task['last_run'] = now
-                task['next_run'] = now + timedelta(seconds=task['interval'])
-        
-        # Sleep for a bit to avoid high CPU usage
-        time.sleep(5)
-    
-    logger.info("Background task scheduler stopped")
-
-def stop_scheduler():
-    """Stop the scheduler"""
-    global running
-    if running:
-        stop_event.set()
-        running = False
-        logger.info("Stopping background task scheduler")
+            if task['leader_only'] and (names is None or name in names):
+                scheduler._run_task(name, task, {'started': None})
+    finally:
+        scheduler.executor.shutdown(wait=False)
+        lock.release()
+    return True
+
+
+def scheduler_status():
+    """Leadership and the last and next run of each task in this process"""
+    scheduler = _scheduler
+    return {
+        'running': scheduler is not None,
+        'leader': bool(scheduler and scheduler.is_leader),
+        'tasks': {
+            name: {
+                'interval': task['interval'],
+                'leader_only': task['leader_only'],
+                'last_run': task['last_run'],
+                'next_run': task['next_run'],
+                'running': bool(scheduler and name in scheduler.running)
+            }
+            for name, task in tasks.items()
+        }
+    }
@@ -0,0 +1,326 @@
+"""
+Broadcast notifications (fan-out on read).
+An announcement for a group or a whole role is stored as one row, whatever the size of
+its audience. Each user's view of broadcasts is computed at query time: membership
+decides visibility, a per-user read watermark plus a small read-set decides read state.
+
+New broadcasts are pushed to the online audience of the process that created them. Every
+web process also runs a relay that polls for broadcasts created elsewhere (deadline
+reminders from the scheduler worker, announcements from other web workers) while it has
+open event streams, and pushes those to its own streams.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import and_, exists, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, BroadcastNotification, BroadcastRead, GroupMembership, ExamAttempt, User
+from app.events import active_user_ids, publish_event
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds a user's broadcast unread count is reused (new broadcasts clear it once this process sees them)
+UNREAD_COUNT_TTL = 60
+
+# Broadcasts the relay pushes per poll; a larger backlog is worked through on the next polls
+RELAY_BATCH_SIZE = 100
+
+_unread_cache = {}
+_unread_lock = threading.Lock()
+_version = 0
+
+
+def _bump_version():
+    global _version
+    with _unread_lock:
+        _version += 1
+
+
+def create_broadcast(message, notification_type, related_id=None, group_id=None, role=None, dedupe_key=None):
+    """
+    Store one announcement for a group's members or for every user of a role.
+
+    Args:
+        message (str): The notification message
+        notification_type (str): Type of notification (new_exam, exam_ending, ...)
+        related_id (int, optional): ID of the related entity
+        group_id (int, optional): Audience group
+        role (str, optional): Audience role when there is no group
+        dedupe_key (str, optional): Unique key; a second broadcast with the same key is skipped
+
+    Returns:
+        BroadcastNotification or None: The broadcast, or None if dedupe_key was already used
+    """
+    if (group_id is None) == (role is None):
+        raise ValueError("A broadcast needs exactly one of group_id or role")
+
+    broadcast = BroadcastNotification(
+        audience_type='group' if group_id is not None else 'role',
+        group_id=group_id,
+        role=role,
+        message=message,
+        type=notification_type,
+        related_id=related_id,
+        dedupe_key=dedupe_key
+    )
+    db.session.add(broadcast)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    _bump_version()
+    return broadcast
+
+
+def visible_to(user):
+    """Filter criteria for the broadcasts a user can see"""
+    member = exists().where(and_(
+        GroupMembership.group_id == BroadcastNotification.group_id,
+        GroupMembership.user_id == user.id,
+        GroupMembership.joined_at <= BroadcastNotification.created_at
+    ))
+    completed = exists().where(and_(
+        ExamAttempt.exam_id == BroadcastNotification.related_id,
+        ExamAttempt.student_id == user.id,
+        ExamAttempt.is_completed == True
+    ))
+    return [
+        or_(
+            and_(
+                BroadcastNotification.audience_type == 'role',
+                BroadcastNotification.role == user.user_type,
+                BroadcastNotification.created_at >= user.created_at
+            ),
+            and_(BroadcastNotification.audience_type == 'group', member)
+        ),
+        # Deadline reminders disappear for students who already finished the exam
+        or_(BroadcastNotification.type != 'exam_ending', ~completed)
+    ]
+
+
+def _read_individually(user):
+    return exists().where(and_(
+        BroadcastRead.broadcast_id == BroadcastNotification.id,
+        BroadcastRead.user_id == user.id
+    ))
+
+
+def recent_broadcasts(user, before_id=None, limit=20):
+    """
+    A user's broadcasts, newest first, as rows with an is_read column.
+
+    Args:
+        user: The reader
+        before_id (int, optional): Keyset cursor; only broadcasts with a smaller id
+        limit (int): Maximum number of rows
+    """
+    query = db.session.query(
+        BroadcastNotification.id, BroadcastNotification.message, BroadcastNotification.type,
+        BroadcastNotification.related_id, BroadcastNotification.created_at,
+        or_(BroadcastNotification.id <= user.broadcast_read_through, _read_individually(user)).label('is_read')
+    ).filter(*visible_to(user))
+    if before_id:
+        query = query.filter(BroadcastNotification.id < before_id)
+    return query.order_by(BroadcastNotification.id.desc()).limit(limit).all()
+
+
+def broadcast_unread_count(user):
+    """Unread broadcasts of a user, cached for UNREAD_COUNT_TTL seconds"""
+    now = time.monotonic()
+    key = (user.id, user.broadcast_read_through)
+    with _unread_lock:
+        cached = _unread_cache.get(user.id)
+        version = _version
+    if cached and cached[0] == key and cached[1] == version and now - cached[2] < UNREAD_COUNT_TTL:
+        return cached[3]
+
+    count = db.session.query(func.count(BroadcastNotification.id)).filter(
+        BroadcastNotification.id > user.broadcast_read_through,
+        ~_read_individually(user),
+        *visible_to(user)
+    ).scalar() or 0
+
+    with _unread_lock:
+        _unread_cache[user.id] = (key, version, now, count)
+        if len(_unread_cache) > 10000:
+            for user_id in [user_id for user_id, value in _unread_cache.items() if now - value[2] >= UNREAD_COUNT_TTL]:
+                del _unread_cache[user_id]
+    return count
+
+
+def forget_unread_count(user_id):
+    with _unread_lock:
+        _unread_cache.pop(user_id, None)
+
+
+def mark_broadcast_read(user, broadcast_id):
+    """
+    Mark one broadcast read for one user.
+
+    Returns:
+        int: 1 if it changed from unread to read, else 0
+    """
+    if broadcast_id <= user.broadcast_read_through:
+        return 0
+    visible = db.session.query(BroadcastNotification.id).filter(
+        BroadcastNotification.id == broadcast_id, *visible_to(user)
+    ).first()
+    if not visible:
+        return 0
+
+    db.session.add(BroadcastRead(user_id=user.id, broadcast_id=broadcast_id))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return 0
+    forget_unread_count(user.id)
+    return 1
+
+
+def mark_all_broadcasts_read(user):
+    """Move the user's watermark past every existing broadcast and drop their read-set"""
+    latest = db.session.query(func.max(BroadcastNotification.id)).scalar() or 0
+    if latest > user.broadcast_read_through:
+        db.session.query(User).filter(User.id == user.id).update(
+            {User.broadcast_read_through: latest}, synchronize_session=False
+        )
+    db.session.query(BroadcastRead).filter(
+        BroadcastRead.user_id == user.id,
+        BroadcastRead.broadcast_id <= latest
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    forget_unread_count(user.id)
+    return latest
+
+
+def online_audience(broadcast):
+    """
+    IDs of audience members with an open event stream in this process.
+    Only they need a push; everyone else sees the broadcast on their next read.
+    """
+    online = list(active_user_ids())
+    if not online:
+        return []
+    if broadcast.audience_type == 'group':
+        query = db.session.query(GroupMembership.user_id.label('id')).filter(
+            GroupMembership.group_id == broadcast.group_id,
+            GroupMembership.user_id.in_(online)
+        )
+        user_id = GroupMembership.user_id
+    else:
+        query = db.session.query(User.id).filter(User.user_type == broadcast.role, User.id.in_(online))
+        user_id = User.id
+    if broadcast.type == 'exam_ending':
+        query = query.filter(~exists().where(and_(
+            ExamAttempt.exam_id == broadcast.related_id,
+            ExamAttempt.student_id == user_id,
+            ExamAttempt.is_completed == True
+        )))
+    return [row.id for row in query]
+
+
+def _notification_data(broadcast):
+    return {'message': broadcast.message, 'type': broadcast.type, 'related_id': broadcast.related_id, 'unread_delta': 1}
+
+
+def publish_broadcast(broadcast):
+    """
+    Push a new broadcast to its online audience in this process; the relays of the other
+    web processes push it to theirs.
+
+    Returns:
+        list: The online audience, for callers that push further events to the same users
+    """
+    relay = _relay
+    if relay is not None:
+        relay.mark_pushed(broadcast.id)
+    online = online_audience(broadcast)
+    publish_event(online, 'notification', _notification_data(broadcast))
+    return online
+
+
+class BroadcastRelay:
+    """Polls for broadcasts created by other processes and pushes them to this process's streams"""
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self.last_id = None  # Highest broadcast id seen; None until the first poll with streams open
+        self.pushed = set()  # Broadcasts this process already pushed when it created them
+        self.lock = threading.Lock()
+
+    def mark_pushed(self, broadcast_id):
+        with self.lock:
+            self.pushed.add(broadcast_id)
+
+    def poll(self):
+        """
+        Push the broadcasts created since the last poll. Processes without open streams
+        skip the query and start from the newest broadcast once a stream connects.
+
+        Returns:
+            int: Number of events delivered
+        """
+        if not active_user_ids():
+            self.last_id = None
+            return 0
+        if self.last_id is None:
+            self.last_id = db.session.query(func.max(BroadcastNotification.id)).scalar() or 0
+            return 0
+
+        broadcasts = BroadcastNotification.query.filter(
+            BroadcastNotification.id > self.last_id
+        ).order_by(BroadcastNotification.id).limit(RELAY_BATCH_SIZE).all()
+        if not broadcasts:
+            return 0
+        _bump_version()
+
+        delivered = 0
+        for broadcast in broadcasts:
+            self.last_id = broadcast.id
+            with self.lock:
+                if broadcast.id in self.pushed:
+                    continue
+            delivered += publish_event(online_audience(broadcast), 'notification', _notification_data(broadcast))
+        with self.lock:
+            self.pushed = {broadcast_id for broadcast_id in self.pushed if broadcast_id > self.last_id}
+        return delivered
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error(f"Broadcast relay poll failed: {str(e)}")
+                finally:
+                    db.session.remove()
+
+
+_relay = None
+_relay_pid = None
+_relay_lock = threading.Lock()
+
+
+def start_relay(app):
+    """
+    Start this process's broadcast relay (called when an event stream opens, so no thread
+    exists yet when a preforking server forks its workers).
+    """
+    global _relay, _relay_pid
+    if _relay_pid == os.getpid():
+        return _relay
+    with _relay_lock:
+        if _relay_pid != os.getpid():
+            _relay = BroadcastRelay(app, app.config.get('BROADCAST_RELAY_INTERVAL', 5))
+            threading.Thread(target=_relay.run, name='broadcast-relay', daemon=True).start()
+            _relay_pid = os.getpid()
+    return _relay
@@ -6,7 +6,7 @@ from .models import ActivityLog
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_admin:
+        if not current_user.is_admin():
             abort(403)
         return f(*args, **kwargs)
     return decorated_function
@@ -0,0 +1,130 @@
+"""
+Email digests.
+Users who prefer hourly or daily email get email-worthy events stored as digest items
+instead of one message each. A scheduled task collapses each user's pending items into
+a single message once the oldest of them has waited a full window.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, func, or_
+
+from app.models import db, DigestItem, User
+from app.mailer import enqueue_emails, INSERT_CHUNK_SIZE
+from app.email_templates import render_email_template
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DIGEST_WINDOWS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1)
+}
+
+# Users whose digests are rendered and queued per transaction
+USERS_PER_BATCH = 500
+
+
+def wants_digest(user):
+    """Whether a user (or row with email_frequency) collects email in digests"""
+    return getattr(user, 'email_frequency', 'immediate') in DIGEST_WINDOWS
+
+
+def add_digest_items(items):
+    """
+    Hold events back for the users' next digest.
+
+    Args:
+        items: Dicts with user_id, category, summary and optional detail and related_id
+
+    Returns:
+        int: Number of items stored
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            'user_id': item['user_id'],
+            'category': item['category'],
+            'summary': item['summary'][:255],
+            'detail': item['detail'][:500] if item.get('detail') else None,
+            'related_id': item.get('related_id'),
+            'created_at': now
+        }
+        for item in items
+    ]
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(DigestItem.__table__.insert(), rows[start:start + INSERT_CHUNK_SIZE])
+    db.session.commit()
+    return len(rows)
+
+
+def due_digest_user_ids(now=None):
+    """Users whose oldest pending item has waited a full window (or who switched back to immediate)"""
+    now = now or datetime.utcnow()
+    oldest = func.min(DigestItem.created_at)
+    due = [
+        and_(User.email_frequency == frequency, oldest <= now - window)
+        for frequency, window in DIGEST_WINDOWS.items()
+    ]
+    due.append(User.email_frequency.notin_(list(DIGEST_WINDOWS)))
+    rows = db.session.query(DigestItem.user_id).join(
+        User, User.id == DigestItem.user_id
+    ).group_by(DigestItem.user_id, User.email_frequency).having(or_(*due)).all()
+    return [row.user_id for row in rows]
+
+
+def render_digest(user, items):
+    """One message for all of a user's pending items (a single pass per template)"""
+    frequency = user.email_frequency if wants_digest(user) else 'recent'
+    count = len(items)
+    return {
+        'recipient': user.email,
+        'sender': current_app.config['MAIL_DEFAULT_SENDER'],
+        'subject': f"Your {frequency} summary: {count} update{'s' if count != 1 else ''}",
+        'text_body': render_email_template('email/digest.txt', user=user, items=items, frequency=frequency),
+        'html_body': render_email_template('email/digest.html', user=user, items=items, frequency=frequency)
+    }
+
+
+def send_email_digests():
+    """
+    Scheduled task: queue one digest email per due user and drop the items it covers.
+
+    Returns:
+        tuple: (success, message)
+    """
+    user_ids = due_digest_user_ids()
+    sent = covered = 0
+    try:
+        for start in range(0, len(user_ids), USERS_PER_BATCH):
+            batch = user_ids[start:start + USERS_PER_BATCH]
+            users = {
+                row.id: row for row in db.session.query(
+                    User.id, User.username, User.email, User.email_frequency
+                ).filter(User.id.in_(batch))
+            }
+            items = {}
+            for item in DigestItem.query.filter(
+                DigestItem.user_id.in_(batch)
+            ).order_by(DigestItem.user_id, DigestItem.created_at, DigestItem.id):
+                items.setdefault(item.user_id, []).append(item)
+
+            messages = [render_digest(users[user_id], user_items) for user_id, user_items in items.items()]
+            item_ids = [item.id for user_items in items.values() for item in user_items]
+
+            # The delete commits together with the outbox rows (one chunk per batch)
+            db.session.query(DigestItem).filter(
+                DigestItem.id.in_(item_ids)
+            ).delete(synchronize_session=False)
+            sent += enqueue_emails(messages)
+            covered += len(item_ids)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error sending email digests: {str(e)}")
+        return False, f"Error sending email digests: {str(e)}"
+
+    if sent:
+        logger.info(f"Queued {sent} digest emails covering {covered} notifications")
+    return True, f"Queued {sent} digest emails covering {covered} notifications"
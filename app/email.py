@@ -1,26 +1,20 @@
-from flask import current_app, render_template
-from flask_mail import Message
-from threading import Thread
+from flask import current_app
+
+from app.mailer import enqueue_email, enqueue_emails, wake_mail_workers
+from app.models import db
+from app.digest import wants_digest, add_digest_items
+from app.email_templates import compile_email, placeholder
+
+# Stand-in for the recipient while a shared layout is rendered
+RECIPIENT = {'username': placeholder('username')}
 
-def send_async_email(app, msg):
-    """Send email asynchronously"""
-    with app.app_context():
-        try:
-            from flask_mail import Mail
-            mail = Mail(app)
-            mail.send(msg)
-        except Exception as e:
-            print(f"Error sending email: {str(e)}")
 
 def send_email(subject, sender, recipients, text_body, html_body):
-    """Send an email"""
-    app = current_app._get_current_object()
-    msg = Message(subject, sender=sender, recipients=recipients)
-    msg.body = text_body
-    msg.html = html_body
-    
-    # Send asynchronously to avoid blocking the request
-    Thread(target=send_async_email, args=(app, msg)).start()
+    """Queue an email in the outbox; the mail workers deliver it"""
+    for recipient in recipients:
+        enqueue_email(recipient, subject, text_body, html_body, sender=sender, commit=False)
+    db.session.commit()
+    wake_mail_workers()
 
 def send_exam_graded_email(student, exam_title, score):
     """
@@ -31,24 +25,64 @@ def send_exam_graded_email(student, exam_title, score):
         exam_title: Title of the exam
         score: Dictionary with score details
     """
+    if wants_digest(student):
+        add_digest_items([{
+            'user_id': student.id,
+            'category': 'exam_graded',
+            'summary': f"Exam '{exam_title}' has been graded",
+            'detail': f"Score: {score['earned']}/{score['total']} ({round(score['percentage'], 1)}%)"
+        }])
+        return
+    
+    # One layout per exam; each student's copy only fills in name and score
+    layout = compile_email(
+        'exam_graded',
+        cache_key=exam_title,
+        user=RECIPIENT,
+        exam_title=exam_title,
+        score={field: placeholder(field) for field in ('earned', 'total', 'percentage')}
+    )
+    text_body, html_body = layout.personalize(
+        username=student.username,
+        earned=score['earned'],
+        total=score['total'],
+        percentage=round(score['percentage'], 1)
+    )
     send_email(
         subject=f"Exam '{exam_title}' has been graded",
         sender=current_app.config['MAIL_DEFAULT_SENDER'],
         recipients=[student.email],
-        text_body=render_template(
-            'email/exam_graded.txt',
-            user=student,
-            exam_title=exam_title,
-            score=score
-        ),
-        html_body=render_template(
-            'email/exam_graded.html',
-            user=student,
-            exam_title=exam_title,
-            score=score
-        )
+        text_body=text_body,
+        html_body=html_body
+    )
+
+def new_exam_layout(exam):
+    """The shared new-exam bodies for an exam, rendered once and cached by its content"""
+    return compile_email(
+        'new_exam',
+        cache_key=(exam.id, exam.title, exam.description, exam.time_limit_minutes),
+        user=RECIPIENT,
+        exam=exam
     )
 
+def new_exam_email(student, exam, layout=None):
+    """
+    Build the outbox entry announcing a newly published exam
+    
+    Args:
+        student: User (or row with username and email) of the student
+        exam: Exam object
+        layout: The exam's new_exam_layout, when building many messages
+    """
+    text_body, html_body = (layout or new_exam_layout(exam)).personalize(username=student.username)
+    return {
+        'recipient': student.email,
+        'sender': current_app.config['MAIL_DEFAULT_SENDER'],
+        'subject': f"New Exam Available: {exam.title}",
+        'text_body': text_body,
+        'html_body': html_body
+    }
+
 def send_new_exam_email(student, exam):
     """
     Send email notification when a new exam is published
@@ -57,22 +91,34 @@ def send_new_exam_email(student, exam):
         student: User object of the student
         exam: Exam object
     """
+    message = new_exam_email(student, exam)
     send_email(
-        subject=f"New Exam Available: {exam.title}",
-        sender=current_app.config['MAIL_DEFAULT_SENDER'],
-        recipients=[student.email],
-        text_body=render_template(
-            'email/new_exam.txt',
-            user=student,
-            exam=exam
-        ),
-        html_body=render_template(
-            'email/new_exam.html',
-            user=student,
-            exam=exam
-        )
+        subject=message['subject'],
+        sender=message['sender'],
+        recipients=[message['recipient']],
+        text_body=message['text_body'],
+        html_body=message['html_body']
     )
 
+def queue_new_exam_emails(students, exam):
+    """
+    Queue new-exam emails for many students with bulk outbox inserts;
+    students who chose a digest get a digest item instead
+    """
+    digest = [student for student in students if wants_digest(student)]
+    if digest:
+        add_digest_items({
+            'user_id': student.id,
+            'category': 'new_exam',
+            'summary': f"New exam available: {exam.title}",
+            'detail': f"Time limit: {exam.time_limit_minutes} minutes",
+            'related_id': exam.id
+        } for student in digest)
+    layout = new_exam_layout(exam)
+    return enqueue_emails(
+        new_exam_email(student, exam, layout) for student in students if not wants_digest(student)
+    ) + len(digest)
+
 def send_exam_review_email(teacher, exam_title, student_name):
     """
     Send email notification when a student submits a review for an exam
@@ -82,20 +128,51 @@ def send_exam_review_email(teacher, exam_title, student_name):
         exam_title: Title of the exam
         student_name: Name of the student who submitted the review
     """
+    if wants_digest(teacher):
+        add_digest_items([{
+            'user_id': teacher.id,
+            'category': 'exam_review',
+            'summary': f"New review for '{exam_title}' from {student_name}"
+        }])
+        return
+    
+    layout = compile_email(
+        'exam_review',
+        cache_key=exam_title,
+        user=RECIPIENT,
+        exam_title=exam_title,
+        student_name=placeholder('student_name')
+    )
+    text_body, html_body = layout.personalize(username=teacher.username, student_name=student_name)
     send_email(
         subject=f"New Review for '{exam_title}'",
         sender=current_app.config['MAIL_DEFAULT_SENDER'],
         recipients=[teacher.email],
-        text_body=render_template(
-            'email/exam_review.txt',
-            user=teacher,
-            exam_title=exam_title,
-            student_name=student_name
-        ),
-        html_body=render_template(
-            'email/exam_review.html',
-            user=teacher,
-            exam_title=exam_title,
-            student_name=student_name
-        )
-    )
\ No newline at end of file
+        text_body=text_body,
+        html_body=html_body
+    )
+
+def queue_mass_email(recipient_group, subject, content):
+    """
+    Queue an admin announcement for every user in a recipient group
+    
+    Args:
+        recipient_group: 'all', 'teachers' or 'students'
+        subject: Message subject
+        content: Plain-text message
+    """
+    from app.models import User
+    
+    query = db.session.query(User.email)
+    if recipient_group == 'teachers':
+        query = query.filter(User.user_type == 'teacher')
+    elif recipient_group == 'students':
+        query = query.filter(User.user_type == 'student')
+    
+    # Only the addresses are loaded; the outbox rows are inserted in chunks
+    emails = [row.email for row in query.order_by(User.id).all()]
+    sender = current_app.config['MAIL_DEFAULT_SENDER']
+    return enqueue_emails(
+        {'recipient': email, 'sender': sender, 'subject': subject, 'text_body': content}
+        for email in emails
+    )
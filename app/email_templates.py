@@ -0,0 +1,100 @@
+"""
+Render-once email templates.
+A mass mailing renders its text and HTML templates a single time with placeholders where
+the recipient-specific values go. Each recipient's copy is then built by joining the
+pre-split template parts with their values, so large sends cost string joins rather than
+Jinja renders. Rendered layouts are kept in a small LRU cache keyed by the shared content.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from markupsafe import escape
+
+# Layouts kept between calls (one per template and shared content, e.g. per exam)
+LAYOUT_CACHE_SIZE = 128
+
+# Placeholders pass through autoescaping unchanged and cannot be typed into a form field
+_MARK = '\x1f'
+_PLACEHOLDER = re.compile(f"{_MARK}(\\w+){_MARK}")
+
+_layouts = OrderedDict()
+_layouts_lock = threading.Lock()
+
+
+def placeholder(field):
+    """Stand-in for a per-recipient value in the template context"""
+    return f"{_MARK}{field}{_MARK}"
+
+
+def render_email_template(template_name, **context):
+    """
+    Render an email template directly from the app's Jinja environment.
+    Unlike render_template this skips the request context processors, which email
+    bodies never use and which may query the database.
+    """
+    return current_app.jinja_env.get_template(template_name).render(context)
+
+
+class EmailLayout:
+    """Text and HTML bodies split around their placeholders, ready for substitution"""
+
+    def __init__(self, text_body, html_body):
+        # re.split with a group alternates literal text and field names
+        self.text_parts = _PLACEHOLDER.split(text_body)
+        self.html_parts = _PLACEHOLDER.split(html_body)
+
+    @staticmethod
+    def _fill(parts, values, quote):
+        filled = list(parts)
+        for index in range(1, len(filled), 2):
+            filled[index] = quote(values[filled[index]])
+        return ''.join(filled)
+
+    def personalize(self, **values):
+        """
+        Build one recipient's bodies.
+
+        Returns:
+            tuple: (text_body, html_body) with values inserted (HTML-escaped in the HTML body)
+        """
+        return self._fill(self.text_parts, values, str), self._fill(self.html_parts, values, escape)
+
+
+def compile_email(name, cache_key=None, **context):
+    """
+    Render email/<name>.txt and email/<name>.html once into an EmailLayout.
+
+    Args:
+        name: Template name without directory or extension
+        cache_key: Hashable description of the shared content; layouts with the same
+            name and key are reused (omit to render without caching)
+        **context: Template context, with placeholder() where recipient values go
+    """
+    key = (name, cache_key)
+    reuse = cache_key is not None and not current_app.jinja_env.auto_reload
+    if reuse:
+        with _layouts_lock:
+            layout = _layouts.get(key)
+            if layout is not None:
+                _layouts.move_to_end(key)
+                return layout
+
+    layout = EmailLayout(
+        render_email_template(f"email/{name}.txt", **context),
+        render_email_template(f"email/{name}.html", **context)
+    )
+
+    if reuse:
+        with _layouts_lock:
+            _layouts[key] = layout
+            while len(_layouts) > LAYOUT_CACHE_SIZE:
+                _layouts.popitem(last=False)
+    return layout
+
+
+def clear_layout_cache():
+    with _layouts_lock:
+        _layouts.clear()
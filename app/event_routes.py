@@ -0,0 +1,45 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+from flask_login import login_required, current_user
+
+from app.models import db
+from app.events import event_stream
+from app.broadcasts import start_relay
+from app.notifications import unread_total
+
+events_bp = Blueprint('events', __name__, url_prefix='/events')
+
+
+@events_bp.route('/stream')
+@login_required
+def stream():
+    """Server-sent events for the current user (notifications, grading, exam openings)"""
+    user_id = current_user.id
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    config = current_app.config
+
+    # The stream itself never queries; hand back the connection used to load the user
+    db.session.remove()
+    
+    # Broadcasts created by other processes reach this process's streams through its relay
+    start_relay(current_app._get_current_object())
+
+    response = Response(
+        event_stream(
+            user_id,
+            last_event_id,
+            heartbeat=config.get('SSE_HEARTBEAT_SECONDS', 15),
+            max_seconds=config.get('SSE_MAX_STREAM_SECONDS', 300),
+            buffer_size=config.get('SSE_BUFFER_SIZE', 100)
+        ),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+
+@events_bp.route('/state')
+@login_required
+def state():
+    """Current counters, fetched by clients after a resync event"""
+    return jsonify({'unread_notifications': unread_total(current_user)})
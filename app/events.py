@@ -0,0 +1,238 @@
+"""
+In-process publish/subscribe for server-sent events.
+Notification inserts, grading and exam publishing post small events here after their
+transaction commits; every open /events/stream connection of the target user receives
+them. Streams never touch the database, so idle connections hold no pooled connection.
+
+Events only reach streams served by the same process. Broadcasts are the exception: each
+web process relays the ones created elsewhere (see app.broadcasts). For other events a client
+connected to another worker sees the change on its next page load or reconnect (the stream
+is closed every SSE_MAX_STREAM_SECONDS so clients spread across workers over time).
+"""
+
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Recent events kept per user for Last-Event-ID replay
+HISTORY_SIZE = 50
+
+# Replay history of users without a stream is released after this long; closing streams
+# sweep for such users at most once per IDLE_SWEEP_SECONDS
+IDLE_SECONDS = 600
+IDLE_SWEEP_SECONDS = 300
+
+# Event ids are "<process epoch>-<sequence>" so ids from another process (or from
+# before a restart) are recognised and answered with a resync instead of a replay
+_EPOCH = uuid.uuid4().hex[:8]
+_sequence = itertools.count(1)
+
+
+class Subscription:
+    """One open stream: a bounded buffer of events waiting to be written"""
+
+    def __init__(self, user_id, buffer_size):
+        self.user_id = user_id
+        self.events = deque()
+        self.buffer_size = buffer_size
+        self.overflowed = False
+        self.condition = threading.Condition()
+
+    def put(self, event):
+        with self.condition:
+            if len(self.events) >= self.buffer_size:
+                # A client that cannot keep up is told to resync rather than growing the buffer
+                self.events.clear()
+                self.overflowed = True
+            else:
+                self.events.append(event)
+            self.condition.notify()
+
+    def get(self, timeout):
+        """
+        Wait up to timeout seconds for events.
+
+        Returns:
+            tuple: (events, overflowed)
+        """
+        with self.condition:
+            if not self.events and not self.overflowed:
+                self.condition.wait(timeout)
+            events = list(self.events)
+            overflowed = self.overflowed
+            self.events.clear()
+            self.overflowed = False
+        return events, overflowed
+
+
+class EventBroker:
+    """Fan events out to the subscriptions of each user"""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._history = {}
+        self._idle_since = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, buffer_size=100, last_event_id=None):
+        """
+        Open a subscription and collect the events a reconnecting client missed.
+        Both happen under one lock, so no event is lost or delivered twice in between.
+
+        Returns:
+            tuple: (Subscription, missed events or None when the client must resync)
+        """
+        subscription = Subscription(user_id, buffer_size)
+        with self._lock:
+            missed = self._replay(user_id, last_event_id)
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+            self._history.setdefault(user_id, deque(maxlen=HISTORY_SIZE))
+            self._idle_since.pop(user_id, None)
+        return subscription, missed
+
+    def unsubscribe(self, subscription):
+        now = time.monotonic()
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+                    self._idle_since[subscription.user_id] = now
+            sweep = now - self._last_sweep >= IDLE_SWEEP_SECONDS
+        if sweep:
+            self.forget_idle()
+
+    def publish(self, user_ids, event_type, data=None):
+        """
+        Post one event to every stream of the given users.
+
+        Users without a current or recent stream are skipped entirely, which keeps
+        fan-out to thousands of offline students cheap.
+
+        Returns:
+            int: Number of open streams the event was delivered to
+        """
+        targets = []
+        with self._lock:
+            for user_id in user_ids:
+                history = self._history.get(user_id)
+                if history is None:
+                    continue
+                event = {
+                    'id': f"{_EPOCH}-{next(_sequence)}",
+                    'type': event_type,
+                    'data': data or {}
+                }
+                history.append(event)
+                targets.extend((subscription, event) for subscription in self._subscriptions.get(user_id, ()))
+        for subscription, event in targets:
+            subscription.put(event)
+        return len(targets)
+
+    def _replay(self, user_id, last_event_id):
+        """Events after last_event_id still in the user's history (caller holds the lock)"""
+        if not last_event_id:
+            return []
+        epoch, _, sequence = last_event_id.partition('-')
+        if epoch != _EPOCH or not sequence.isdigit():
+            return None
+        history = self._history.get(user_id)
+        if history is None:
+            return None  # History was released while the user was away
+        last = int(sequence)
+        if len(history) == HISTORY_SIZE and _sequence_of(history[0]) > last:
+            return None  # Some missed events already dropped out of the history
+        return [event for event in history if _sequence_of(event) > last]
+
+    def resync_id(self):
+        """A fresh event id for resync events, newer than everything published so far"""
+        with self._lock:
+            return f"{_EPOCH}-{next(_sequence)}"
+
+    def forget_idle(self, idle_seconds=IDLE_SECONDS):
+        """Drop replay history of users whose last stream closed more than idle_seconds ago"""
+        cutoff = time.monotonic() - idle_seconds
+        with self._lock:
+            self._last_sweep = time.monotonic()
+            for user_id in [user_id for user_id, since in self._idle_since.items() if since < cutoff]:
+                self._history.pop(user_id, None)
+                del self._idle_since[user_id]
+
+    def active_user_ids(self):
+        """Users with at least one open stream in this process"""
+        with self._lock:
+            return set(self._subscriptions)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+def _sequence_of(event):
+    return int(event['id'].partition('-')[2])
+
+
+broker = EventBroker()
+
+
+def active_user_ids():
+    return broker.active_user_ids()
+
+
+def publish_event(user_ids, event_type, data=None):
+    """Post an event to users' open streams; never raises into the caller"""
+    try:
+        return broker.publish(list(user_ids), event_type, data)
+    except Exception as e:
+        logger.error(f"Could not publish {event_type} event: {str(e)}")
+        return 0
+
+
+def format_event(event):
+    """Serialize an event in the text/event-stream wire format"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def event_stream(user_id, last_event_id=None, heartbeat=15, max_seconds=300, buffer_size=100, retry_ms=3000):
+    """
+    Generator for one SSE connection.
+
+    Args:
+        user_id: The subscribed user
+        last_event_id: Last-Event-ID sent by a reconnecting client
+        heartbeat: Seconds between keep-alive comments on an idle stream
+        max_seconds: Close the stream after this long; the browser reconnects with Last-Event-ID
+        buffer_size: Events buffered for this connection before it is told to resync
+        retry_ms: Reconnection delay suggested to the browser
+    """
+    subscription, missed = broker.subscribe(user_id, buffer_size, last_event_id)
+    try:
+        yield f"retry: {retry_ms}\n\n"
+
+        if missed is None:
+            yield format_event({'id': broker.resync_id(), 'type': 'resync', 'data': {}})
+        else:
+            for event in missed:
+                yield format_event(event)
+
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            events, overflowed = subscription.get(heartbeat)
+            if overflowed:
+                yield format_event({'id': broker.resync_id(), 'type': 'resync', 'data': {}})
+            elif events:
+                for event in events:
+                    yield format_event(event)
+            else:
+                yield ": keep-alive\n\n"
+    finally:
+        broker.unsubscribe(subscription)
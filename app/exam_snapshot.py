@@ -0,0 +1,172 @@
+"""
+Cached exam snapshots and per-attempt question selection.
+An exam's questions and options are loaded once into an immutable snapshot; the
+questions drawn for an attempt and their order are regenerated from the seed stored
+on the attempt, so randomized exams need no per-attempt question rows.
+"""
+
+import random
+import secrets
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models import db, Question, QuestionOption
+
+# Seconds a snapshot is reused before it is reloaded (covers edits made by other processes)
+SNAPSHOT_TTL = 300
+
+QuestionView = namedtuple('QuestionView', 'id exam_id question_text question_type points order options')
+OptionView = namedtuple('OptionView', 'id question_id option_text is_correct order')
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_exam_snapshot(exam_id):
+    """
+    Questions of an exam in their authored order, with options attached.
+
+    Returns:
+        tuple: QuestionView tuples
+    """
+    now = time.monotonic()
+    with _snapshots_lock:
+        cached = _snapshots.get(exam_id)
+    if cached and now - cached[0] < SNAPSHOT_TTL:
+        return cached[1]
+
+    questions = db.session.query(
+        Question.id, Question.exam_id, Question.question_text,
+        Question.question_type, Question.points, Question.order
+    ).filter(Question.exam_id == exam_id).order_by(Question.order, Question.id).all()
+
+    options = {}
+    if questions:
+        rows = db.session.query(
+            QuestionOption.id, QuestionOption.question_id, QuestionOption.option_text,
+            QuestionOption.is_correct, QuestionOption.order
+        ).join(
+            Question, QuestionOption.question_id == Question.id
+        ).filter(
+            Question.exam_id == exam_id
+        ).order_by(QuestionOption.question_id, QuestionOption.order, QuestionOption.id)
+        for row in rows:
+            options.setdefault(row.question_id, []).append(OptionView(*row))
+
+    snapshot = tuple(
+        QuestionView(*question, options=tuple(options.get(question.id, ())))
+        for question in questions
+    )
+    with _snapshots_lock:
+        _snapshots[exam_id] = (now, snapshot)
+    return snapshot
+
+
+def invalidate_exam_snapshot(exam_id=None):
+    """Drop the cached snapshot of one exam, or of every exam"""
+    with _snapshots_lock:
+        if exam_id is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(exam_id, None)
+
+
+def mark_exam_changed(exam_id):
+    """Drop an exam's snapshot on commit after bulk statements that bypass the ORM events"""
+    db.session.info.setdefault('changed_exam_snapshots', set()).add(exam_id)
+
+
+def new_attempt_seed():
+    """Seed stored on an attempt; everything else about its question set is derived from it"""
+    return secrets.randbelow(2 ** 31)
+
+
+def select_questions(questions, seed, pool_size=None, shuffle=False):
+    """
+    Deterministically draw and order questions for one attempt.
+
+    Args:
+        questions: Snapshot from get_exam_snapshot
+        seed: The attempt's random seed (None means the authored order)
+        pool_size: Number of questions to draw, or None for all of them
+        shuffle: Shuffle question and option order
+
+    Returns:
+        list: QuestionView tuples for the attempt
+    """
+    if seed is None:
+        return list(questions)
+
+    rng = random.Random(seed)
+    selected = list(questions)
+    if pool_size and pool_size < len(selected):
+        selected = rng.sample(selected, pool_size)
+        if not shuffle:
+            selected.sort(key=lambda question: (question.order, question.id))
+    elif shuffle:
+        rng.shuffle(selected)
+
+    if shuffle:
+        shuffled = []
+        for question in selected:
+            options = list(question.options)
+            # Seeded per question so option order survives changes to other questions
+            random.Random(f"{seed}:{question.id}").shuffle(options)
+            shuffled.append(question._replace(options=tuple(options)))
+        selected = shuffled
+    return selected
+
+
+def attempt_questions(attempt, exam=None):
+    """Questions shown to an attempt, in the order that attempt sees them"""
+    exam = exam or attempt.exam
+    return select_questions(
+        get_exam_snapshot(exam.id),
+        attempt.random_seed,
+        exam.question_pool_size,
+        bool(exam.randomize_questions)
+    )
+
+
+def uses_random_draw(exam):
+    """Whether new attempts of this exam need a seed"""
+    return bool(exam.randomize_questions or exam.question_pool_size)
+
+
+def _record_change(mapper, connection, target):
+    """Remember which exam snapshots a flush touched so they are dropped on commit"""
+    session = object_session(target)
+    if session is None:
+        return
+    if isinstance(target, Question):
+        exam_id = target.exam_id
+    else:
+        question = target.__dict__.get('question')
+        exam_id = question.exam_id if question is not None else None  # Unknown exam: drop them all
+    session.info.setdefault('changed_exam_snapshots', set()).add(exam_id)
+
+
+for _model in (Question, QuestionOption):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _record_change)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    changed = session.info.pop('changed_exam_snapshots', None)
+    if not changed:
+        return
+    if None in changed:
+        invalidate_exam_snapshot()
+    else:
+        for exam_id in changed:
+            invalidate_exam_snapshot(exam_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('changed_exam_snapshots', None)
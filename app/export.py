@@ -0,0 +1,219 @@
+"""
+Export job handlers.
+Each handler streams its rows in chunks into the artifact file and reports progress,
+so large exports run in bounded memory on the job worker pool.
+"""
+
+import csv
+import json
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.orm import load_only
+
+from app.models import (
+    db, User, Exam, Question, ExamAttempt, Group, GroupMembership, ActivityLog
+)
+from app import teacher_stats
+from app.exam_snapshot import get_exam_snapshot
+from app.jobs import register_job
+from app.backup import run_backup
+
+# Number of rows fetched per chunk
+CHUNK_SIZE = 500
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def gradebook_students_query(teacher_id, group_id=None):
+    """Students shown in a teacher's gradebook (group members, or everyone who attempted an exam)"""
+    if group_id:
+        return db.session.query(User.id, User.username, User.email).join(
+            GroupMembership, GroupMembership.user_id == User.id
+        ).filter(GroupMembership.group_id == group_id)
+
+    return db.session.query(User.id, User.username, User.email).join(
+        ExamAttempt, User.id == ExamAttempt.student_id
+    ).join(
+        Exam, ExamAttempt.exam_id == Exam.id
+    ).filter(
+        Exam.creator_id == teacher_id,
+        User.user_type == 'student'
+    ).distinct()
+
+
+def export_gradebook(params, path, progress):
+    """Write a teacher's gradebook as CSV"""
+    teacher_id = params['teacher_id']
+    group_id = params.get('group_id')
+    exam_id = params.get('exam_id')
+
+    exams_query = db.session.query(Exam.id, Exam.title).filter(Exam.creator_id == teacher_id)
+    if exam_id:
+        exams_query = exams_query.filter(Exam.id == exam_id)
+    elif group_id:
+        exams_query = exams_query.filter(Exam.group_id == group_id)
+    exams = exams_query.order_by(Exam.id).all()
+    exam_ids = [e.id for e in exams]
+
+    students = gradebook_students_query(teacher_id, group_id).all()
+    progress(0, len(students))
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Student', 'Email'] + [exam.title for exam in exams] + ['Average'])
+
+        processed = 0
+        for chunk in _chunks(students):
+            attempts = {}
+            if exam_ids:
+                rows = db.session.query(
+                    ExamAttempt.student_id, ExamAttempt.exam_id,
+                    ExamAttempt.is_graded, ExamAttempt.score
+                ).filter(
+                    ExamAttempt.student_id.in_([s.id for s in chunk]),
+                    ExamAttempt.exam_id.in_(exam_ids)
+                ).all()
+                for row in rows:
+                    attempts[(row.student_id, row.exam_id)] = row
+
+            for student in chunk:
+                row = [student.username, student.email]
+                total_score = 0
+                score_count = 0
+                for exam in exams:
+                    attempt = attempts.get((student.id, exam.id))
+                    if attempt and attempt.is_graded and attempt.score is not None:
+                        row.append(f"{attempt.score:.1f}%")
+                        total_score += attempt.score
+                        score_count += 1
+                    else:
+                        row.append("Not Attempted" if not attempt else "Needs Grading")
+                row.append(f"{total_score / score_count:.1f}%" if score_count else "N/A")
+                writer.writerow(row)
+
+            processed += len(chunk)
+            progress(processed)
+
+    group_name = "All-Classes"
+    if group_id:
+        group = Group.query.get(group_id)
+        group_name = group.name if group else group_name
+    return f"gradebook-{group_name}-{datetime.now().strftime('%Y-%m-%d')}.csv"
+
+
+def export_exams(params, path, progress):
+    """Write a summary of a teacher's exams as CSV using grouped queries"""
+    teacher_id = params['teacher_id']
+
+    exams = Exam.query.filter_by(creator_id=teacher_id).order_by(Exam.id).all()
+    progress(0, len(exams))
+    exam_ids = [exam.id for exam in exams]
+
+    question_counts = {}
+    attempts = {}
+    earned = {}
+    if exam_ids:
+        question_counts = dict(db.session.query(
+            Question.exam_id, func.count(Question.id)
+        ).filter(Question.exam_id.in_(exam_ids)).group_by(Question.exam_id).all())
+        completed = ExamAttempt.query.options(
+            load_only(ExamAttempt.id, ExamAttempt.exam_id, ExamAttempt.random_seed, ExamAttempt.is_completed)
+        ).filter(
+            ExamAttempt.exam_id.in_(exam_ids),
+            ExamAttempt.is_completed == True
+        ).all()
+        for attempt in completed:
+            attempts.setdefault(attempt.exam_id, []).append(attempt)
+        # Scored like the teacher's exam view: pool-aware totals, ungraded MCQ answers graded
+        earned = teacher_stats.earned_points([attempt.id for attempt in completed])
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Exam ID', 'Title', 'Description', 'Time Limit', 'Status',
+                         'Created Date', 'Questions', 'Total Attempts', 'Avg Score'])
+
+        for index, exam in enumerate(exams, start=1):
+            question_count = question_counts.get(exam.id, 0)
+            exam_attempts = attempts.get(exam.id, [])
+            attempts_count = len(exam_attempts)
+
+            # Average of per-attempt percentages (pool attempts each have their own total)
+            if attempts_count > 0:
+                scores = teacher_stats.attempt_scores(exam, get_exam_snapshot(exam.id), exam_attempts, earned)
+                avg_score = f"{sum(float(score['percentage']) for score in scores.values()) / attempts_count:.1f}"
+            else:
+                avg_score = "N/A"
+
+            writer.writerow([
+                exam.id,
+                exam.title,
+                exam.description[:50] + '...' if exam.description and len(exam.description) > 50 else exam.description,
+                f"{exam.time_limit_minutes} minutes",
+                'Published' if exam.is_published else 'Draft',
+                exam.created_at.strftime('%Y-%m-%d') if exam.created_at else '',
+                question_count,
+                attempts_count,
+                avg_score
+            ])
+            progress(index)
+
+    return 'exam_data.csv'
+
+
+def export_activity_logs(params, path, progress):
+    """Dump activity logs matching the admin filters as CSV, in primary-key chunks"""
+    query = db.session.query(
+        ActivityLog.id, ActivityLog.created_at, User.username, ActivityLog.category,
+        ActivityLog.action, ActivityLog.details, ActivityLog.ip_address, ActivityLog.user_agent
+    ).join(User, ActivityLog.user_id == User.id)
+
+    if params.get('user_id'):
+        query = query.filter(ActivityLog.user_id == params['user_id'])
+    if params.get('category'):
+        query = query.filter(ActivityLog.category == params['category'])
+    if params.get('action'):
+        query = query.filter(ActivityLog.action == params['action'])
+    if params.get('start_date'):
+        query = query.filter(ActivityLog.created_at >= params['start_date'])
+    if params.get('end_date'):
+        query = query.filter(ActivityLog.created_at <= params['end_date'])
+
+    progress(0, query.order_by(None).count())
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['ID', 'Time', 'User', 'Category', 'Action', 'Details', 'IP Address', 'User Agent'])
+
+        processed = 0
+        last_id = 0
+        while True:
+            rows = query.filter(ActivityLog.id > last_id).order_by(ActivityLog.id).limit(CHUNK_SIZE).all()
+            if not rows:
+                break
+            for row in rows:
+                writer.writerow([
+                    row.id,
+                    row.created_at.isoformat() if row.created_at else '',
+                    row.username,
+                    row.category,
+                    row.action,
+                    json.dumps(row.details) if row.details is not None else '',
+                    row.ip_address or '',
+                    row.user_agent or ''
+                ])
+            last_id = rows[-1].id
+            processed += len(rows)
+            progress(processed)
+            db.session.expunge_all()
+
+    return f"activity-logs-{datetime.now().strftime('%Y-%m-%d')}.csv"
+
+
+register_job('gradebook', export_gradebook)
+register_job('exams', export_exams)
+register_job('activity_logs', export_activity_logs)
+register_job('backup', run_backup, mimetype='application/x-tar', extension='tar')
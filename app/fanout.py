@@ -0,0 +1,65 @@
+"""
+Background fan-out of notifications.
+Work that touches many users (such as announcing a newly published exam) is handed
+to a small worker pool so the request that triggered it returns immediately.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.models import db
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('FANOUT_WORKERS', 2),
+                thread_name_prefix='fanout'
+            )
+        return _executor
+
+
+def _run_task(app, func, args):
+    """Run a fan-out task inside its own application context"""
+    with app.app_context():
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"Fan-out task {func.__name__}{args} failed: {str(e)}")
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+        finally:
+            db.session.remove()
+
+
+def enqueue_fanout(func, *args):
+    """
+    Run ``func(*args)`` on the fan-out pool.
+
+    Returns:
+        Future: The submitted task
+    """
+    app = current_app._get_current_object()
+    return _get_executor(app).submit(_run_task, app, func, args)
+
+
+def shutdown_fanout(wait=False):
+    """Stop the worker pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
@@ -93,6 +93,9 @@ class ExamForm(FlaskForm):
         description='Enable digital scratch pad for notes')
     randomize_questions = BooleanField('Randomize Questions', default=True,
         description='Present questions in random order to each student')
+    question_pool_size = IntegerField('Questions per Attempt',
+        validators=[Optional(), NumberRange(min=1, message='Draw at least one question')],
+        description='Draw this many questions at random from the exam for each student (leave empty to use all)')
     one_question_at_time = BooleanField('One Question at a Time', default=False,
         description='Display questions one at a time')
     prevent_copy_paste = BooleanField('Prevent Copy/Paste', default=True,
@@ -208,7 +211,7 @@ class ExamForm(FlaskForm):
         if self.group_id.data:
             from app.models import Group
             group = Group.query.get(self.group_id.data)
-            if group and field.data > group.students.count() * 2:
+            if group and field.data > group.member_count * 2:
                 raise ValidationError('Maximum attempts seems unusually high for class size')
   
 
@@ -340,6 +343,14 @@ class PasswordUpdateForm(FlaskForm):
     ])
     submit = SubmitField('Update Password')
 
+class NotificationPreferencesForm(FlaskForm):
+    email_frequency = SelectField('Email Notifications', choices=[
+        ('immediate', 'Send each email right away'),
+        ('hourly', 'Hourly digest'),
+        ('daily', 'Daily digest')
+    ])
+    submit = SubmitField('Save Preferences')
+
 class CreateGroupForm(FlaskForm):
     """Form for creating a new group"""
     name = StringField('Class Name', validators=[
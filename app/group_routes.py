@@ -1,10 +1,12 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session
 from flask_login import login_required, current_user
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 from app.models import db, Group, GroupMembership, User, Exam
 from app.forms import CreateGroupForm, JoinGroupForm, TakeExamForm
 from app.decorators import teacher_required
 from app.notifications import notify_student_group_exams
+from app import membership as members
 
 group_bp = Blueprint('group', __name__, url_prefix='/groups')
 
@@ -18,7 +20,7 @@ def list_groups():
         return render_template('groups/teacher_groups.html', groups=groups)
     else:
         # Students see groups they're members of
-        groups = current_user.joined_groups.all()
+        groups = current_user.joined_groups.options(joinedload(Group.teacher)).all()
         return render_template('groups/student_groups.html', groups=groups)
 
 @group_bp.route('/create', methods=['GET', 'POST'])
@@ -61,7 +63,7 @@ def view_group(group_id):
     group = Group.query.get_or_404(group_id)
     
     # Check if user has access to the group
-    if not (current_user.id == group.teacher_id or current_user in group.students):
+    if not (current_user.id == group.teacher_id or members.is_member(current_user.id, group.id)):
         flash('You do not have access to this class.', 'warning')
         return redirect(url_for('group.list_groups'))
     
@@ -70,8 +72,8 @@ def view_group(group_id):
     upcoming_exams = group.get_upcoming_exams()
     past_exams = group.get_past_exams()
     
-    # Get members count
-    student_count = group.students.count()
+    # Get members count (cached on the group)
+    student_count = group.member_count
     
     return render_template(
         'groups/view_group.html',
@@ -99,7 +101,7 @@ def join_group():
             flash('Invalid group code.', 'danger')
             return redirect(url_for('group.join_group'))
         
-        if current_user in group.students:
+        if members.is_member(current_user.id, group.id):
             flash('You are already a member of this group.', 'info')
             return redirect(url_for('group.view_group', group_id=group.id))
         
@@ -121,7 +123,7 @@ def confirm_join(group_id):
     group = Group.query.get_or_404(group_id)
     
     # Already a member check
-    if current_user in group.students:
+    if members.is_member(current_user.id, group.id):
         flash('You are already a member of this group.', 'info')
         return redirect(url_for('group.view_group', group_id=group.id))
     
@@ -130,14 +132,8 @@ def confirm_join(group_id):
     
     if request.method == 'POST' and request.form.get('confirm') == 'true':
         try:
-            # Create explicit membership entry
-            membership = GroupMembership(user_id=current_user.id, group_id=group.id)
-            db.session.add(membership)
-            
-            # Also add to the relationship to ensure consistency
-            if current_user not in group.students:
-                group.students.append(current_user)
-                
+            # Create the membership entry and count it
+            members.add_member(current_user.id, group.id)
             db.session.commit()
             
             # Clean up session
@@ -166,12 +162,12 @@ def leave_group(group_id):
     
     group = Group.query.get_or_404(group_id)
     
-    if current_user not in group.students:
+    if not members.is_member(current_user.id, group.id):
         flash('You are not a member of this group.', 'warning')
         return redirect(url_for('group.list_groups'))
     
     try:
-        group.students.remove(current_user)
+        members.remove_member(current_user.id, group.id)
         db.session.commit()
         flash(f'Successfully left {group.name}.', 'success')
     except SQLAlchemyError as e:
@@ -188,20 +184,15 @@ def list_members(group_id):
     group = Group.query.get_or_404(group_id)
     
     # Check if user has access to the group
-    if not (current_user.id == group.teacher_id or current_user in group.students):
+    if not (current_user.id == group.teacher_id or members.is_member(current_user.id, group.id)):
         flash('You do not have access to this group.', 'warning')
         return redirect(url_for('group.list_groups'))
     
-    # Get students using both methods to ensure we show everyone
-    students_from_relationship = set(group.students)
-    
-    # Also get students from membership table directly
-    memberships = GroupMembership.query.filter_by(group_id=group.id).all()
-    student_ids = [m.user_id for m in memberships]
-    students_from_memberships = set(User.query.filter(User.id.in_(student_ids)).all())
-    
-    # Combine both sets to get all students
-    all_students = list(students_from_relationship.union(students_from_memberships))
+    # The relationship and the membership table are the same rows: one query
+    all_students = User.query.join(GroupMembership, GroupMembership.user_id == User.id)\
+        .filter(GroupMembership.group_id == group.id)\
+        .order_by(User.username)\
+        .all()
     
     return render_template(
         'groups/members.html',
@@ -224,16 +215,7 @@ def remove_member(group_id, user_id):
     
     user = User.query.get_or_404(user_id)
     try:
-        # Remove from relationship
-        if user in group.students:
-            group.students.remove(user)
-        
-        # Also remove from membership table directly
-        GroupMembership.query.filter_by(
-            user_id=user.id,
-            group_id=group.id
-        ).delete()
-        
+        members.remove_member(user.id, group.id)
         db.session.commit()
         flash(f'Successfully removed {user.username} from {group.name}.', 'success')
     except SQLAlchemyError as e:
@@ -332,6 +314,9 @@ def fix_memberships(group_id):
             if student:
                 group.students.append(student)
         
+        # Repair the cached member counter as well
+        members.recount_members(group.id)
+        
         # Commit changes
         db.session.commit()
         
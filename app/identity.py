@@ -0,0 +1,165 @@
+"""
+User identity cache for Flask-Login.
+The user_loader runs on every authenticated request, including autosaves and time polls.
+A process-local cache keeps each user's identity columns (id, name, email, role, ...) for
+USER_CACHE_TTL seconds and the loader rebuilds the User from it with
+session.merge(load=False), which issues no query. Columns that change often (the unread
+counters) are left unloaded and fetched in one query only when a page reads them.
+
+Updates and deletes of a User through the ORM drop its entry in this process; other
+processes pick the change up when their entry expires.
+
+Password and role changes bump User.auth_version, which the session and the remember
+cookie carry in the user id ("<id>:<auth_version>"). The loader refuses a session whose
+version does not match the user's, and each process re-reads the versions of the users
+it has cached every USER_CACHE_CHECK_INTERVAL seconds (one batched query), so a change
+made in another process logs the old sessions out within that interval.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from app import db, login_manager
+from app.models import User
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Columns served from the cache; the rest load on first access
+IDENTITY_COLUMNS = ('id', 'username', 'email', 'user_type', 'created_at', 'email_frequency', 'auth_version')
+REVALIDATE_CHUNK_SIZE = 500
+
+_cache = {}
+_cache_lock = threading.Lock()
+_revalidator_pid = None
+_revalidator_lock = threading.Lock()
+
+
+def forget_identity(user_id):
+    with _cache_lock:
+        _cache.pop(user_id, None)
+
+
+def clear_identity_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _cached_identity(user_id, ttl):
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+    if entry is not None and now - entry[0] < ttl:
+        return entry[1]
+    return None
+
+
+def _remember(user, ttl):
+    now = time.monotonic()
+    values = {column: getattr(user, column) for column in IDENTITY_COLUMNS}
+    with _cache_lock:
+        _cache[user.id] = (now, values)
+        if len(_cache) > 10000:
+            for user_id in [user_id for user_id, entry in _cache.items() if now - entry[0] >= ttl]:
+                del _cache[user_id]
+
+
+def revalidate_identities():
+    """
+    Drop the cached identities whose auth version changed or whose user is gone.
+
+    Returns:
+        int: Number of entries dropped
+    """
+    with _cache_lock:
+        cached = {user_id: entry[1]['auth_version'] for user_id, entry in _cache.items()}
+    stale = set(cached)
+    user_ids = list(cached)
+    for start in range(0, len(user_ids), REVALIDATE_CHUNK_SIZE):
+        rows = db.session.query(User.id, User.auth_version)\
+            .filter(User.id.in_(user_ids[start:start + REVALIDATE_CHUNK_SIZE]))
+        stale.difference_update(user_id for user_id, version in rows if cached[user_id] == version)
+    for user_id in stale:
+        forget_identity(user_id)
+    return len(stale)
+
+
+def _revalidate_forever(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                revalidate_identities()
+            except Exception as e:
+                logger.error(f"Identity cache revalidation failed: {str(e)}")
+            finally:
+                db.session.remove()
+
+
+def _start_revalidator(app):
+    """Start this process's revalidation thread on its first cached login (after any fork)"""
+    global _revalidator_pid
+    if _revalidator_pid == os.getpid():
+        return
+    with _revalidator_lock:
+        if _revalidator_pid != os.getpid():
+            interval = app.config.get('USER_CACHE_CHECK_INTERVAL', 5)
+            if interval > 0 and not app.testing:
+                threading.Thread(target=_revalidate_forever, args=(app, interval),
+                                 name='identity-revalidator', daemon=True).start()
+            _revalidator_pid = os.getpid()
+
+
+@login_manager.user_loader
+def load_user(session_id):
+    user_id, _, version = session_id.partition(':')
+    if not version:
+        return None  # Issued before auth versions existed: log in again
+    user_id, version = int(user_id), int(version)
+    ttl = current_app.config.get('USER_CACHE_TTL', 60)
+
+    values = None
+    if ttl > 0:
+        _start_revalidator(current_app._get_current_object())
+        values = _cached_identity(user_id, ttl)
+    if values is not None and values['auth_version'] > version:
+        return None  # The password or role changed after this session was issued
+    if values is None or values['auth_version'] != version:
+        user = User.query.get(user_id)
+        if user is None or user.auth_version != version:
+            return None
+        if ttl > 0:
+            _remember(user, ttl)
+        return user
+
+    snapshot = User(**values)
+    make_transient_to_detached(snapshot)
+    return db.session.merge(snapshot, load=False)
+
+
+@event.listens_for(User, 'before_update')
+def _role_changed(mapper, connection, target):
+    if inspect(target).attrs.user_type.history.has_changes():
+        target.auth_version = (target.auth_version or 0) + 1
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    forget_identity(target.id)
+    # Dropped again after commit, in case a concurrent request cached the old row meanwhile
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _forget_committed(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        forget_identity(user_id)
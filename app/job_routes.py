@@ -0,0 +1,63 @@
+import os
+
+from flask import Blueprint, render_template, jsonify, abort, send_file, flash, redirect, url_for
+from flask_login import login_required, current_user
+
+from app.models import ExportJob
+
+job_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+
+def _get_job_or_404(job_id):
+    """Load a job the current user is allowed to see"""
+    job = ExportJob.query.get_or_404(job_id)
+    if job.requested_by != current_user.id and not current_user.is_admin():
+        abort(403)
+    return job
+
+
+@job_bp.route('/')
+@login_required
+def list_jobs():
+    """Recent export jobs requested by the current user"""
+    jobs = ExportJob.query.filter_by(
+        requested_by=current_user.id
+    ).order_by(ExportJob.created_at.desc()).limit(20).all()
+    return render_template('jobs/list_jobs.html', jobs=jobs)
+
+
+@job_bp.route('/<int:job_id>')
+@login_required
+def view_job(job_id):
+    """Progress page that polls the job status endpoint"""
+    job = _get_job_or_404(job_id)
+    return render_template('jobs/view_job.html', job=job)
+
+
+@job_bp.route('/<int:job_id>/status')
+@login_required
+def job_status(job_id):
+    """Lightweight JSON status for progress polling"""
+    job = _get_job_or_404(job_id)
+    data = job.to_dict()
+    if job.status == 'completed':
+        data['download_url'] = url_for('jobs.download_job', job_id=job.id)
+    return jsonify(data)
+
+
+@job_bp.route('/<int:job_id>/download')
+@login_required
+def download_job(job_id):
+    """Download a finished artifact; supports HTTP Range requests for resumable downloads"""
+    job = _get_job_or_404(job_id)
+    if job.status != 'completed' or not job.artifact_path or not os.path.exists(job.artifact_path):
+        flash('This export is not available for download.', 'warning')
+        return redirect(url_for('jobs.view_job', job_id=job.id))
+
+    return send_file(
+        job.artifact_path,
+        mimetype=job.mimetype,
+        as_attachment=True,
+        download_name=job.artifact_name,
+        conditional=True
+    )
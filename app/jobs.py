@@ -0,0 +1,292 @@
+"""
+Background export jobs.
+Heavy exports are recorded in the jobs table, executed on a small worker pool
+and written to the artifacts directory so they no longer tie up web workers.
+
+Identical requests share one job: the unique jobs.active_hash key holds the request
+hash while a job is queued or running, so dedupe holds across web processes. A job
+is claimed with a conditional UPDATE before it runs, which lets every process resubmit
+queued jobs left behind by a restart (recover_jobs) without running any of them twice.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from app.models import db, ExportJob
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Registered job handlers (kind -> {'func': ..., 'mimetype': ..., 'extension': ...})
+handlers = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+_recovered_pid = None
+_recover_lock = threading.Lock()
+
+# Minimum number of seconds between two progress writes for the same job
+PROGRESS_INTERVAL = 1.0
+
+
+def register_job(kind, func, mimetype='text/csv', extension='csv'):
+    """
+    Register a handler for a kind of export job.
+
+    Args:
+        kind: Job kind stored on the jobs table
+        func: Callable ``func(params, path, progress)`` that writes the artifact
+              to ``path`` and reports progress via ``progress(processed, total)``.
+              It may return a download filename.
+        mimetype: Mimetype used when the artifact is downloaded
+        extension: File extension of the artifact
+    """
+    handlers[kind] = {
+        'func': func,
+        'mimetype': mimetype,
+        'extension': extension
+    }
+    return kind
+
+
+def params_hash(kind, params, user_id):
+    """Stable hash identifying identical export requests"""
+    payload = json.dumps([kind, user_id, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('EXPORT_WORKERS', 2),
+                thread_name_prefix='export-job'
+            )
+        return _executor
+
+
+def enqueue_job(kind, params, user_id):
+    """
+    Queue an export job, or return the matching job that is already in flight.
+
+    Args:
+        kind: A registered job kind
+        params: JSON-serializable job parameters
+        user_id: ID of the requesting user
+
+    Returns:
+        ExportJob: The queued (or deduplicated) job
+    """
+    if kind not in handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    app = current_app._get_current_object()
+    digest = params_hash(kind, params, user_id)
+
+    # The insert itself is the dedupe check: a second identical request hits uq_job_active_hash
+    for _ in range(2):
+        job = ExportJob(
+            kind=kind,
+            params=params,
+            params_hash=digest,
+            active_hash=digest,
+            requested_by=user_id,
+            status='queued',
+            mimetype=handlers[kind]['mimetype']
+        )
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        else:
+            _get_executor(app).submit(_run_job, app, job.id)
+            logger.info(f"Queued {kind} export job {job.id} for user {user_id}")
+            return job
+
+        existing = ExportJob.query.filter_by(active_hash=digest).first()
+        if existing is None:
+            continue  # It finished in between
+        if not _is_orphaned(app, existing):
+            logger.info(f"Deduplicated {kind} export for user {user_id} onto job {existing.id}")
+            return existing
+        _fail_job(existing.id, 'Interrupted: the worker running it stopped', expected_status=existing.status)
+
+    raise RuntimeError(f"Could not queue {kind} export for user {user_id}")
+
+
+def _is_orphaned(app, job):
+    """A queued job nobody picked up, or a running job that stopped reporting progress"""
+    now = datetime.utcnow()
+    if job.status == 'queued':
+        return job.created_at < now - timedelta(seconds=app.config.get('EXPORT_JOB_TIMEOUT', 3600))
+    last_seen = job.heartbeat_at or job.started_at or job.created_at
+    return last_seen < now - timedelta(seconds=app.config.get('EXPORT_JOB_HEARTBEAT_TIMEOUT', 300))
+
+
+def _update_job(job_id, expected_status=None, **values):
+    """
+    Write job state on its own connection so handlers can keep streaming.
+
+    Returns:
+        bool: False if the job was not in expected_status (another process claimed or finished it)
+    """
+    jobs = ExportJob.__table__
+    statement = jobs.update().where(jobs.c.id == job_id)
+    if expected_status is not None:
+        statement = statement.where(jobs.c.status == expected_status)
+    with db.engine.begin() as conn:
+        return conn.execute(statement.values(**values)).rowcount > 0
+
+
+def _fail_job(job_id, error, expected_status=None):
+    return _update_job(job_id, expected_status=expected_status, status='failed', error=error,
+                       active_hash=None, finished_at=datetime.utcnow())
+
+
+class JobProgress:
+    """Throttled progress reporter passed to job handlers"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.processed = 0
+        self.total = None
+        self._last_write = 0.0
+
+    def __call__(self, processed, total=None):
+        self.processed = processed
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if now - self._last_write >= PROGRESS_INTERVAL:
+            self._last_write = now
+            _update_job(self.job_id, processed=self.processed, total=self.total, heartbeat_at=datetime.utcnow())
+
+
+def artifact_path(app, job_id, extension):
+    """Location of a job's artifact inside the artifacts directory"""
+    directory = app.config['EXPORT_ARTIFACTS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"job_{job_id}.{extension}")
+
+
+def _run_job(app, job_id):
+    """Execute a job inside its own application context (runs on the worker pool)"""
+    with app.app_context():
+        job = ExportJob.query.get(job_id)
+        if job is None:
+            return
+        handler = handlers[job.kind]
+        kind, params = job.kind, job.params or {}
+        db.session.remove()
+
+        path = artifact_path(app, job_id, handler['extension'])
+        progress = JobProgress(job_id)
+        now = datetime.utcnow()
+        if not _update_job(job_id, expected_status='queued', status='running', started_at=now, heartbeat_at=now):
+            return  # Claimed by another process (or failed as orphaned)
+
+        try:
+            filename = handler['func'](params, path, progress)
+            _update_job(
+                job_id,
+                status='completed',
+                processed=progress.processed,
+                total=progress.total if progress.total is not None else progress.processed,
+                artifact_path=path,
+                artifact_name=filename or os.path.basename(path),
+                active_hash=None,
+                finished_at=datetime.utcnow()
+            )
+            logger.info(f"Export job {job_id} ({kind}) completed")
+        except Exception as e:
+            logger.error(f"Export job {job_id} ({kind}) failed: {str(e)}")
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+            if os.path.exists(path):
+                os.remove(path)
+            _fail_job(job_id, str(e)[:1000])
+        finally:
+            db.session.remove()
+
+
+def fail_stale_jobs(app):
+    """
+    Fail running jobs whose worker stopped sending progress (EXPORT_JOB_HEARTBEAT_TIMEOUT),
+    which frees their request hash so the export can be requested again.
+
+    Returns:
+        int: Number of jobs failed
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config.get('EXPORT_JOB_HEARTBEAT_TIMEOUT', 300))
+    jobs = ExportJob.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(
+            jobs.update()
+            .where(jobs.c.status == 'running')
+            .where(func.coalesce(jobs.c.heartbeat_at, jobs.c.started_at, jobs.c.created_at) < cutoff)
+            .values(status='failed', error='Interrupted: the worker running it stopped',
+                    active_hash=None, finished_at=datetime.utcnow())
+        ).rowcount
+
+
+def recover_jobs(app):
+    """
+    Pick up the jobs a restart or deploy left behind: stale running jobs are failed and
+    queued jobs are submitted to this process's pool (the claim in _run_job makes sure
+    only one process runs each of them).
+
+    Returns:
+        int: Number of queued jobs resubmitted
+    """
+    with app.app_context():
+        try:
+            failed = fail_stale_jobs(app)
+            queued = [job_id for (job_id,) in db.session.query(ExportJob.id).filter(ExportJob.status == 'queued')]
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not recover export jobs: {str(e)}")
+            return 0
+        finally:
+            db.session.remove()
+
+    if failed:
+        logger.info(f"Failed {failed} export jobs interrupted by a restart")
+    for job_id in queued:
+        _get_executor(app).submit(_run_job, app, job_id)
+    if queued:
+        logger.info(f"Resubmitted {len(queued)} queued export jobs")
+    return len(queued)
+
+
+def recover_jobs_once(app):
+    """recover_jobs() on the first request a process serves (worker pools are per process)"""
+    global _recovered_pid
+    if _recovered_pid == os.getpid():
+        return
+    with _recover_lock:
+        if _recovered_pid == os.getpid():
+            return
+        _recovered_pid = os.getpid()
+    recover_jobs(app)
+
+
+def shutdown_jobs(wait=False):
+    """Stop the worker pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
@@ -0,0 +1,334 @@
+"""
+Persistent email delivery.
+Messages are written to the email_outbox table and delivered by a small pool of
+worker threads. Each worker claims a batch, sends it over a single SMTP connection,
+retries failures with exponential backoff and dead-letters messages that keep failing.
+"""
+
+import logging
+import random
+import smtplib
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import func
+
+from app.models import db, EmailOutbox
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rows per bulk insert when many messages are queued at once
+INSERT_CHUNK_SIZE = 1000
+
+# A message left in 'sending' this long belongs to a worker that died
+STALE_LOCK_SECONDS = 600
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+_workers = []
+_workers_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+
+
+def _record(name, count=1):
+    with _metrics_lock:
+        _metrics[name] += count
+
+
+class RateLimiter:
+    """Token bucket shared by the workers of one process"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate or self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def enqueue_email(recipient, subject, text_body=None, html_body=None, sender=None, commit=True):
+    """
+    Add one message to the outbox.
+
+    Args:
+        recipient: Email address
+        subject: Message subject
+        text_body: Plain-text body
+        html_body: HTML body
+        sender: Sender address (defaults to MAIL_DEFAULT_SENDER at delivery time)
+        commit: Commit the session and wake the workers
+    """
+    item = EmailOutbox(
+        recipient=recipient,
+        sender=sender,
+        subject=subject,
+        text_body=text_body,
+        html_body=html_body,
+        status='pending',
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(item)
+    _record('queued')
+    if commit:
+        db.session.commit()
+        wake_mail_workers()
+    return item
+
+
+def enqueue_emails(messages):
+    """
+    Bulk insert many messages in chunks.
+
+    Args:
+        messages: Iterable of dicts with recipient, subject, text_body, html_body and optional sender
+
+    Returns:
+        int: Number of messages queued
+    """
+    now = datetime.utcnow()
+    queued = 0
+    chunk = []
+    for message in messages:
+        chunk.append({
+            'recipient': message['recipient'],
+            'sender': message.get('sender'),
+            'subject': message['subject'],
+            'text_body': message.get('text_body'),
+            'html_body': message.get('html_body'),
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now
+        })
+        if len(chunk) >= INSERT_CHUNK_SIZE:
+            db.session.execute(EmailOutbox.__table__.insert(), chunk)
+            db.session.commit()
+            queued += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(EmailOutbox.__table__.insert(), chunk)
+        db.session.commit()
+        queued += len(chunk)
+
+    if queued:
+        _record('queued', queued)
+        wake_mail_workers()
+    return queued
+
+
+def _backoff_seconds(attempts):
+    """Exponential backoff with jitter before the next delivery attempt"""
+    config = current_app.config
+    delay = config.get('MAIL_RETRY_BASE_SECONDS', 30) * (2 ** max(attempts - 1, 0))
+    delay = min(delay, config.get('MAIL_RETRY_MAX_SECONDS', 3600))
+    return delay * random.uniform(0.9, 1.1)
+
+
+def requeue_stale(now=None):
+    """Return messages held by workers that died back to the queue"""
+    now = now or datetime.utcnow()
+    count = db.session.query(EmailOutbox).filter(
+        EmailOutbox.status == 'sending',
+        EmailOutbox.locked_at < now - timedelta(seconds=STALE_LOCK_SECONDS)
+    ).update({'status': 'pending', 'locked_by': None, 'locked_at': None}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def claim_batch(worker_id, batch_size):
+    """
+    Claim due messages for one worker.
+    The conditional update makes claims safe across workers and processes.
+    """
+    now = datetime.utcnow()
+    ids = [row.id for row in db.session.query(EmailOutbox.id).filter(
+        EmailOutbox.status == 'pending',
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(batch_size)]
+    if not ids:
+        return []
+
+    db.session.query(EmailOutbox).filter(
+        EmailOutbox.id.in_(ids),
+        EmailOutbox.status == 'pending'
+    ).update({'status': 'sending', 'locked_by': worker_id, 'locked_at': now}, synchronize_session=False)
+    db.session.commit()
+
+    return EmailOutbox.query.filter_by(status='sending', locked_by=worker_id).order_by(EmailOutbox.id).all()
+
+
+def _mark_failed(item, error):
+    item.attempts = (item.attempts or 0) + 1
+    item.last_error = str(error)[:500]
+    item.locked_by = None
+    item.locked_at = None
+    if item.attempts >= current_app.config.get('MAIL_MAX_ATTEMPTS', 5):
+        item.status = 'dead'
+        _record('dead')
+        logger.error(f"Email {item.id} to {item.recipient} dead-lettered after {item.attempts} attempts: {item.last_error}")
+    else:
+        item.status = 'pending'
+        item.next_attempt_at = datetime.utcnow() + timedelta(seconds=_backoff_seconds(item.attempts))
+        _record('retried')
+
+
+def _to_message(item):
+    msg = Message(
+        item.subject,
+        sender=item.sender or current_app.config.get('MAIL_DEFAULT_SENDER'),
+        recipients=[item.recipient]
+    )
+    msg.body = item.text_body
+    msg.html = item.html_body
+    return msg
+
+
+def deliver_batch(items, limiter=None):
+    """
+    Send claimed messages over one SMTP connection.
+
+    Returns:
+        int: Number of messages sent
+    """
+    from app import mail
+
+    sent = 0
+    pending = list(items)
+    try:
+        with mail.connect() as connection:
+            while pending:
+                item = pending[0]
+                if limiter:
+                    limiter.acquire()
+                try:
+                    connection.send(_to_message(item))
+                except smtplib.SMTPServerDisconnected:
+                    raise
+                except Exception as e:
+                    _mark_failed(item, e)
+                else:
+                    item.status = 'sent'
+                    item.sent_at = datetime.utcnow()
+                    item.locked_by = None
+                    item.locked_at = None
+                    sent += 1
+                    _record('sent')
+                pending.pop(0)
+                db.session.commit()
+    except Exception as e:
+        # Connection-level failure: every message not yet handled is retried later
+        _record('connection_errors')
+        logger.warning(f"SMTP connection failed with {len(pending)} messages pending: {str(e)}")
+        for item in pending:
+            _mark_failed(item, e)
+        db.session.commit()
+    return sent
+
+
+def _worker(app, worker_id, limiter):
+    """Worker loop: claim a batch, deliver it, sleep until woken or the poll interval passes"""
+    with app.app_context():
+        batch_size = app.config.get('MAIL_BATCH_SIZE', 50)
+        poll_interval = app.config.get('MAIL_POLL_INTERVAL', 5)
+        last_requeue = 0.0
+        while not _stop.is_set():
+            items = []
+            try:
+                if time.monotonic() - last_requeue > 60:
+                    requeue_stale()
+                    last_requeue = time.monotonic()
+                items = claim_batch(worker_id, batch_size)
+                if items:
+                    deliver_batch(items, limiter)
+            except Exception as e:
+                logger.error(f"Mail worker {worker_id} error: {str(e)}")
+                try:
+                    db.session.rollback()
+                except Exception:
+                    pass
+            finally:
+                db.session.remove()
+            if not items:
+                _wake.wait(poll_interval)
+                _wake.clear()
+
+
+def start_mail_workers(app):
+    """Start the delivery workers for this process (idempotent)"""
+    with _workers_lock:
+        _workers[:] = [thread for thread in _workers if thread.is_alive()]
+        missing = app.config.get('MAIL_WORKERS', 2) - len(_workers)
+        if missing <= 0:
+            return
+        _stop.clear()
+        limiter = RateLimiter(app.config.get('MAIL_RATE_LIMIT', 10))
+        for _ in range(missing):
+            worker_id = f"mail-{uuid.uuid4().hex[:12]}"
+            thread = threading.Thread(target=_worker, args=(app, worker_id, limiter), name=worker_id, daemon=True)
+            thread.start()
+            _workers.append(thread)
+        logger.info(f"Started {missing} mail workers")
+
+
+def stop_mail_workers(timeout=None):
+    """Signal the workers to stop and wait for them"""
+    _stop.set()
+    _wake.set()
+    with _workers_lock:
+        for thread in _workers:
+            thread.join(timeout)
+        _workers.clear()
+
+
+def ensure_mail_workers():
+    """Scheduled task: keep the workers running so a backlog drains after a restart"""
+    start_mail_workers(current_app._get_current_object())
+
+
+def wake_mail_workers():
+    """Make sure workers are running and have them check the outbox now"""
+    start_mail_workers(current_app._get_current_object())
+    _wake.set()
+
+
+def mail_metrics():
+    """Delivery counters for this process plus the current state of the outbox"""
+    with _metrics_lock:
+        counters = dict(_metrics)
+
+    by_status = dict(db.session.query(
+        EmailOutbox.status, func.count(EmailOutbox.id)
+    ).group_by(EmailOutbox.status).all())
+    oldest_pending = db.session.query(func.min(EmailOutbox.created_at)).filter(
+        EmailOutbox.status == 'pending'
+    ).scalar()
+
+    return {
+        'process': counters,
+        'outbox': by_status,
+        'oldest_pending_seconds': (
+            int((datetime.utcnow() - oldest_pending).total_seconds()) if oldest_pending else 0
+        ),
+        'workers': sum(1 for thread in _workers if thread.is_alive())
+    }
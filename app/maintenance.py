@@ -4,7 +4,7 @@ Cleanup tasks for exam platform maintenance
 from datetime import datetime, timedelta
 from sqlalchemy import and_, or_, func
 from app import db
-from app.models import ExamAttempt, SecurityLog, Notification, Exam
+from app.models import ExamAttempt, SecurityLog, Notification, Exam, ExportJob, BroadcastNotification, BroadcastRead
 
 def cleanup_old_events(days_to_keep=30):
     """Clean up old security events and logs"""
@@ -40,6 +40,17 @@ def cleanup_old_events(days_to_keep=30):
             Notification.is_read == True
         )).delete()
         
+        # Delete old broadcasts (one row per announcement) and their read markers
+        old_broadcasts = db.session.query(BroadcastNotification.id).filter(
+            BroadcastNotification.created_at < cutoff_date
+        ).scalar_subquery()
+        BroadcastRead.query.filter(
+            BroadcastRead.broadcast_id.in_(old_broadcasts)
+        ).delete(synchronize_session=False)
+        BroadcastNotification.query.filter(
+            BroadcastNotification.created_at < cutoff_date
+        ).delete(synchronize_session=False)
+        
         db.session.commit()
         return True, "Cleanup completed successfully"
         
@@ -103,3 +114,34 @@ def vacuum_database():
     except Exception as e:
         db.session.rollback()
         return False, f"Error during database maintenance: {str(e)}"
+
+
+def cleanup_export_jobs(hours_to_keep=None):
+    """Delete finished export jobs and their artifacts once they expire (backups are kept)"""
+    import os
+    from flask import current_app
+    
+    from app.jobs import fail_stale_jobs
+    
+    try:
+        stale = fail_stale_jobs(current_app)
+        hours_to_keep = hours_to_keep or current_app.config.get('EXPORT_RETENTION_HOURS', 24)
+        cutoff_date = datetime.utcnow() - timedelta(hours=hours_to_keep)
+        
+        expired_jobs = ExportJob.query.filter(
+            ExportJob.kind != 'backup',
+            ExportJob.status.in_(['completed', 'failed']),
+            ExportJob.finished_at < cutoff_date
+        ).all()
+        
+        for job in expired_jobs:
+            if job.artifact_path and os.path.exists(job.artifact_path):
+                os.remove(job.artifact_path)
+            db.session.delete(job)
+            
+        db.session.commit()
+        return True, f"Removed {len(expired_jobs)} expired export jobs, failed {stale} stale ones"
+        
+    except Exception as e:
+        db.session.rollback()
+        return False, f"Error cleaning up export jobs: {str(e)}"
@@ -0,0 +1,124 @@
+"""
+Group membership service.
+Access checks used to evaluate `current_user in group.students`, which loads every
+member of the class to test one user. Here a check is one indexed EXISTS on
+group_membership(user_id, group_id), and a user's set of group ids is loaded at most
+once per request (kept on flask.g), so repeated checks in a request cost nothing.
+
+Member counts are cached on Group.member_count. Joins and removals go through
+add_member() / remove_member(), which adjust the counter in the same transaction;
+reconcile_member_counts() repairs any drift.
+"""
+
+import logging
+
+from flask import g, has_request_context
+from sqlalchemy import exists, func
+
+from app.models import db, Group, GroupMembership
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def _memo():
+    if not has_request_context():
+        return None
+    if not hasattr(g, '_group_memberships'):
+        g._group_memberships = {'groups': {}, 'checks': {}}
+    return g._group_memberships
+
+
+def _forget(user_id):
+    memo = _memo()
+    if memo is not None:
+        memo['groups'].pop(user_id, None)
+        memo['checks'] = {key: value for key, value in memo['checks'].items() if key[0] != user_id}
+
+
+def group_ids(user_id):
+    """The ids of the groups a user belongs to (one query per request)"""
+    memo = _memo()
+    if memo is not None and user_id in memo['groups']:
+        return memo['groups'][user_id]
+    ids = frozenset(group_id for (group_id,) in db.session.query(GroupMembership.group_id)
+                    .filter(GroupMembership.user_id == user_id))
+    if memo is not None:
+        memo['groups'][user_id] = ids
+    return ids
+
+
+def is_member(user_id, group_id):
+    """
+    Whether a user belongs to a group.
+    Answered from the memoized group set when this request already loaded it,
+    otherwise with one EXISTS on the (user_id, group_id) unique index.
+    """
+    memo = _memo()
+    if memo is not None:
+        if user_id in memo['groups']:
+            return group_id in memo['groups'][user_id]
+        if (user_id, group_id) in memo['checks']:
+            return memo['checks'][(user_id, group_id)]
+
+    found = db.session.query(exists().where(
+        GroupMembership.user_id == user_id,
+        GroupMembership.group_id == group_id
+    )).scalar()
+    if memo is not None:
+        memo['checks'][(user_id, group_id)] = found
+    return found
+
+
+def add_member(user_id, group_id):
+    """
+    Add a user to a group and count them (the caller commits).
+
+    Returns:
+        bool: False if the user was already a member
+    """
+    if is_member(user_id, group_id):
+        return False
+    db.session.add(GroupMembership(user_id=user_id, group_id=group_id))
+    db.session.query(Group).filter(Group.id == group_id).update(
+        {Group.member_count: Group.member_count + 1}, synchronize_session=False
+    )
+    _forget(user_id)
+    return True
+
+
+def remove_member(user_id, group_id):
+    """
+    Remove a user from a group and uncount them (the caller commits).
+
+    Returns:
+        bool: False if the user was not a member
+    """
+    removed = GroupMembership.query.filter_by(user_id=user_id, group_id=group_id).delete(synchronize_session=False)
+    if removed:
+        db.session.query(Group).filter(Group.id == group_id).update(
+            {Group.member_count: Group.member_count - removed}, synchronize_session=False
+        )
+    _forget(user_id)
+    return bool(removed)
+
+
+def recount_members(group_id):
+    """Recompute one group's member counter (the caller commits)"""
+    count = db.session.query(func.count(GroupMembership.id)).filter(GroupMembership.group_id == group_id).scalar()
+    db.session.query(Group).filter(Group.id == group_id).update(
+        {Group.member_count: count}, synchronize_session=False
+    )
+    return count
+
+
+def reconcile_member_counts():
+    """Recompute every group's member counter from group_membership (repairs drift)"""
+    members = db.session.query(func.count(GroupMembership.id)).filter(
+        GroupMembership.group_id == Group.id
+    ).scalar_subquery()
+    updated = db.session.query(Group).filter(
+        Group.member_count != members
+    ).update({Group.member_count: members}, synchronize_session=False)
+    db.session.commit()
+    return True, f"Reconciled member counters for {updated} groups"
@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
+from flask import current_app
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from app import db, login_manager
-from sqlalchemy import case
+from app import db
+from sqlalchemy import case, event, inspect
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -13,6 +14,10 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     user_type = db.Column(db.String(20), nullable=False)  # admin/teacher/student
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Personal only; maintained by app.notifications
+    broadcast_read_through = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Broadcasts up to this id are read
+    email_frequency = db.Column(db.String(10), nullable=False, default='immediate', server_default='immediate')  # immediate/hourly/daily
+    auth_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped by password and role changes; sessions carry it (see app.identity)
     
     # Relationships
     created_exams = db.relationship('Exam', foreign_keys='Exam.creator_id', 
@@ -29,8 +34,15 @@ class User(UserMixin, db.Model):
                                   back_populates='students', lazy='dynamic', overlaps="enrolled_groups")
     
     def set_password(self, password):
-        # Using PBKDF2-SHA256 as specified
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        # Using PBKDF2-SHA256 as specified (logins rehash older parameters, see app.passwords)
+        method = current_app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256') if current_app else 'pbkdf2:sha256'
+        self.password_hash = generate_password_hash(password, method=method)
+        # Sessions and remember cookies issued before the change stop loading
+        self.auth_version = (self.auth_version or 0) + 1
+    
+    def get_id(self):
+        # Flask-Login keeps this in the session and remember cookie: "<id>:<auth_version>"
+        return f"{self.id}:{self.auth_version or 1}"
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -66,11 +78,21 @@ class Exam(db.Model):
     allow_calculator = db.Column(db.Boolean, default=False)  
     allow_scratch_pad = db.Column(db.Boolean, default=True)
     randomize_questions = db.Column(db.Boolean, default=True)
+    question_pool_size = db.Column(db.Integer, nullable=True)  # Questions drawn per attempt; None uses all
     one_question_at_time = db.Column(db.Boolean, default=False)
     prevent_copy_paste = db.Column(db.Boolean, default=True)
     require_webcam = db.Column(db.Boolean, default=False)
     max_warnings = db.Column(db.Integer, default=3)  # Max number of warnings before auto-flagging
     
+    # Review aggregates; maintained from ExamReview writes so ratings never scan exam_reviews
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_1_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships with proper overlaps
     creator = db.relationship('User', back_populates='created_exams', foreign_keys=[creator_id], overlaps="exams_created")
     group = db.relationship('Group', back_populates='exams', foreign_keys=[group_id], overlaps="class_group")
@@ -78,14 +100,20 @@ class Exam(db.Model):
     attempts = db.relationship('ExamAttempt', backref='exam', lazy='dynamic', cascade='all, delete-orphan')
     reviews = db.relationship('ExamReview', backref='exam', lazy='dynamic')
     
+    __table_args__ = (
+        db.Index('ft_exams_title', 'title', mysql_prefix='FULLTEXT'),  # Search ranks title hits highest
+        db.Index('ft_exams_text', 'title', 'description', mysql_prefix='FULLTEXT'),
+    )
+    
     def get_average_rating(self):
-        """Calculate the average rating for this exam based on student reviews"""
-        reviews = self.reviews.all()
-        if not reviews:
+        """Average student rating, read from the stored aggregates"""
+        if not self.rating_count:
             return None
-        
-        total = sum(review.rating for review in reviews)
-        return round(total / len(reviews), 1)
+        return round(self.rating_sum / self.rating_count, 1)
+    
+    def get_rating_counts(self):
+        """Number of reviews per star, {5: n, 4: n, ..., 1: n}"""
+        return {stars: getattr(self, f'rating_{stars}_count') or 0 for stars in range(5, 0, -1)}
     
     def is_active(self):
         """Check if the exam is currently active (within the available time window)"""
@@ -125,6 +153,10 @@ class Question(db.Model):
     # Relationships
     options = db.relationship('QuestionOption', backref='question', lazy='dynamic', cascade='all, delete-orphan')
     answers = db.relationship('Answer', backref='question', lazy='dynamic')
+    
+    __table_args__ = (
+        db.Index('ft_questions_text', 'question_text', mysql_prefix='FULLTEXT'),
+    )
 
 
 class QuestionOption(db.Model):
@@ -182,6 +214,9 @@ class ExamAttempt(db.Model):
     last_sync_time = db.Column(db.DateTime, nullable=True)
     client_timestamp = db.Column(db.DateTime, nullable=True)  # Client-reported time
     
+    # Seed for the questions drawn and their order; None means the exam's authored order
+    random_seed = db.Column(db.Integer, nullable=True)
+    
     # Relationships
     answers = db.relationship('Answer', backref='attempt', lazy='dynamic', cascade='all, delete-orphan')
     
@@ -198,7 +233,12 @@ class ExamAttempt(db.Model):
         # Use a transaction to ensure consistent score calculation
         try:
             with db.session.begin_nested():
-                total_points = db.session.query(db.func.sum(Question.points)).filter(Question.exam_id == self.exam_id).scalar() or 0
+                if self.random_seed is not None and self.exam.question_pool_size:
+                    # Only the questions drawn for this attempt count towards the total
+                    from app.exam_snapshot import attempt_questions
+                    total_points = sum(question.points for question in attempt_questions(self))
+                else:
+                    total_points = db.session.query(db.func.sum(Question.points)).filter(Question.exam_id == self.exam_id).scalar() or 0
                 earned_points = 0
                 
                 # Get all answers in one query to avoid n+1 problem
@@ -351,9 +391,10 @@ class ExamReview(db.Model):
     __tablename__ = 'exam_reviews'
     
     id = db.Column(db.Integer, primary_key=True)
-    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), nullable=False)
+    # active_history: the rating aggregates need the old values even when the review was expired
+    exam_id = db.column_property(db.Column(db.Integer, db.ForeignKey('exams.id'), nullable=False), active_history=True)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
+    rating = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)  # 1-5 stars
     feedback = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -362,6 +403,46 @@ class ExamReview(db.Model):
     # student relationship is managed by the User class
 
 
+def _apply_rating_change(connection, exam_id, removed=None, added=None):
+    """Move one review's rating out of / into an exam's aggregates with a single UPDATE"""
+    deltas = {}
+    for stars, sign in ((removed, -1), (added, 1)):
+        if stars is None:
+            continue
+        stars = int(stars)
+        for name, delta in (('rating_count', sign), ('rating_sum', sign * stars), (f'rating_{stars}_count', sign)):
+            deltas[name] = deltas.get(name, 0) + delta
+    exams = Exam.__table__
+    values = {name: exams.c[name] + delta for name, delta in deltas.items() if delta and name in exams.c}
+    if values:
+        connection.execute(exams.update().where(exams.c.id == exam_id).values(values))
+
+
+@event.listens_for(ExamReview, 'after_insert')
+def _review_added(mapper, connection, target):
+    _apply_rating_change(connection, target.exam_id, added=target.rating)
+
+
+@event.listens_for(ExamReview, 'after_update')
+def _review_changed(mapper, connection, target):
+    rating = inspect(target).attrs.rating.history
+    exam_id = inspect(target).attrs.exam_id.history
+    if not rating.has_changes() and not exam_id.has_changes():
+        return
+    old_rating = rating.deleted[0] if rating.deleted else target.rating
+    old_exam_id = exam_id.deleted[0] if exam_id.deleted else target.exam_id
+    if old_exam_id == target.exam_id:
+        _apply_rating_change(connection, target.exam_id, removed=old_rating, added=target.rating)
+    else:
+        _apply_rating_change(connection, old_exam_id, removed=old_rating)
+        _apply_rating_change(connection, target.exam_id, added=target.rating)
+
+
+@event.listens_for(ExamReview, 'after_delete')
+def _review_deleted(mapper, connection, target):
+    _apply_rating_change(connection, target.exam_id, removed=target.rating)
+
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
     
@@ -374,6 +455,10 @@ class Notification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship is managed by User class
+    
+    __table_args__ = (
+        db.Index('idx_notifications_user_recent', 'user_id', 'id'),  # Dropdown and keyset-paginated history
+    )
 
 
 class SecurityLog(db.Model):
@@ -414,6 +499,7 @@ class Group(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     archived = db.Column(db.Boolean, default=False)  # For archiving old classes
+    member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Maintained by app.membership
     
     # Relationships with proper overlaps
     students = db.relationship('User', secondary='group_membership', 
@@ -472,11 +558,6 @@ class GroupMembership(db.Model):
     __table_args__ = (db.UniqueConstraint('user_id', 'group_id'),)
 
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
-
 class ActivityLog(db.Model):
     """Model for tracking all user activities"""
     __tablename__ = 'activity_logs'
@@ -510,3 +591,180 @@ class ActivityLog(db.Model):
         except Exception as e:
             db.session.rollback()
             print(f"Error logging activity: {str(e)}")
+
+
+class ExportJob(db.Model):
+    """Background export job whose output is written to the artifacts directory"""
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # gradebook, exams, activity_logs, backup
+    params = db.Column(db.JSON, nullable=True)
+    params_hash = db.Column(db.String(64), nullable=False)  # Used to deduplicate identical requests
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued/running/completed/failed
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    artifact_path = db.Column(db.String(255), nullable=True)
+    artifact_name = db.Column(db.String(255), nullable=True)
+    mimetype = db.Column(db.String(100), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Last progress write of a running job
+    # params_hash while the job is queued or running, NULL once it finishes; the unique key
+    # lets only one identical request be in flight across all web processes
+    active_hash = db.Column(db.String(64), nullable=True)
+
+    requester = db.relationship('User', backref=db.backref('export_jobs', lazy='dynamic'))
+
+    __table_args__ = (
+        db.UniqueConstraint('active_hash', name='uq_job_active_hash'),
+        db.Index('idx_job_dedupe', 'params_hash', 'status'),
+        db.Index('idx_job_requester', 'requested_by', 'created_at'),
+    )
+
+    @property
+    def progress(self):
+        """Percentage complete, or None while the total is still unknown"""
+        if self.status == 'completed':
+            return 100
+        if not self.total:
+            return None
+        return min(100, int(self.processed * 100 / self.total))
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'processed': self.processed,
+            'total': self.total,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class BackupRun(db.Model):
+    """Completed backup with the content digest of every primary-key block it read"""
+    __tablename__ = 'backup_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    mode = db.Column(db.String(20), nullable=False, default='full')  # full/incremental
+    base_run_id = db.Column(db.Integer, db.ForeignKey('backup_runs.id'), nullable=True)
+    block_digests = db.Column(db.JSON, nullable=True)  # table name -> {block number: sha256 of its rows}
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    artifact_path = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class EmailOutbox(db.Model):
+    """Outgoing email waiting for (or finished with) delivery by the mail workers"""
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    sender = db.Column(db.String(120), nullable=True)  # None uses MAIL_DEFAULT_SENDER
+    subject = db.Column(db.String(255), nullable=False)
+    text_body = db.Column(db.Text, nullable=True)
+    html_body = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending/sending/sent/dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64), nullable=True)  # Worker currently sending this message
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+
+class ReminderLedger(db.Model):
+    """Deadline reminders already sent, one row per exam, student and reminder offset"""
+    __tablename__ = 'reminder_ledger'
+
+    id = db.Column(db.Integer, primary_key=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    offset_minutes = db.Column(db.Integer, nullable=False)  # Minutes before available_until
+    sent_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('exam_id', 'user_id', 'offset_minutes', name='uq_reminder_ledger'),
+    )
+
+
+class BroadcastNotification(db.Model):
+    """
+    A notification stored once for a whole audience (a group's members or every user of a role).
+    Read state lives in User.broadcast_read_through (everything up to that id is read)
+    plus BroadcastRead rows for broadcasts read individually above it.
+    """
+    __tablename__ = 'broadcast_notifications'
+
+    id = db.Column(db.Integer, primary_key=True)
+    audience_type = db.Column(db.String(10), nullable=False)  # group/role
+    group_id = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), nullable=True)
+    role = db.Column(db.String(20), nullable=True)  # admin/teacher/student
+    message = db.Column(db.String(255), nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+    related_id = db.Column(db.Integer, nullable=True)
+    dedupe_key = db.Column(db.String(100), nullable=True, unique=True)  # e.g. exam_ending:<exam>:<offset>
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_broadcast_audience', 'audience_type', 'group_id', 'role', 'id'),
+    )
+
+
+class BroadcastRead(db.Model):
+    """A broadcast one user marked read individually (above their read watermark)"""
+    __tablename__ = 'broadcast_reads'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcast_notifications.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'broadcast_id', name='uq_broadcast_read'),
+    )
+
+
+class DigestItem(db.Model):
+    """An email-worthy event held back for a user's next digest email"""
+    __tablename__ = 'email_digest_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    category = db.Column(db.String(20), nullable=False)  # new_exam/exam_graded/exam_review
+    summary = db.Column(db.String(255), nullable=False)  # One line in the digest
+    detail = db.Column(db.String(500), nullable=True)
+    related_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_digest_user_created', 'user_id', 'created_at'),
+    )
+
+
+class ScheduledTaskState(db.Model):
+    """Last and next run of a scheduled task, so a new scheduler leader resumes instead of re-firing"""
+    __tablename__ = 'scheduled_task_state'
+
+    name = db.Column(db.String(64), primary_key=True)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    next_run_at = db.Column(db.DateTime, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)  # ok/failed
+    last_error = db.Column(db.String(500), nullable=True)
+    last_duration_ms = db.Column(db.Integer, nullable=True)
+    run_count = db.Column(db.Integer, nullable=False, default=0)
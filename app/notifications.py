@@ -1,12 +1,198 @@
-from app.models import db, Notification, User, ExamAttempt, Exam, ExamReview, Group
+from app.models import (
+    db, Notification, User, ExamAttempt, Exam, ExamReview, Group, GroupMembership,
+    BroadcastNotification, ReminderLedger
+)
+from sqlalchemy.exc import IntegrityError
 from flask_login import current_user
-from app.email import send_exam_graded_email, send_new_exam_email, send_exam_review_email
+from app.events import publish_event
+from app.broadcasts import (
+    create_broadcast, recent_broadcasts, broadcast_unread_count,
+    mark_broadcast_read, mark_all_broadcasts_read, publish_broadcast
+)
+from app.email import send_exam_graded_email, queue_new_exam_emails
 from datetime import datetime, timedelta
+from sqlalchemy import case, func
 import logging
+import threading
+import time
+from collections import namedtuple
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Notifications inserted per statement during fan-out
+FANOUT_CHUNK_SIZE = 1000
+
+# One entry of a user's notification feed; kind is 'personal' or 'broadcast'
+FeedItem = namedtuple('FeedItem', 'kind id message type related_id created_at is_read')
+
+# Notifications shown in the navbar dropdown, and how long a user's dropdown is reused
+DROPDOWN_SIZE = 5
+DROPDOWN_TTL = 30
+
+_dropdown_cache = {}
+_dropdown_lock = threading.Lock()
+
+
+def adjust_unread(user_ids, delta):
+    """
+    Move the unread counters of some users by delta in the caller's transaction
+    
+    Args:
+        user_ids (list): IDs of the users whose counters change
+        delta (int): Amount to add (negative to subtract; counters never go below zero)
+    """
+    if delta >= 0:
+        value = User.unread_notifications + delta
+    else:
+        value = case((User.unread_notifications > -delta, User.unread_notifications + delta), else_=0)
+    for start in range(0, len(user_ids), FANOUT_CHUNK_SIZE):
+        db.session.query(User).filter(
+            User.id.in_(user_ids[start:start + FANOUT_CHUNK_SIZE])
+        ).update({User.unread_notifications: value}, synchronize_session=False)
+
+
+def mark_notifications_read(user_id, notification_id=None):
+    """
+    Mark one personal notification (or all of a user's personal notifications) as read and update the counter
+    
+    Returns:
+        int: Number of notifications that changed from unread to read
+    """
+    query = Notification.query.filter_by(user_id=user_id, is_read=False)
+    if notification_id is not None:
+        query = query.filter_by(id=notification_id)
+    changed = query.update({'is_read': True}, synchronize_session=False)
+    
+    if notification_id is None:
+        db.session.query(User).filter(User.id == user_id).update(
+            {User.unread_notifications: 0}, synchronize_session=False
+        )
+    elif changed:
+        adjust_unread([user_id], -changed)
+    db.session.commit()
+    if changed and notification_id is not None:
+        # Other open tabs of the same user update their badge
+        publish_event([user_id], 'notifications_read', {'unread_delta': -changed})
+    return changed
+
+
+def mark_broadcast_notification_read(user, broadcast_id):
+    """Mark one broadcast read for a user"""
+    changed = mark_broadcast_read(user, broadcast_id)
+    if changed:
+        publish_event([user.id], 'notifications_read', {'unread_delta': -changed})
+    return changed
+
+
+def mark_all_notifications_read(user):
+    """Mark every personal notification and broadcast of a user as read"""
+    user_id = user.id
+    mark_notifications_read(user_id)
+    mark_all_broadcasts_read(user)
+    publish_event([user_id], 'notifications_read', {'unread': 0})
+
+
+def reconcile_unread_counts():
+    """Recompute every user's unread counter from the notifications table (repairs drift)"""
+    unread = db.session.query(func.count(Notification.id)).filter(
+        Notification.user_id == User.id,
+        Notification.is_read == False
+    ).scalar_subquery()
+    updated = db.session.query(User).filter(
+        User.unread_notifications != unread
+    ).update({User.unread_notifications: unread}, synchronize_session=False)
+    db.session.commit()
+    return True, f"Reconciled unread counters for {updated} users"
+
+
+def unread_total(user):
+    """Personal unread counter plus unread broadcasts (both cached; usually no query)"""
+    return user.unread_notifications + broadcast_unread_count(user)
+
+
+def _personal_items(user_id, before_id, limit):
+    query = db.session.query(
+        Notification.id, Notification.message, Notification.type,
+        Notification.related_id, Notification.created_at, Notification.is_read
+    ).filter(Notification.user_id == user_id)
+    if before_id:
+        query = query.filter(Notification.id < before_id)
+    return [FeedItem('personal', *row) for row in query.order_by(Notification.id.desc()).limit(limit)]
+
+
+def _broadcast_items(user, before_id, limit):
+    return [FeedItem('broadcast', *row) for row in recent_broadcasts(user, before_id, limit)]
+
+
+def _merge(personal, broadcasts):
+    """Newest first across both sources"""
+    return sorted(
+        personal + broadcasts,
+        key=lambda item: (item.created_at, item.kind == 'broadcast', item.id),
+        reverse=True
+    )
+
+
+def recent_notifications(user):
+    """
+    The newest personal and broadcast notifications of a user for the navbar dropdown.
+    Cached for DROPDOWN_TTL seconds; a changed unread count means new or newly
+    read notifications, so the cached entry is only reused while the count matches.
+    """
+    now = time.monotonic()
+    unread_count = unread_total(user)
+    with _dropdown_lock:
+        cached = _dropdown_cache.get(user.id)
+    if cached and cached[1] == unread_count and now - cached[0] < DROPDOWN_TTL:
+        return cached[2]
+    
+    items = _merge(
+        _personal_items(user.id, None, DROPDOWN_SIZE),
+        _broadcast_items(user, None, DROPDOWN_SIZE)
+    )[:DROPDOWN_SIZE]
+    
+    with _dropdown_lock:
+        _dropdown_cache[user.id] = (now, unread_count, items)
+        # Forget users who have not opened the dropdown recently
+        if len(_dropdown_cache) > 10000:
+            for key in [key for key, value in _dropdown_cache.items() if now - value[0] >= DROPDOWN_TTL]:
+                del _dropdown_cache[key]
+    return items
+
+
+def _parse_cursor(cursor):
+    """'<personal id>-<broadcast id>' (0 = from the newest) -> (personal id, broadcast id)"""
+    try:
+        personal, broadcast = (int(part) for part in (cursor or '').split('-', 1))
+        return personal or None, broadcast or None
+    except ValueError:
+        return None, None
+
+
+def notification_history(user, before=None, per_page=20):
+    """
+    One page of a user's personal and broadcast notifications, newest first.
+    Each source is read with keyset pagination on its own id; the cursor carries both.
+    
+    Returns:
+        tuple: (FeedItem list, cursor to pass as before for the next page or None)
+    """
+    personal_before, broadcast_before = _parse_cursor(before)
+    personal = _personal_items(user.id, personal_before, per_page + 1)
+    broadcasts = _broadcast_items(user, broadcast_before, per_page + 1)
+    merged = _merge(personal, broadcasts)
+    
+    page = merged[:per_page]
+    if len(merged) <= per_page:
+        return page, None
+    
+    personal_ids = [item.id for item in page if item.kind == 'personal']
+    broadcast_ids = [item.id for item in page if item.kind == 'broadcast']
+    next_cursor = f"{min(personal_ids) if personal_ids else personal_before or 0}-" \
+                  f"{min(broadcast_ids) if broadcast_ids else broadcast_before or 0}"
+    return page, next_cursor
+
 def send_notification(user_id, message, notification_type, related_id=None):
     """
     Send a notification to a specific user
@@ -24,7 +210,11 @@ def send_notification(user_id, message, notification_type, related_id=None):
         related_id=related_id
     )
     db.session.add(notification)
+    adjust_unread([user_id], 1)
     db.session.commit()
+    publish_event([user_id], 'notification', {
+        'message': message, 'type': notification_type, 'related_id': related_id, 'unread_delta': 1
+    })
 
 
 def notify_exam_graded(attempt_id):
@@ -50,31 +240,89 @@ def notify_exam_graded(attempt_id):
         # Send email notification
         score = attempt.calculate_score()
         send_exam_graded_email(student, exam.title, score)
+        
+        # Push the result to the student's open pages
+        publish_event([attempt.student_id], 'exam_graded', {
+            'attempt_id': attempt_id, 'exam_id': exam.id, 'title': exam.title
+        })
+
+
+def bulk_send_notifications(user_ids, message, notification_type, related_id=None):
+    """
+    Insert the same notification for many users with chunked bulk inserts
+    
+    Args:
+        user_ids (list): IDs of the users to notify
+        message (str): The notification message
+        notification_type (str): Type of notification
+        related_id (int, optional): ID of the related entity
+    
+    Returns:
+        int: Number of notifications created
+    """
+    now = datetime.utcnow()
+    for start in range(0, len(user_ids), FANOUT_CHUNK_SIZE):
+        db.session.execute(Notification.__table__.insert(), [
+            {
+                'user_id': user_id,
+                'message': message,
+                'type': notification_type,
+                'related_id': related_id,
+                'is_read': False,
+                'created_at': now
+            }
+            for user_id in user_ids[start:start + FANOUT_CHUNK_SIZE]
+        ])
+        adjust_unread(user_ids[start:start + FANOUT_CHUNK_SIZE], 1)
+        db.session.commit()
+        publish_event(user_ids[start:start + FANOUT_CHUNK_SIZE], 'notification', {
+            'message': message, 'type': notification_type, 'related_id': related_id, 'unread_delta': 1
+        })
+    return len(user_ids)
+
+
+def exam_recipients(exam):
+    """Students an exam is published to: the members of its group (all students for ungrouped exams)"""
+    query = db.session.query(User.id, User.username, User.email, User.email_frequency).filter(User.user_type == 'student')
+    if exam.group_id:
+        query = query.join(
+            GroupMembership, GroupMembership.user_id == User.id
+        ).filter(GroupMembership.group_id == exam.group_id)
+    return query.all()
 
 
 def notify_new_exam(exam_id):
     """
-    Notify all students about a new exam
+    Notify the students of an exam's group about the newly published exam.
+    Runs on the fan-out pool; use queue_new_exam_notifications from requests.
     
     Args:
         exam_id (int): The ID of the newly published exam
     """
     exam = Exam.query.get(exam_id)
     if exam and exam.is_published:
-        # Get all student users
-        students = User.query.filter_by(user_type='student').all()
+        message = f"New exam available: '{exam.title}'"
         
-        for student in students:
-            # Send in-app notification
-            send_notification(
-                user_id=student.id,
-                message=f"New exam available: '{exam.title}'",
-                notification_type='new_exam',
-                related_id=exam_id
-            )
-            
-            # Send email notification
-            send_new_exam_email(student, exam)
+        # One in-app broadcast for the whole audience
+        broadcast = create_broadcast(message, 'new_exam', related_id=exam_id, **_audience(exam))
+        online = publish_broadcast(broadcast)
+        # Open dashboards list the exam without a reload
+        publish_event(online, 'exam_published', {'exam_id': exam.id, 'title': exam.title})
+        
+        recipients = exam_recipients(exam)
+        
+        # Hand the emails to the outbox
+        queue_new_exam_emails(recipients, exam)
+        
+        logger.info(f"Notified {len(recipients)} students about exam {exam_id}")
+        return len(recipients)
+    return 0
+
+
+def queue_new_exam_notifications(exam_id):
+    """Fan out new-exam notifications in the background"""
+    from app.fanout import enqueue_fanout
+    return enqueue_fanout(notify_new_exam, exam_id)
 
 
 def notify_new_review(review_id, exam_id):
@@ -141,94 +389,135 @@ def notify_student_group_exams(student_id, group_id):
                 related_id=exam.id
             )
 
+def _reminder_offset(minutes_left, offsets):
+    """The tightest reminder offset an exam closing in minutes_left falls inside, or None"""
+    due = [offset for offset in offsets if minutes_left <= offset]
+    return min(due) if due else None
+
+
+def _format_time_left(minutes_left):
+    if minutes_left >= 60:
+        hours = int(round(minutes_left / 60))
+        return f"{hours} hour{'s' if hours != 1 else ''}"
+    minutes = max(int(minutes_left), 1)
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+
+def _audience(exam):
+    """Broadcast audience of an exam: its group, or every student for ungrouped exams"""
+    if exam.group_id:
+        return {'group_id': exam.group_id}
+    return {'role': 'student'}
+
+
+def pending_reminder_ids(exam, offset_minutes):
+    """
+    Students to remind about one exam at one offset, as a single anti-join:
+    the exam's recipients minus students with a completed attempt minus students
+    already reminded at this offset.
+    """
+    completed = db.session.query(ExamAttempt.id).filter(
+        ExamAttempt.exam_id == exam.id,
+        ExamAttempt.student_id == User.id,
+        ExamAttempt.is_completed == True
+    )
+    reminded = db.session.query(ReminderLedger.id).filter(
+        ReminderLedger.exam_id == exam.id,
+        ReminderLedger.user_id == User.id,
+        ReminderLedger.offset_minutes == offset_minutes
+    )
+    query = db.session.query(User.id).filter(
+        User.user_type == 'student',
+        ~completed.exists(),
+        ~reminded.exists()
+    )
+    if exam.group_id:
+        query = query.join(
+            GroupMembership, GroupMembership.user_id == User.id
+        ).filter(GroupMembership.group_id == exam.group_id)
+    return [row.id for row in query]
+
+
+def send_deadline_reminders(exam, offset_minutes, now):
+    """
+    Post one deadline reminder for an exam at one offset: the message is stored once as a
+    broadcast, and the students it reached are recorded in the reminder ledger in the same
+    transaction. The ledger's unique key and the broadcast's dedupe key make the reminder
+    idempotent across runs and processes; students who complete the exam afterwards stop
+    seeing it (filtered at read time).
+    
+    Returns:
+        int: Number of students reminded (0 if the reminder had already been sent)
+    """
+    dedupe_key = f"exam_ending:{exam.id}:{offset_minutes}"
+    if db.session.query(BroadcastNotification.id).filter_by(dedupe_key=dedupe_key).first():
+        return 0
+    user_ids = pending_reminder_ids(exam, offset_minutes)
+    if not user_ids:
+        return 0
+    
+    minutes_left = (exam.available_until - now).total_seconds() / 60
+    message = f"Exam '{exam.title}' ends in {_format_time_left(minutes_left)}"
+    
+    try:
+        for start in range(0, len(user_ids), FANOUT_CHUNK_SIZE):
+            db.session.execute(ReminderLedger.__table__.insert(), [
+                {'exam_id': exam.id, 'user_id': user_id, 'offset_minutes': offset_minutes, 'sent_at': now}
+                for user_id in user_ids[start:start + FANOUT_CHUNK_SIZE]
+            ])
+    except IntegrityError:
+        # Another run is recording the same reminder
+        db.session.rollback()
+        return 0
+    
+    # Commits the ledger rows together with the broadcast, or rolls both back if another run posted it first
+    broadcast = create_broadcast(message, 'exam_ending', related_id=exam.id, dedupe_key=dedupe_key, **_audience(exam))
+    if broadcast is None:
+        return 0
+    
+    # Reminders are posted by the scheduler worker, which has no streams: the relay of each
+    # web process pushes them to its own
+    publish_broadcast(broadcast)
+    return len(user_ids)
+
+
 def notify_exam_deadline_approaching():
     """
-    Send notifications to students for upcoming exam deadlines
-    Should be triggered by a scheduled task
+    Send deadline reminders for exams closing within the configured offsets.
+    Should be triggered by a scheduled task; safe to run as often as needed,
+    since the reminder ledger and the broadcast's dedupe key make every reminder idempotent.
+    
+    Returns:
+        int: Number of reminders sent
     """
-    logger.info("Running exam deadline notification check")
+    from flask import current_app
+    
+    offsets = sorted(current_app.config.get('REMINDER_OFFSETS') or [1440])
+    now = datetime.utcnow()
+    
     try:
-        # Get a fresh session
-        from flask import current_app
+        upcoming_deadlines = Exam.query.filter(
+            Exam.is_published == True,
+            Exam.available_until.isnot(None),
+            Exam.available_until > now,
+            Exam.available_until <= now + timedelta(minutes=offsets[-1])
+        ).all()
         
-        # Check if database is properly initialized and connected
-        try:
-            if db.session is None or db.engine is None:
-                logger.error("Database session or engine not initialized for background task")
-                return 0
-                
-            # Test connection by executing a simple query that should always work
-            db.session.execute("SELECT 1").fetchone()
-            logger.info("Database connection verified for notification task")
-        except Exception as e:
-            logger.error(f"Error in exam deadline notifications: {str(e)}")
-            return 0
-            
-        # Reset the session to ensure we have a clean slate
-        try:
-            db.session.remove()
-        except:
-            logger.warning("Could not remove existing session")
-            
-        now = datetime.utcnow()
-        soon = now + timedelta(hours=24)  # 24 hours from now
+        notification_count = 0
+        for exam in upcoming_deadlines:
+            # Only the tightest offset is due: an exam first seen 30 minutes before it
+            # closes gets the 1 hour reminder, not a burst of every larger one
+            offset = _reminder_offset((exam.available_until - now).total_seconds() / 60, offsets)
+            if offset is not None:
+                notification_count += send_deadline_reminders(exam, offset, now)
         
-        try:
-            # Find exams ending within the next 24 hours
-            upcoming_deadlines = Exam.query.filter(
-                Exam.is_published == True,
-                Exam.available_until.isnot(None),
-                Exam.available_until > now,
-                Exam.available_until <= soon            ).all()
-            
-            logger.info(f"Found {len(upcoming_deadlines)} exams with upcoming deadlines")
-            notification_count = 0
-            
-            for exam in upcoming_deadlines:
-                # Get all students who should be notified
-                if exam.group_id:
-                    # For class exams, notify students in the group
-                    group = Group.query.get(exam.group_id)
-                    if group:
-                        students = group.students.all()
-                    else:
-                        students = []
-                else:
-                    # For public exams, notify all students
-                    students = User.query.filter_by(user_type='student').all()
-                
-                # Check which students haven't completed this exam yet
-                for student in students:
-                    attempt = ExamAttempt.query.filter_by(
-                        exam_id=exam.id,
-                        student_id=student.id,
-                        is_completed=True
-                        ).first()
-                    
-                    # Only notify students who haven't completed the exam
-                    if not attempt:
-                        hours_remaining = int((exam.available_until - now).total_seconds() / 3600)
-                        message = f"Exam '{exam.title}' ends in {hours_remaining} hours"
-                        
-                        send_notification(
-                            user_id=student.id,
-                            message=message,
-                            notification_type='exam_ending',
-                            related_id=exam.id
-                        )
-                        notification_count += 1
-            
-            logger.info(f"Sent {notification_count} exam deadline notifications")
-            return notification_count
-            
-        except Exception as e:
-            try:
-                db.session.rollback()  # Roll back any failed transactions
-            except:
-                pass
-            logger.error(f"Database error in exam deadline notifications: {str(e)}")
-            return 0
-            
+        logger.info(f"Sent {notification_count} exam deadline reminders for {len(upcoming_deadlines)} exams")
+        return notification_count
+    
     except Exception as e:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
         logger.error(f"Error in exam deadline notifications: {str(e)}")
         return 0
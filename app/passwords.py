@@ -0,0 +1,245 @@
+"""
+Off-thread password verification.
+PBKDF2 checks run on a small process pool so a burst of logins (a whole class signing in
+when an exam opens) cannot pin the web threads that serve exams in progress. Requests are
+admitted into a bounded queue and dispatched round-robin per client IP, so one address
+cannot hold every slot; a request that cannot be admitted, or waits too long, is told the
+server is busy instead of being queued indefinitely.
+
+A successful check also reports whether the stored hash uses outdated parameters and, if
+so, returns a fresh hash computed in the same pool call.
+
+Each process starts its own pool on its first login (so a preforking server never forks a
+running pool), and the pool processes come from a forkserver (spawn where that is
+unavailable): forking the threaded web process could copy locks that other threads hold at
+that moment into the pool workers.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from app.models import db
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def _normalize_method(method):
+    """pbkdf2 methods with the iteration count spelled out, as stored in the hash"""
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2' and len(parts) == 2:
+        return f"{method}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+def verify_and_upgrade(pwhash, password, method):
+    """
+    Check a password and rehash it when the stored parameters are not the current ones.
+    Runs in a pool process, so it only takes plain values.
+
+    Returns:
+        tuple: (matches, new hash or None)
+    """
+    if not check_password_hash(pwhash, password):
+        return False, None
+    if pwhash.split('$', 1)[0] != _normalize_method(method):
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+def _pool_context():
+    """forkserver where the platform has it, otherwise spawn; never fork"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class _Check:
+    def __init__(self, args):
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class VerificationQueue:
+    """Bounded admission queue in front of the process pool, fair across client IPs"""
+
+    def __init__(self, workers, max_pending, max_per_ip):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_ip = max_per_ip
+        self.queues = OrderedDict()  # ip -> waiting checks, in round-robin order
+        self.pending = 0  # Waiting plus running
+        self.running = 0
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+
+    def start(self):
+        """Create the pool and launch a worker now, so the check that follows does not wait for it"""
+        with self.lock:
+            if self.executor is None:
+                self.executor = self._new_executor()
+            executor = self.executor
+        executor.submit(int)
+
+    def submit(self, ip, args):
+        """Admit one check, or return None when the queue (or this IP's share) is full"""
+        with self.lock:
+            waiting = self.queues.get(ip)
+            if self.pending >= self.max_pending or (waiting and len(waiting) >= self.max_per_ip):
+                return None
+            check = _Check(args)
+            self.queues.setdefault(ip, deque()).append(check)
+            self.pending += 1
+            started = self._dispatch()
+        self._watch(started)
+        return check
+
+    def cancel(self, ip, check):
+        """Drop a check that is still waiting (its caller gave up)"""
+        with self.lock:
+            waiting = self.queues.get(ip)
+            if waiting and check in waiting:
+                waiting.remove(check)
+                if not waiting:
+                    del self.queues[ip]
+                self.pending -= 1
+
+    def _dispatch(self):
+        """
+        Start waiting checks while pool processes are free (caller holds the lock).
+
+        Returns:
+            list: (check, future) pairs the caller passes to _watch once it released the lock
+        """
+        started = []
+        if self.executor is None:
+            self.executor = self._new_executor()
+        while self.running < self.workers and self.queues:
+            ip, waiting = next(iter(self.queues.items()))
+            check = waiting.popleft()
+            if waiting:
+                self.queues.move_to_end(ip)
+            else:
+                del self.queues[ip]
+            try:
+                future = self.executor.submit(verify_and_upgrade, *check.args)
+            except Exception as e:
+                # The pool broke (a worker died): replace it and let this check fall back inline
+                self.executor = self._new_executor()
+                self.pending -= 1
+                check.error = e
+                check.done.set()
+                continue
+            self.running += 1
+            started.append((check, future))
+        return started
+
+    def _watch(self, started):
+        # A future that already finished runs its callback right here, and _finished takes the lock
+        for check, future in started:
+            future.add_done_callback(lambda future, check=check: self._finished(check, future))
+
+    def _finished(self, check, future):
+        try:
+            check.result = future.result()
+        except Exception as e:
+            check.error = e
+        with self.lock:
+            self.running -= 1
+            self.pending -= 1
+            started = self._dispatch()
+        check.done.set()
+        self._watch(started)
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+
+def _get_queue(app):
+    """This process's verification queue, started on first use (a forked child starts its own)"""
+    global _queue, _queue_pid
+    if _queue_pid == os.getpid():
+        return _queue
+    with _queue_lock:
+        if _queue_pid != os.getpid():
+            _queue = VerificationQueue(
+                workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+                max_pending=app.config.get('PASSWORD_QUEUE_LIMIT', 64),
+                max_per_ip=app.config.get('PASSWORD_QUEUE_PER_IP', 16)
+            )
+            _queue.start()
+            _queue_pid = os.getpid()
+        return _queue
+
+
+def verify_password(user, password, ip):
+    """
+    Check a user's password off the request thread and upgrade an outdated hash.
+
+    Args:
+        user: The User whose password_hash is checked
+        password: The submitted password
+        ip: Client address used for fair queuing
+
+    Returns:
+        bool or None: Whether the password matches, or None if the server is too busy to check
+    """
+    app = current_app._get_current_object()
+    method = app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+    args = (user.password_hash, password, method)
+
+    if app.config.get('PASSWORD_HASH_WORKERS', 2) <= 0:
+        matches, new_hash = verify_and_upgrade(*args)
+    else:
+        queue = _get_queue(app)
+        check = queue.submit(ip, args)
+        if check is None:
+            logger.warning(f"Password check queue full, turning away a login from {ip}")
+            return None
+        if not check.done.wait(app.config.get('PASSWORD_QUEUE_TIMEOUT', 10)):
+            queue.cancel(ip, check)
+            logger.warning(f"Password check for {ip} timed out in the queue")
+            return None
+        if check.error is not None:
+            # A broken pool must not lock everybody out
+            logger.error(f"Password pool failed, checking inline: {str(check.error)}")
+            matches, new_hash = verify_and_upgrade(*args)
+        else:
+            matches, new_hash = check.result
+
+    if matches and new_hash:
+        user.password_hash = new_hash
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Could not upgrade the password hash of user {user.id}: {str(e)}")
+    return matches
+
+
+def shutdown_password_pool():
+    global _queue, _queue_pid
+    with _queue_lock:
+        queue, _queue, _queue_pid = _queue, None, None
+    if queue is not None:
+        queue.shutdown()
@@ -0,0 +1,194 @@
+"""
+Request-level SQL profiler (opt-in with SQL_PROFILER=true).
+SQLAlchemy engine events time every statement a request executes. Statements are
+grouped by shape (whitespace collapsed, literals and IN lists replaced by ?), and a
+shape executed SQL_PROFILER_N1_THRESHOLD times or more in one request is flagged as
+an N+1 candidate; identical statements with identical parameters are reported as
+duplicates.
+
+Each profiled request gets an X-SQL-Profile and a Server-Timing header, is kept in
+memory for the admin page (/admin/sql-profile) and is appended to the JSONL log at
+SQL_PROFILER_LOG.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))+\s*\)')
+
+_history = deque(maxlen=200)
+_history_lock = threading.Lock()
+_log_lock = threading.Lock()
+_listening = False
+
+
+def statement_shape(statement):
+    """The statement with literals and parameter lists replaced, so N+1 loops collapse to one shape"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    return _IN_LIST.sub('(?)', shape)
+
+
+class RequestProfile:
+    """Statements executed while serving one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.shapes = Counter()
+        self.shape_seconds = Counter()
+        self.statements = Counter()
+
+    def record(self, statement, parameters, seconds):
+        shape = statement_shape(statement)
+        self.queries += 1
+        self.db_seconds += seconds
+        self.shapes[shape] += 1
+        self.shape_seconds[shape] += seconds
+        self.statements[(shape, repr(parameters)[:500])] += 1
+
+    def summary(self, threshold):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_seconds * 1000, 2),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'n_plus_one': [
+                {'shape': shape, 'count': count, 'db_ms': round(self.shape_seconds[shape] * 1000, 2)}
+                for shape, count in self.shapes.most_common() if count >= threshold
+            ],
+            'duplicates': [
+                {'shape': shape, 'parameters': parameters, 'count': count}
+                for (shape, parameters), count in self.statements.most_common() if count > 1
+            ]
+        }
+
+
+def _current_profile():
+    if has_request_context():
+        return g.get('_sql_profile')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the per-statement context, so a statement that raises leaves nothing behind
+    if _current_profile() is not None and context is not None:
+        context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    started = getattr(context, '_profile_started', None)
+    if profile is None or started is None:
+        return
+    profile.record(statement, parameters, time.perf_counter() - started)
+
+
+def _start_profile():
+    if request.endpoint != 'static':
+        g._sql_profile = RequestProfile()
+
+
+def _finish_profile(response, app):
+    profile = g.pop('_sql_profile', None)
+    if profile is None:
+        return response
+
+    entry = profile.summary(app.config.get('SQL_PROFILER_N1_THRESHOLD', 3))
+    entry.update(
+        at=datetime.utcnow().isoformat(timespec='seconds'),
+        method=request.method,
+        path=request.path,
+        endpoint=request.endpoint,
+        status=response.status_code
+    )
+    response.headers['X-SQL-Profile'] = (
+        f"queries={entry['queries']}; db_ms={entry['db_ms']}; n_plus_one={len(entry['n_plus_one'])}"
+    )
+    response.headers.add('Server-Timing', f"db;dur={entry['db_ms']};desc=\"{entry['queries']} queries\"")
+
+    with _history_lock:
+        _history.append(entry)
+    _write_log(app.config.get('SQL_PROFILER_LOG'), entry)
+    return response
+
+
+def _write_log(path, entry):
+    if not path:
+        return
+    try:
+        with _log_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as log:
+                log.write(json.dumps(entry) + '\n')
+    except OSError as e:
+        logger.error(f"Could not write the SQL profile log: {str(e)}")
+
+
+def recent_profiles(sort='recent', limit=100):
+    """Profiled requests kept in memory, newest first or with the most queries first"""
+    with _history_lock:
+        entries = list(_history)
+    entries.reverse()
+    if sort == 'queries':
+        entries.sort(key=lambda entry: entry['queries'], reverse=True)
+    elif sort == 'n_plus_one':
+        entries = [entry for entry in entries if entry['n_plus_one']]
+    return entries[:limit]
+
+
+def endpoint_summary():
+    """Per endpoint: requests seen, average and maximum query count, and how often an N+1 was flagged"""
+    with _history_lock:
+        entries = list(_history)
+    endpoints = {}
+    for entry in entries:
+        stats = endpoints.setdefault(entry['endpoint'], {
+            'endpoint': entry['endpoint'], 'requests': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0, 'flagged': 0
+        })
+        stats['requests'] += 1
+        stats['queries'] += entry['queries']
+        stats['max_queries'] = max(stats['max_queries'], entry['queries'])
+        stats['db_ms'] += entry['db_ms']
+        stats['flagged'] += bool(entry['n_plus_one'])
+    for stats in endpoints.values():
+        stats['avg_queries'] = round(stats['queries'] / stats['requests'], 1)
+        stats['avg_db_ms'] = round(stats['db_ms'] / stats['requests'], 2)
+    return sorted(endpoints.values(), key=lambda stats: stats['max_queries'], reverse=True)
+
+
+def clear_profiles():
+    with _history_lock:
+        _history.clear()
+
+
+def init_profiler(app):
+    """Profile every request of this app (called by create_app when SQL_PROFILER is on)"""
+    global _history, _listening
+    with _history_lock:
+        _history = deque(_history, maxlen=app.config.get('SQL_PROFILER_HISTORY', 200))
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+    app.before_request(_start_profile)
+    app.after_request(lambda response: _finish_profile(response, app))
+    logger.info("SQL profiler enabled")
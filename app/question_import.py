@@ -0,0 +1,233 @@
+"""
+Bulk question import.
+Uploaded CSV files are staged on disk, validated in a single pass that collects every
+row error, and then written with bulk inserts for questions and their options.
+"""
+
+import csv
+import logging
+import os
+import re
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from app.models import db, Question, QuestionOption, Answer
+from app.exam_snapshot import mark_exam_changed
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rows per bulk insert statement
+INSERT_BATCH_SIZE = 1000
+QUESTION_TYPES = ('mcq', 'text', 'code')
+REQUIRED_COLUMNS = ('question_text', 'question_type', 'points')
+
+_TOKEN_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ImportValidationError(Exception):
+    """Raised when an uploaded file has row errors; carries all of them"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} invalid rows")
+
+
+def _staging_dir():
+    directory = current_app.config['IMPORT_STAGING_DIR']
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _staged_path(token, user_id, exam_id):
+    if not token or not _TOKEN_PATTERN.match(token):
+        return None
+    return os.path.join(_staging_dir(), f"import_{user_id}_{exam_id}_{token}.csv")
+
+
+def stage_upload(file_storage, user_id, exam_id):
+    """Save an uploaded file to the staging directory and return its token"""
+    token = uuid.uuid4().hex
+    file_storage.save(_staged_path(token, user_id, exam_id))
+    return token
+
+
+def staged_file(token, user_id, exam_id):
+    """Path of a staged upload owned by this user and exam, or None if it is gone"""
+    path = _staged_path(token, user_id, exam_id)
+    if path and os.path.exists(path):
+        return path
+    return None
+
+
+def discard_staged(token, user_id, exam_id):
+    path = staged_file(token, user_id, exam_id)
+    if path:
+        os.remove(path)
+
+
+def cleanup_staged_imports(hours_to_keep=24):
+    """Remove staged uploads that were never confirmed"""
+    directory = current_app.config['IMPORT_STAGING_DIR']
+    if not os.path.isdir(directory):
+        return True, "No staged imports"
+
+    cutoff = time.time() - hours_to_keep * 3600
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith('import_') and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return True, f"Removed {removed} stale staged imports"
+
+
+def _parse_row(row):
+    """Validate one CSV row, returning (question dict, errors)"""
+    errors = []
+    text = (row.get('question_text') or '').strip()
+    question_type = (row.get('question_type') or '').strip().lower()
+
+    if not text:
+        errors.append("question_text is empty")
+    if question_type not in QUESTION_TYPES:
+        errors.append(f"question_type must be one of {', '.join(QUESTION_TYPES)}")
+
+    points = None
+    try:
+        points = int((row.get('points') or '').strip())
+        if points < 1:
+            errors.append("points must be at least 1")
+    except ValueError:
+        errors.append("points must be an integer")
+
+    options = []
+    correct = None
+    if question_type == 'mcq':
+        options = [option.strip() for option in (row.get('options') or '').split('|') if option.strip()]
+        if len(options) < 2:
+            errors.append("mcq questions need at least two pipe-separated options")
+        try:
+            correct = int((row.get('correct_answer') or '0').strip())
+            if len(options) >= 2 and not 0 <= correct < len(options):
+                errors.append(f"correct_answer must be between 0 and {len(options) - 1}")
+        except ValueError:
+            errors.append("correct_answer must be an integer")
+
+    return {
+        'question_text': text,
+        'question_type': question_type,
+        'points': points,
+        'options': options,
+        'correct_answer': correct
+    }, errors
+
+
+def parse_questions(path):
+    """
+    Validate a question CSV in one pass.
+
+    Args:
+        path: Path of the staged CSV file
+
+    Returns:
+        list: Parsed question dicts
+
+    Raises:
+        ImportValidationError: With every row error, if any row is invalid
+    """
+    questions = []
+    errors = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ImportValidationError([f"Missing columns: {', '.join(missing)}"])
+
+        # Line 1 is the header
+        for line_number, row in enumerate(reader, start=2):
+            question, row_errors = _parse_row(row)
+            if row_errors:
+                errors.append(f"Row {line_number}: {'; '.join(row_errors)}")
+            else:
+                questions.append(question)
+
+    if errors:
+        raise ImportValidationError(errors)
+    if not questions:
+        raise ImportValidationError(["The file contains no questions"])
+    return questions
+
+
+def delete_exam_questions(exam_id):
+    """
+    Set-based delete of an exam's questions and options.
+
+    Returns:
+        int: Number of questions deleted
+    """
+    question_ids = select(Question.id).where(Question.exam_id == exam_id).scalar_subquery()
+    answered = db.session.query(Answer.id).filter(Answer.question_id.in_(question_ids)).first()
+    if answered:
+        raise ValueError("Questions that already have student answers cannot be replaced")
+
+    db.session.query(QuestionOption).filter(
+        QuestionOption.question_id.in_(question_ids)
+    ).delete(synchronize_session=False)
+    return db.session.query(Question).filter(
+        Question.exam_id == exam_id
+    ).delete(synchronize_session=False)
+
+
+def import_questions(exam_id, questions, replace=False):
+    """
+    Bulk insert parsed questions and their options in one transaction.
+
+    Ordering is assigned in memory after the exam's current last question,
+    and the generated ids are read back by order so options can be inserted in bulk.
+
+    Returns:
+        tuple: (questions imported, questions deleted)
+    """
+    deleted = delete_exam_questions(exam_id) if replace else 0
+
+    start = db.session.query(func.coalesce(func.max(Question.order), 0)).filter(
+        Question.exam_id == exam_id
+    ).scalar()
+
+    question_rows = [
+        {
+            'exam_id': exam_id,
+            'question_text': question['question_text'],
+            'question_type': question['question_type'],
+            'points': question['points'],
+            'order': start + index
+        }
+        for index, question in enumerate(questions, start=1)
+    ]
+    for offset in range(0, len(question_rows), INSERT_BATCH_SIZE):
+        db.session.execute(Question.__table__.insert(), question_rows[offset:offset + INSERT_BATCH_SIZE])
+
+    ids_by_order = dict(db.session.query(Question.order, Question.id).filter(
+        Question.exam_id == exam_id,
+        Question.order > start
+    ).all())
+
+    option_rows = []
+    for index, question in enumerate(questions, start=1):
+        for position, option_text in enumerate(question['options']):
+            option_rows.append({
+                'question_id': ids_by_order[start + index],
+                'option_text': option_text,
+                'is_correct': position == question['correct_answer'],
+                'order': position
+            })
+    for offset in range(0, len(option_rows), INSERT_BATCH_SIZE):
+        db.session.execute(QuestionOption.__table__.insert(), option_rows[offset:offset + INSERT_BATCH_SIZE])
+
+    mark_exam_changed(exam_id)
+    logger.info(f"Imported {len(questions)} questions into exam {exam_id} ({deleted} replaced)")
+    return len(questions), deleted
@@ -0,0 +1,400 @@
+"""
+Bulk data loader for backup archives and CSV files.
+Rows are inserted with batched executemany (or LOAD DATA LOCAL INFILE for CSV on MySQL),
+secondary indexes are dropped during the load and rebuilt afterwards, and tables that
+do not depend on each other are loaded in parallel.
+
+Incremental archives hold whole primary-key blocks: each of their chunks replaces the
+rows of its block, so updated and deleted rows are restored as well as new ones.
+"""
+
+import base64
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, date, time as dt_time
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import text, func, select
+from sqlalchemy import types as sqltypes
+
+from app.models import db
+from app.backup import MANIFEST_NAME, backup_tables
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rows per executemany batch
+BATCH_SIZE = 2000
+
+_TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+
+
+class RestoreError(Exception):
+    """Raised when an archive fails verification or cannot be loaded"""
+
+
+def decode_value(column, value):
+    """Convert a JSON/CSV value back into the Python type of its column"""
+    if value is None:
+        return None
+    column_type = column.type
+    if isinstance(column_type, sqltypes.JSON):
+        if isinstance(value, str):
+            return json.loads(value) if value != '' else None
+        return value
+    if isinstance(value, str) and value == '' and not isinstance(column_type, (sqltypes.String, sqltypes.Text)):
+        return None
+    if isinstance(column_type, sqltypes.DateTime):
+        return datetime.fromisoformat(value) if isinstance(value, str) else value
+    if isinstance(column_type, sqltypes.Date):
+        return date.fromisoformat(value) if isinstance(value, str) else value
+    if isinstance(column_type, sqltypes.Time):
+        return dt_time.fromisoformat(value) if isinstance(value, str) else value
+    if isinstance(column_type, sqltypes.Numeric) and not isinstance(column_type, sqltypes.Float):
+        return Decimal(str(value))
+    if isinstance(column_type, sqltypes.Boolean):
+        return value.strip().lower() in _TRUE_VALUES if isinstance(value, str) else bool(value)
+    if isinstance(column_type, sqltypes.Integer):
+        return int(value)
+    if isinstance(column_type, sqltypes.LargeBinary):
+        return base64.b64decode(value)
+    return value
+
+
+def dependency_levels(tables):
+    """
+    Group tables into levels where every table only references tables in earlier levels.
+    Tables within one level are independent and can be loaded in parallel.
+    """
+    names = {table.name for table in tables}
+    remaining = {table.name: table for table in tables}
+    loaded = set()
+    levels = []
+    while remaining:
+        level = [
+            table for name, table in remaining.items()
+            if all(
+                fk.column.table.name in loaded or fk.column.table.name == name
+                or fk.column.table.name not in names
+                for fk in table.foreign_keys
+            )
+        ]
+        if not level:
+            # Circular references: fall back to one table at a time
+            level = [next(iter(remaining.values()))]
+        for table in level:
+            del remaining[table.name]
+            loaded.add(table.name)
+        levels.append(sorted(level, key=lambda t: t.name))
+    return levels
+
+
+def read_manifest(path):
+    with tarfile.open(path, 'r') as archive:
+        member = archive.extractfile(MANIFEST_NAME)
+        if member is None:
+            raise RestoreError(f"{path} has no {MANIFEST_NAME}")
+        return json.load(member)
+
+
+def verify_archive(path, manifest=None):
+    """Check every chunk's SHA-256 and row count against the manifest before loading"""
+    manifest = manifest or read_manifest(path)
+    with tarfile.open(path, 'r') as archive:
+        for table in manifest['tables']:
+            for chunk in table['chunks']:
+                if chunk['file'] is None:
+                    continue  # a block that was emptied since the base backup
+                member = archive.extractfile(chunk['file'])
+                if member is None:
+                    raise RestoreError(f"Missing chunk {chunk['file']} in {path}")
+                data = member.read()
+                if hashlib.sha256(data).hexdigest() != chunk['sha256']:
+                    raise RestoreError(f"Checksum mismatch for {chunk['file']} in {path}")
+                rows = gzip.decompress(data).count(b'\n')
+                if rows != chunk['rows']:
+                    raise RestoreError(f"Row count mismatch for {chunk['file']}: {rows} != {chunk['rows']}")
+    return manifest
+
+
+def _archive_batches(path, table, entry, batch_size):
+    """Yield batches of decoded rows for one table from a backup archive"""
+    columns = {column.name: column for column in table.columns}
+    batch = []
+    with tarfile.open(path, 'r') as archive:
+        for chunk in entry['chunks']:
+            if chunk['file'] is None:
+                continue
+            with gzip.GzipFile(fileobj=archive.extractfile(chunk['file'])) as gz:
+                for line in gz:
+                    record = json.loads(line)
+                    batch.append({
+                        name: decode_value(columns[name], value)
+                        for name, value in record.items() if name in columns
+                    })
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+    if batch:
+        yield batch
+
+
+def _csv_batches(path, table, batch_size):
+    """Yield batches of decoded rows for one table from a CSV file with a header row"""
+    columns = {column.name: column for column in table.columns}
+    batch = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for record in csv.DictReader(f):
+            batch.append({
+                name: decode_value(columns[name], value)
+                for name, value in record.items() if name in columns
+            })
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _relax_integrity_checks(conn):
+    """Relax per-session integrity checks where the dialect allows it, returning the statements that restore them"""
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        foreign_keys, unique = conn.execute(text('SELECT @@SESSION.foreign_key_checks, @@SESSION.unique_checks')).one()
+        conn.execute(text('SET foreign_key_checks = 0'))
+        conn.execute(text('SET unique_checks = 0'))
+        return [f'SET foreign_key_checks = {int(foreign_keys)}', f'SET unique_checks = {int(unique)}']
+    if dialect == 'sqlite':
+        foreign_keys = conn.execute(text('PRAGMA foreign_keys')).scalar()
+        conn.execute(text('PRAGMA foreign_keys = OFF'))
+        return [f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}"]
+    return []
+
+
+@contextmanager
+def _relaxed_connection():
+    """
+    A pooled connection with integrity checks relaxed for bulk loading.
+    The previous settings are restored before the connection returns to the pool; if that
+    fails the connection is invalidated so no later request gets it with checks off.
+    """
+    with db.engine.connect() as conn:
+        restore_statements = _relax_integrity_checks(conn)
+        try:
+            yield conn
+        finally:
+            try:
+                for statement in restore_statements:
+                    conn.execute(text(statement))
+            except Exception as e:
+                logger.error(f"Could not re-enable integrity checks, discarding the connection: {str(e)}")
+                conn.invalidate()
+
+
+def _load_data_infile(conn, table, path):
+    """Use MySQL's LOAD DATA LOCAL INFILE for a CSV file (requires allow_local_infile)"""
+    with open(path, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f))
+    column_list = ', '.join(f'`{name}`' for name in header if name in table.columns)
+    result = conn.execute(text(
+        f"LOAD DATA LOCAL INFILE :path INTO TABLE `{table.name}` "
+        "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+        f"LINES TERMINATED BY '\\n' IGNORE 1 LINES ({column_list})"
+    ), {'path': path})
+    return result.rowcount
+
+
+def load_table(table, source, batch_size=BATCH_SIZE, use_load_data=False):
+    """
+    Load one table from its source on a dedicated connection.
+
+    Args:
+        table: SQLAlchemy Table
+        source: ('archive', path, manifest_entry, block_size) or ('csv', path);
+            block_size is set for incremental archives, whose chunks replace their primary-key block
+        batch_size: Rows per executemany call
+        use_load_data: Use LOAD DATA LOCAL INFILE for CSV sources on MySQL
+
+    Returns:
+        int: Number of rows loaded
+    """
+    loaded = 0
+    with _relaxed_connection() as conn:
+        with conn.begin():
+            if source[0] == 'csv' and use_load_data and conn.dialect.name == 'mysql':
+                loaded = _load_data_infile(conn, table, source[1])
+            elif source[0] == 'archive' and source[3]:
+                pk = list(table.primary_key.columns)[0]
+                for chunk in source[2]['chunks']:
+                    low = chunk['block'] * source[3]
+                    conn.execute(table.delete().where(pk > low, pk <= low + source[3]))
+                    for batch in _archive_batches(source[1], table, {'chunks': [chunk]}, batch_size):
+                        conn.execute(table.insert(), batch)
+                        loaded += len(batch)
+            else:
+                if source[0] == 'archive':
+                    batches = _archive_batches(source[1], table, source[2], batch_size)
+                else:
+                    batches = _csv_batches(source[1], table, batch_size)
+                for batch in batches:
+                    conn.execute(table.insert(), batch)
+                    loaded += len(batch)
+    logger.info(f"Loaded {loaded} rows into {table.name}")
+    return loaded
+
+
+def _secondary_indexes(tables):
+    """Non-unique indexes declared on the models, which are safe to rebuild after the load"""
+    return [index for table in tables for index in table.indexes if not index.unique]
+
+
+def _drop_indexes(indexes):
+    """Drop indexes before the load, returning the ones that were actually dropped"""
+    dropped = []
+    for index in indexes:
+        try:
+            with db.engine.begin() as conn:
+                index.drop(conn)
+            dropped.append(index)
+        except Exception as e:
+            # e.g. MySQL refuses to drop an index backing a foreign key, or it does not exist
+            logger.warning(f"Keeping index {index.name} during load: {str(e)}")
+    return dropped
+
+
+def _rebuild_indexes(indexes):
+    """Recreate dropped indexes, returning the names of the ones that could not be rebuilt"""
+    failed = []
+    for index in indexes:
+        try:
+            with db.engine.begin() as conn:
+                index.create(conn)
+        except Exception as e:
+            logger.error(f"Could not rebuild index {index.name}: {str(e)}")
+            failed.append(index.name)
+    return failed
+
+
+def _reset_sequences(tables):
+    """Move PostgreSQL sequences past the restored primary keys"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    with db.engine.begin() as conn:
+        for table in tables:
+            pk = list(table.primary_key.columns)[0]
+            max_id = conn.execute(select(func.max(pk))).scalar()
+            if max_id:
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', '{pk.name}'), :value)"
+                ), {'value': max_id})
+
+
+def _check_chain(manifests):
+    """
+    Make sure every incremental archive directly follows the archive it was taken against.
+    Format 1 incrementals only hold rows inserted since their base and cannot rebuild a database.
+    """
+    for position, (path, manifest) in enumerate(manifests):
+        if manifest.get('mode') != 'incremental':
+            continue
+        if manifest.get('format', 1) < 2:
+            raise RestoreError(
+                f"{path} is a format 1 incremental backup, which holds only inserted rows; "
+                "restore from a full backup taken since"
+            )
+        previous = manifests[position - 1][1] if position else None
+        if previous is None or previous.get('state') != manifest['base_state']:
+            raise RestoreError(f"{path} must directly follow the backup it was taken against")
+
+
+def restore(archives=(), csv_files=None, replace=False, workers=4, batch_size=BATCH_SIZE,
+            rebuild_indexes=True, use_load_data=False, verify=True):
+    """
+    Restore backup archives (a full backup followed by any incrementals) and CSV files.
+
+    Args:
+        archives: Paths to backup archives, applied in order
+        csv_files: Mapping of table name -> CSV path
+        replace: Delete existing rows from the restored tables first
+        workers: Maximum number of tables loaded in parallel
+        batch_size: Rows per executemany call
+        rebuild_indexes: Drop non-unique secondary indexes during the load and recreate them after
+        use_load_data: Use LOAD DATA LOCAL INFILE for CSV files on MySQL
+        verify: Verify archive checksums before loading anything
+
+    Returns:
+        dict: Table name -> rows loaded
+    """
+    app = current_app._get_current_object()
+    csv_files = csv_files or {}
+    tables_by_name = {table.name: table for table in backup_tables()}
+
+    unknown = [name for name in csv_files if name not in tables_by_name]
+    if unknown:
+        raise RestoreError(f"Unknown tables in CSV input: {', '.join(unknown)}")
+
+    # Verify everything up front so a corrupt archive never leaves a half-restored database
+    manifests = []
+    for path in archives:
+        manifest = verify_archive(path) if verify else read_manifest(path)
+        manifests.append((path, manifest))
+    _check_chain(manifests)
+
+    involved = {entry['name'] for _, manifest in manifests for entry in manifest['tables']}
+    involved.update(csv_files)
+    tables = [table for name, table in tables_by_name.items() if name in involved]
+
+    if db.engine.dialect.name == 'sqlite':
+        workers = 1  # SQLite serializes writers; parallel loads would only contend for the lock
+
+    if replace:
+        with _relaxed_connection() as conn:
+            with conn.begin():
+                for table in reversed(tables):
+                    conn.execute(table.delete())
+
+    indexes = _drop_indexes(_secondary_indexes(tables)) if rebuild_indexes else []
+
+    totals = {}
+    try:
+        sources = []
+        for path, manifest in manifests:
+            block_size = manifest['chunk_size'] if manifest['mode'] == 'incremental' else None
+            entries = {entry['name']: entry for entry in manifest['tables'] if entry['chunks']}
+            sources.append({name: ('archive', path, entry, block_size) for name, entry in entries.items()})
+        if csv_files:
+            sources.append({name: ('csv', path) for name, path in csv_files.items()})
+
+        levels = dependency_levels(tables)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            # Archives are applied in order; within one source, independent tables load in parallel
+            for source in sources:
+                for level in levels:
+                    futures = {
+                        table.name: executor.submit(
+                            _load_in_context, app, table, source[table.name], batch_size, use_load_data
+                        )
+                        for table in level if table.name in source
+                    }
+                    for name, future in futures.items():
+                        totals[name] = totals.get(name, 0) + future.result()
+    finally:
+        # Never raises, so a load error propagates unchanged
+        failed = _rebuild_indexes(indexes)
+    if failed:
+        raise RestoreError(f"Rows were restored but these indexes could not be rebuilt: {', '.join(failed)}")
+
+    _reset_sequences(tables)
+    return totals
+
+
+def _load_in_context(app, table, source, batch_size, use_load_data):
+    with app.app_context():
+        return load_table(table, source, batch_size, use_load_data)
@@ -2,11 +2,12 @@ from datetime import datetime, timedelta
 import csv
 from flask import (
     Blueprint, render_template, redirect, url_for,
-    flash, request, jsonify, abort, session, make_response
+    flash, request, jsonify, abort, make_response
 )
 from flask_login import login_required, current_user
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import func, desc
+from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import case
 from functools import wraps
 import logging
@@ -20,8 +21,16 @@ from app.forms import (
     CodeAnswerForm, GradeAnswerForm, ExamReviewForm, ImportQuestionsForm,
     MarkAllReadForm, MarkReadForm, TakeExamForm, AddGroupExamForm
 )
-from app.notifications import notify_exam_graded, notify_new_exam, notify_new_review
+from app.notifications import (
+    notify_exam_graded, notify_new_review, queue_new_exam_notifications,
+    recent_notifications, notification_history, mark_notifications_read,
+    mark_broadcast_notification_read, mark_all_notifications_read
+)
 from app.decorators import admin_required, teacher_required, student_required
+from app import membership, question_import, teacher_stats
+from app.membership import is_member
+from app.search import search_exams, question_counts
+from app.exam_snapshot import attempt_questions, get_exam_snapshot, new_attempt_seed, uses_random_draw
 
 # Create blueprints for organization
 main_bp = Blueprint('main', __name__)
@@ -48,10 +57,10 @@ def validate_submission_time(attempt, submission_time):
     if not attempt or not attempt.started_at or not attempt.exam:
         return False
         
-    if not attempt.exam.duration:  # If no duration set, submission is always valid
+    if not attempt.exam.time_limit_minutes:  # If no duration set, submission is always valid
         return True
         
-    time_limit = attempt.started_at + timedelta(minutes=attempt.exam.duration)
+    time_limit = attempt.started_at + timedelta(minutes=attempt.exam.time_limit_minutes)
     grace_period = timedelta(minutes=1)  # 1 minute grace period for network delays
     
     return submission_time <= (time_limit + grace_period)
@@ -65,6 +74,11 @@ def save_answers(form_data, attempt, is_final_submission=False):
     """
     saved_question_ids = set()
     
+    # With a question pool, only the questions drawn for this attempt accept answers
+    allowed_ids = None
+    if attempt.random_seed is not None and attempt.exam.question_pool_size:
+        allowed_ids = {question.id for question in attempt_questions(attempt)}
+    
     # First, find all answer keys (both question_id and answer_X format)
     question_keys = {}
     for key, value in form_data.items():
@@ -82,19 +96,44 @@ def save_answers(form_data, attempt, is_final_submission=False):
             except (ValueError, TypeError, IndexError):
                 continue
     
+    if allowed_ids is not None:
+        question_keys = {question_id: value for question_id, value in question_keys.items() if question_id in allowed_ids}
+    if not question_keys:
+        return True
+    
+    # Load the questions, existing answers and chosen options for the whole form at once
+    # instead of three lookups per question
+    questions = {question.id: question for question in Question.query.filter(
+        Question.exam_id == attempt.exam_id,
+        Question.id.in_(question_keys)
+    )}
+    answers = {answer.question_id: answer for answer in Answer.query.filter(
+        Answer.attempt_id == attempt.id,
+        Answer.question_id.in_(questions)
+    )}
+    option_ids = set()
+    for question_id, question in questions.items():
+        if question.question_type == 'mcq':
+            try:
+                option_ids.add(int(question_keys[question_id] or form_data.get(f'answer_{question_id}')))
+            except (ValueError, TypeError):
+                continue
+    valid_options = set()
+    if option_ids:
+        valid_options = set(db.session.query(QuestionOption.id, QuestionOption.question_id).filter(
+            QuestionOption.id.in_(option_ids)
+        ))
+    
     # Process all collected questions
     for question_id, value in question_keys.items():
         try:
-            question = Question.query.get(question_id)
-            if not question or question.exam_id != attempt.exam_id:
+            question = questions.get(question_id)
+            if not question:
                 continue
                 
             saved_question_ids.add(question_id)
             
-            answer = Answer.query.filter_by(
-                attempt_id=attempt.id,
-                question_id=question_id
-            ).first()
+            answer = answers.get(question_id)
             
             if not answer:
                 answer = Answer(
@@ -112,11 +151,7 @@ def save_answers(form_data, attempt, is_final_submission=False):
             if question.question_type == 'mcq':
                 try:
                     option_id = int(value)
-                    option = QuestionOption.query.filter_by(
-                        id=option_id,
-                        question_id=question_id
-                    ).first()
-                    if option:
+                    if (option_id, question_id) in valid_options:
                         answer.selected_option_id = option_id
                 except (ValueError, TypeError):
                     continue
@@ -150,16 +185,21 @@ def dashboard():
         if current_user.is_admin():
             return redirect(url_for('main.admin_dashboard'))
         elif current_user.is_teacher():
-            exams = Exam.query.filter_by(creator_id=current_user.id).all()
-            return render_template('dashboard/teacher_dashboard.html', exams=exams)
+            exams = teacher_stats.exam_rows(current_user.id)
+            return render_template(
+                'dashboard/teacher_dashboard.html',
+                exams=exams,
+                **teacher_stats.dashboard_summary(current_user.id, exams)
+            )
         else:
-            joined_groups = current_user.joined_groups.all()
-            group_ids = [g.id for g in joined_groups]
+            group_ids = membership.group_ids(current_user.id)
+            joined_groups = Group.query.options(joinedload(Group.teacher))\
+                .filter(Group.id.in_(group_ids)).order_by(Group.name).all() if group_ids else []
 
             available_exams = Exam.query.filter(
                 Exam.is_published == True,
                 Exam.group_id.in_(group_ids)
-            ).all()
+            ).all() if group_ids else []
             
             attempts = ExamAttempt.query.filter_by(student_id=current_user.id).all()
             completed_attempts = [attempt for attempt in attempts if attempt.is_completed]
@@ -172,6 +212,7 @@ def dashboard():
             
             return render_template(
                 'dashboard/student_dashboard.html',
+                joined_groups=joined_groups,
                 available_exams=available_exams,
                 completed_exams=completed_exams,
                 average_score=average_score
@@ -200,7 +241,9 @@ def create_exam():
                 time_limit_minutes=form.time_limit_minutes.data,
                 creator_id=current_user.id,
                 is_published=form.is_published.data,
-                group_id=form.group_id.data
+                group_id=form.group_id.data,
+                randomize_questions=form.randomize_questions.data,
+                question_pool_size=form.question_pool_size.data or None
             )
             db.session.add(exam)
             db.session.commit()
@@ -256,6 +299,8 @@ def edit_exam(exam_id):
                     exam.time_limit_minutes = form.time_limit_minutes.data
                     exam.group_id = form.group_id.data
                     exam.is_published = form.is_published.data
+                    exam.randomize_questions = form.randomize_questions.data
+                    exam.question_pool_size = form.question_pool_size.data or None
                     db.session.commit()
                     flash('Exam settings updated successfully!', 'success')
                     return redirect(url_for('teacher.edit_exam', exam_id=exam_id))
@@ -352,7 +397,8 @@ def publish_exam(exam_id):
     db.session.commit()
     
     if not was_already_published:
-        notify_new_exam(exam_id)
+        # Notifications and emails are fanned out in the background
+        queue_new_exam_notifications(exam_id)
     
     flash('Exam published successfully!', 'success')
     return redirect(url_for('teacher.view_exam', exam_id=exam_id))
@@ -394,16 +440,19 @@ def view_exam(exam_id):
     
     exam = verify_exam_owner(exam_id)
     
-    questions = Question.query.filter_by(exam_id=exam_id).order_by(Question.order).all()
-    attempts = ExamAttempt.query.filter_by(exam_id=exam_id).all()
-    
+    # Logged first: the log commits, which would expire every attempt loaded before it
     log_security_event('EXAM_ACCESS', f'Teacher {current_user.id} viewed exam {exam_id}')
     
+    questions = get_exam_snapshot(exam_id)
+    attempts = ExamAttempt.query.options(joinedload(ExamAttempt.student))\
+        .filter_by(exam_id=exam_id).all()
+    
     return render_template(
         'teacher/view_exam.html',
         exam=exam,
         questions=questions,
-        attempts=attempts
+        attempts=attempts,
+        scores=teacher_stats.attempt_scores(exam, questions, attempts)
     )
 
 
@@ -473,117 +522,115 @@ def exam_analytics(exam_id):
     from app.security import verify_exam_owner, log_security_event
     
     try:
-        # Start a transaction to ensure consistent data
-        with db.session.begin():
-            # Verify ownership and log access
-            exam = verify_exam_owner(exam_id)
-            log_security_event('ANALYTICS_ACCESS', f'Teacher {current_user.id} viewed analytics for exam {exam_id}')
-            
-            # Get all data needed in a single efficient query
-            attempts_data = db.session.query(
-                ExamAttempt,
-                User.username,
-                ExamAttempt.score,
-                ExamAttempt.completed_at,
-                ExamAttempt.started_at
-            ).join(
-                User, ExamAttempt.student_id == User.id
-            ).filter(
-                ExamAttempt.exam_id == exam_id,
-                ExamAttempt.is_completed == True
-            ).all()
-            
-            if not attempts_data:
-                flash('No completed attempts for this exam yet.', 'info')
-                return redirect(url_for('teacher.view_exam', exam_id=exam_id))
-            
-            # Initialize analytics
-            analytics = {
-                'total_attempts': len(attempts_data),
-                'avg_score': 0,
-                'highest_score': 0,
-                'lowest_score': 100,
-                'question_stats': {},
-                'completion_times': []
+        # Verify ownership and log access
+        exam = verify_exam_owner(exam_id)
+        log_security_event('ANALYTICS_ACCESS', f'Teacher {current_user.id} viewed analytics for exam {exam_id}')
+        
+        # Get all data needed in a single efficient query
+        attempts_data = db.session.query(
+            ExamAttempt,
+            User.username,
+            ExamAttempt.score,
+            ExamAttempt.completed_at,
+            ExamAttempt.started_at
+        ).join(
+            User, ExamAttempt.student_id == User.id
+        ).filter(
+            ExamAttempt.exam_id == exam_id,
+            ExamAttempt.is_completed == True
+        ).all()
+        
+        if not attempts_data:
+            flash('No completed attempts for this exam yet.', 'info')
+            return redirect(url_for('teacher.view_exam', exam_id=exam_id))
+        
+        # Initialize analytics
+        analytics = {
+            'total_attempts': len(attempts_data),
+            'avg_score': 0,
+            'highest_score': 0,
+            'lowest_score': 100,
+            'question_stats': {},
+            'completion_times': []
+        }
+        
+        # Get question performance data in one efficient query
+        question_stats = db.session.query(
+            Question.id,
+            Question.question_text,
+            Question.points,
+            Question.question_type,
+            func.count(Answer.id).label('answer_count'),
+            func.sum(case([(Answer.is_correct == True, 1)], else_=0)).label('correct_count')
+        ).outerjoin(
+            Answer, Answer.question_id == Question.id
+        ).filter(
+            Question.exam_id == exam_id
+        ).group_by(
+            Question.id
+        ).all()
+        
+        # Process question statistics
+        for q_id, q_text, points, q_type, answer_count, correct_count in question_stats:
+            percent_correct = (correct_count / answer_count * 100) if answer_count > 0 else 0
+            analytics['question_stats'][q_id] = {
+                'id': q_id,
+                'text': q_text,
+                'points': points,
+                'type': q_type,
+                'total_answers': answer_count,
+                'correct_answers': correct_count,
+                'percent_correct': round(percent_correct, 1)
             }
+        
+        # Process attempt data
+        total_score = 0
+        total_time = 0
+        min_time = float('inf')
+        max_time = 0
+        
+        for attempt, username, score, completed_at, started_at in attempts_data:
+            if score is not None:
+                score_val = float(score)
+                total_score += score_val
+                analytics['highest_score'] = max(analytics['highest_score'], score_val)
+                analytics['lowest_score'] = min(analytics['lowest_score'], score_val)
             
-            # Get question performance data in one efficient query
-            question_stats = db.session.query(
-                Question.id,
-                Question.question_text,
-                Question.points,
-                Question.question_type,
-                func.count(Answer.id).label('answer_count'),
-                func.sum(case([(Answer.is_correct == True, 1)], else_=0)).label('correct_count')
-            ).outerjoin(
-                Answer, Answer.question_id == Question.id
-            ).filter(
-                Question.exam_id == exam_id
-            ).group_by(
-                Question.id
-            ).all()
-            
-            # Process question statistics
-            for q_id, q_text, points, q_type, answer_count, correct_count in question_stats:
-                percent_correct = (correct_count / answer_count * 100) if answer_count > 0 else 0
-                analytics['question_stats'][q_id] = {
-                    'id': q_id,
-                    'text': q_text,
-                    'points': points,
-                    'type': q_type,
-                    'total_answers': answer_count,
-                    'correct_answers': correct_count,
-                    'percent_correct': round(percent_correct, 1)
-                }
-            
-            # Process attempt data
-            total_score = 0
-            total_time = 0
-            min_time = float('inf')
-            max_time = 0
-            
-            for attempt, username, score, completed_at, started_at in attempts_data:
-                if score is not None:
-                    score_val = float(score)
-                    total_score += score_val
-                    analytics['highest_score'] = max(analytics['highest_score'], score_val)
-                    analytics['lowest_score'] = min(analytics['lowest_score'], score_val)
-                
-                if completed_at and started_at:
-                    completion_time = (completed_at - started_at).total_seconds() / 60.0
-                    analytics['completion_times'].append({
-                        'student': username,
-                        'minutes': round(completion_time, 1)
-                    })
-                    total_time += completion_time
-                    min_time = min(min_time, completion_time)
-                    max_time = max(max_time, completion_time)
-            
-            # Calculate averages
-            if analytics['total_attempts'] > 0:
-                analytics['avg_score'] = round(total_score / analytics['total_attempts'], 1)
-            
-            # Calculate time statistics
-            time_stats = {}
-            if analytics['completion_times']:
-                time_stats['avg'] = round(total_time / len(analytics['completion_times']), 1)
-                time_stats['min'] = round(min_time, 1)
-                time_stats['max'] = round(max_time, 1)
-            
-            # Sort questions by difficulty
-            sorted_questions = sorted(
-                analytics['question_stats'].values(),
-                key=lambda x: x['percent_correct']
-            )
-            
-            return render_template(
-                'teacher/exam_analytics.html',
-                exam=exam,
-                analytics=analytics,
-                sorted_questions=sorted_questions,
-                time_stats=time_stats
-            )
-            
+            if completed_at and started_at:
+                completion_time = (completed_at - started_at).total_seconds() / 60.0
+                analytics['completion_times'].append({
+                    'student': username,
+                    'minutes': round(completion_time, 1)
+                })
+                total_time += completion_time
+                min_time = min(min_time, completion_time)
+                max_time = max(max_time, completion_time)
+        
+        # Calculate averages
+        if analytics['total_attempts'] > 0:
+            analytics['avg_score'] = round(total_score / analytics['total_attempts'], 1)
+        
+        # Calculate time statistics
+        time_stats = {}
+        if analytics['completion_times']:
+            time_stats['avg'] = round(total_time / len(analytics['completion_times']), 1)
+            time_stats['min'] = round(min_time, 1)
+            time_stats['max'] = round(max_time, 1)
+        
+        # Sort questions by difficulty
+        sorted_questions = sorted(
+            analytics['question_stats'].values(),
+            key=lambda x: x['percent_correct']
+        )
+        
+        return render_template(
+            'teacher/exam_analytics.html',
+            exam=exam,
+            analytics=analytics,
+            sorted_questions=sorted_questions,
+            time_stats=time_stats
+        )
+        
     except SQLAlchemyError as e:
         db.session.rollback()
         logger.error(f"Database error in exam analytics: {str(e)}")
@@ -602,23 +649,18 @@ def view_exam_reviews(exam_id):
     
     reviews = ExamReview.query.filter_by(exam_id=exam_id).order_by(ExamReview.created_at.desc()).all()
     
+    # Totals and the star histogram come from the aggregates stored on the exam
     stats = {
-        'total': len(reviews),
+        'total': exam.rating_count,
         'average': exam.get_average_rating(),
-        'counts': {
-            '5': 0, '4': 0, '3': 0, '2': 0, '1': 0
-        }
+        'counts': {}
     }
     
-    for review in reviews:
-        stats['counts'][str(review.rating)] += 1
-    
-    if stats['total'] > 0:
-        for rating in stats['counts']:
-            stats['counts'][rating] = {
-                'count': stats['counts'][rating],
-                'percent': round((stats['counts'][rating] / stats['total']) * 100)
-            }
+    for stars, count in exam.get_rating_counts().items():
+        stats['counts'][str(stars)] = {
+            'count': count,
+            'percent': round((count / stats['total']) * 100) if stats['total'] else 0
+        }
     
     return render_template(
         'teacher/view_reviews.html',
@@ -650,8 +692,7 @@ def review_queue():
 @login_required
 @teacher_required
 def view_analytics():
-    total_exams = Exam.query.filter_by(creator_id=current_user.id).count()
-    published_exams = Exam.query.filter_by(creator_id=current_user.id, is_published=True).count()
+    total_exams, published_exams = teacher_stats.exam_totals(current_user.id)
     
     attempt_stats = db.session.query(
         func.count(ExamAttempt.id).label('total_attempts'),
@@ -700,49 +741,35 @@ def view_analytics():
 @login_required
 @teacher_required
 def export_exams():
-    from io import StringIO
     from app.security import log_security_event
+    from app.jobs import enqueue_job
     
     log_security_event('DATA_EXPORT', f'Teacher {current_user.id} exported exam data')
     
-    csv_data = StringIO()
-    csv_writer = csv.writer(csv_data)
-    
-    csv_writer.writerow(['Exam ID', 'Title', 'Description', 'Time Limit', 'Status', 
-                         'Created Date', 'Questions', 'Total Attempts', 'Avg Score'])
-    
-    exams = Exam.query.filter_by(creator_id=current_user.id).all()
-    
-    for exam in exams:
-        question_count = Question.query.filter_by(exam_id=exam.id).count()
-        attempts = ExamAttempt.query.filter_by(exam_id=exam.id, is_completed=True).all()
-        attempts_count = len(attempts)
-        
-        if attempts_count > 0:
-            total_score = sum(attempt.calculate_score()['percentage'] for attempt in attempts)
-            avg_score = f"{(total_score / attempts_count):.1f}"
-        else:
-            avg_score = "N/A"
-        
-        status = 'Published' if exam.is_published else 'Draft'
-        created_date = exam.created_at.strftime('%Y-%m-%d')
-        
-        csv_writer.writerow([
-            exam.id, 
-            exam.title, 
-            exam.description[:50] + '...' if exam.description and len(exam.description) > 50 else exam.description,
-            f"{exam.time_limit_minutes} minutes",
-            status,
-            created_date,
-            question_count,
-            attempts_count,
-            avg_score
-        ])
-    
-    response = make_response(csv_data.getvalue())
-    response.headers['Content-Disposition'] = 'attachment; filename=exam_data.csv'
-    response.headers['Content-type'] = 'text/csv'
-    return response
+    # The CSV is built on the export worker pool; the user is sent to its progress page
+    job = enqueue_job('exams', {'teacher_id': current_user.id}, current_user.id)
+    return redirect(url_for('jobs.view_job', job_id=job.id))
+
+
+def _run_question_import(exam_id, path, token, replace):
+    """Import a staged, validated question file and discard it afterwards"""
+    try:
+        questions = question_import.parse_questions(path)
+        imported, deleted = question_import.import_questions(exam_id, questions, replace=replace)
+        db.session.commit()
+        if deleted:
+            flash(f'Deleted {deleted} existing questions.', 'info')
+        flash(f'Successfully imported {imported} questions.', 'success')
+        return redirect(url_for('teacher.edit_exam', exam_id=exam_id))
+    except question_import.ImportValidationError as e:
+        flash(f'The file was not imported: {len(e.errors)} problem(s) found.', 'danger')
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing questions into exam {exam_id}: {str(e)}")
+        flash(f'Error importing questions: {str(e)}', 'danger')
+    finally:
+        question_import.discard_staged(token, current_user.id, exam_id)
+    return redirect(url_for('teacher.import_questions', exam_id=exam_id))
 
 
 @teacher_bp.route('/exams/<int:exam_id>/import-questions', methods=['GET', 'POST'])
@@ -754,79 +781,46 @@ def import_questions(exam_id):
     exam = verify_exam_owner(exam_id)
     
     form = ImportQuestionsForm()
+    import_errors = []
     
-    # Check if we need to show the confirmation page for replacing questions
-    if form.validate_on_submit() and form.replace_existing.data and not request.form.get('confirm_replace'):
-        # Store the file in the session temporarily
-        if form.template_file.data:
-            file_contents = form.template_file.data.read().decode('utf-8')
-            session['import_file_contents'] = file_contents
-            
-            # Count existing questions for confirmation message
+    # Confirmation of a replacement: the upload was staged on disk when it was first submitted
+    if request.method == 'POST' and request.form.get('confirm_replace'):
+        token = request.form.get('import_token')
+        path = question_import.staged_file(token, current_user.id, exam_id)
+        if not path:
+            flash('The uploaded file has expired. Please upload it again.', 'warning')
+            return redirect(url_for('teacher.import_questions', exam_id=exam_id))
+        return _run_question_import(exam_id, path, token, replace=True)
+    
+    if form.validate_on_submit():
+        token = question_import.stage_upload(form.template_file.data, current_user.id, exam_id)
+        path = question_import.staged_file(token, current_user.id, exam_id)
+        
+        try:
+            # Validate the whole file before asking for confirmation
+            question_import.parse_questions(path)
+        except question_import.ImportValidationError as e:
+            question_import.discard_staged(token, current_user.id, exam_id)
+            import_errors = e.errors
+            flash(f'The file was not imported: {len(e.errors)} problem(s) found.', 'danger')
+            return render_template('teacher/import_questions.html', form=form, exam=exam,
+                                   import_errors=import_errors)
+        except UnicodeDecodeError:
+            question_import.discard_staged(token, current_user.id, exam_id)
+            flash('The file must be UTF-8 encoded CSV.', 'danger')
+            return render_template('teacher/import_questions.html', form=form, exam=exam, import_errors=import_errors)
+        
+        if form.replace_existing.data:
             existing_questions = Question.query.filter_by(exam_id=exam_id).count()
-            
             return render_template(
                 'teacher/confirm_replace.html', 
                 form=form, 
                 exam=exam, 
-                existing_questions=existing_questions
+                existing_questions=existing_questions,
+                import_token=token
             )
-    
-    # If form is submitted and valid
-    if form.validate_on_submit():
-        try:
-            # If we're coming from the confirmation page, get the file contents from the session
-            if request.form.get('confirm_replace') and 'import_file_contents' in session:
-                file_contents = session.pop('import_file_contents')
-            else:
-                file_contents = form.template_file.data.read().decode('utf-8')
-            
-            from io import StringIO
-            
-            reader = csv.DictReader(StringIO(file_contents))
-            question_count = 0
-            
-            # If replacing existing questions, delete them first
-            if form.replace_existing.data or request.form.get('replace_existing') == 'y':
-                # Delete all existing questions for this exam
-                existing_questions = Question.query.filter_by(exam_id=exam_id).all()
-                for question in existing_questions:
-                    db.session.delete(question)
-                db.session.flush()
-                flash(f'Deleted {len(existing_questions)} existing questions.', 'info')
-            
-            for row in reader:
-                question = Question(
-                    exam_id=exam_id,
-                    question_text=row['question_text'],
-                    question_type=row['question_type'],
-                    points=int(row['points']),
-                    order=Question.query.filter_by(exam_id=exam_id).count() + 1
-                )
-                db.session.add(question)
-                db.session.flush()
-                
-                if question.question_type == 'mcq' and 'options' in row:
-                    options = row['options'].split('|')
-                    correct_answer = int(row.get('correct_answer', 0))
-                    
-                    for i, option_text in enumerate(options):
-                        option = QuestionOption(
-                            question_id=question.id,
-                            option_text=option_text.strip(),
-                            is_correct=(i == correct_answer)
-                        )
-                        db.session.add(option)
-                
-                question_count += 1
-            
-            db.session.commit()
-            flash(f'Successfully imported {question_count} questions.', 'success')
-            return redirect(url_for('teacher.edit_exam', exam_id=exam_id))
-            
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Error importing questions: {str(e)}', 'danger')
+        
+        return _run_question_import(exam_id, path, token, replace=False)
     
     return render_template('teacher/import_questions.html', form=form, exam=exam)
 
@@ -890,11 +884,9 @@ def take_exam(exam_id):
         return redirect(url_for('main.dashboard'))
         
     # Check if the exam is from a group the student is part of
-    if exam.group_id:
-        group = Group.query.get(exam.group_id)
-        if group and current_user not in group.students:
-            flash('You need to join the class to access this exam.', 'warning')
-            return redirect(url_for('group.join_group'))
+    if exam.group_id and not is_member(current_user.id, exam.group_id):
+        flash('You need to join the class to access this exam.', 'warning')
+        return redirect(url_for('group.join_group'))
     
     # Check if student has already completed this exam
     existing_attempt = ExamAttempt.query.filter_by(
@@ -918,7 +910,8 @@ def take_exam(exam_id):
         attempt = ExamAttempt(
             student_id=current_user.id,
             exam_id=exam_id,
-            started_at=datetime.utcnow()
+            started_at=datetime.utcnow(),
+            random_seed=new_attempt_seed() if uses_random_draw(exam) else None
         )
         db.session.add(attempt)
         try:
@@ -1184,37 +1177,29 @@ def take_exam(exam_id):
                 'details': error_msg
             }), 500
     
-    # Get all questions
-    questions = Question.query.filter_by(exam_id=exam_id).order_by(Question.order).all()
+    # Questions drawn for this attempt, regenerated from its seed and the cached exam snapshot
+    questions = attempt_questions(attempt, exam)
+    question_count = len(questions)
     
-    # Prepare forms for each question type
-    answer_forms = {}
-    existing_answers = {}
+    # Paged delivery renders only the first question; the rest come from exam_question
+    if exam.one_question_at_time:
+        questions = questions[:1]
     
-    # Get existing answers if any
-    answers = Answer.query.filter_by(attempt_id=attempt.id).all()
-    for answer in answers:
-        existing_answers[answer.question_id] = answer
+    # Get existing answers for the questions being rendered
+    existing_answers = {}
+    if questions:
+        answers = Answer.query.filter(
+            Answer.attempt_id == attempt.id,
+            Answer.question_id.in_([question.id for question in questions])
+        ).all()
+        for answer in answers:
+            existing_answers[answer.question_id] = answer
     
-    for question in questions:
-        if question.question_type == 'mcq':
-            form = MCQAnswerForm()
-            if question.id in existing_answers:
-                form.selected_option.data = existing_answers[question.id].selected_option_id
-            answer_forms[question.id] = form
-            
-        elif question.question_type == 'text':
-            form = TextAnswerForm()
-            if question.id in existing_answers:
-                form.answer_text.data = existing_answers[question.id].text_answer
-            answer_forms[question.id] = form
-            
-        elif question.question_type == 'code':
-            form = CodeAnswerForm()
-            if question.id in existing_answers:
-                answer = existing_answers[question.id]
-                form.code_answer.data = getattr(answer, 'code_answer', None) or answer.text_answer
-            answer_forms[question.id] = form
+    # Prepare forms for each question type
+    answer_forms = {
+        question.id: build_answer_form(question, existing_answers.get(question.id))
+        for question in questions
+    }
     
     # Return the template with all necessary context
     return render_template(
@@ -1222,11 +1207,76 @@ def take_exam(exam_id):
         exam=exam,
         attempt=attempt,
         questions=questions,
+        question_count=question_count,
         answer_forms=answer_forms,
         form=form  # Main form for CSRF protection
     )
 
 
+def build_answer_form(question, answer=None):
+    """Answer form for one question, pre-filled with the saved answer"""
+    if question.question_type == 'mcq':
+        form = MCQAnswerForm()
+        if answer:
+            form.selected_option.data = answer.selected_option_id
+    elif question.question_type == 'text':
+        form = TextAnswerForm()
+        if answer:
+            form.answer_text.data = answer.text_answer
+    else:
+        form = CodeAnswerForm()
+        if answer:
+            form.code_answer.data = getattr(answer, 'code_answer', None) or answer.text_answer
+    return form
+
+
+@student_bp.route('/exams/<int:exam_id>/questions/<int:number>', methods=['GET'])
+@login_required
+@student_required
+def exam_question(exam_id, number):
+    """
+    Deliver one question of a paged exam as an HTML fragment.
+    Questions come from the cached exam snapshot, so the cost does not grow with exam length.
+    """
+    attempt = ExamAttempt.query.filter_by(
+        student_id=current_user.id,
+        exam_id=exam_id,
+        is_completed=False
+    ).first()
+    if not attempt:
+        return jsonify({'success': False, 'message': 'No exam in progress.'}), 404
+    
+    if check_time_expired(attempt):
+        return jsonify({
+            'success': False,
+            'message': 'Exam time has expired',
+            'redirect_url': url_for('student.view_result', attempt_id=attempt.id)
+        }), 400
+    
+    questions = attempt_questions(attempt)
+    if number < 1 or number > len(questions):
+        return jsonify({'success': False, 'message': 'Question not found.'}), 404
+    
+    question = questions[number - 1]
+    answer = Answer.query.filter_by(attempt_id=attempt.id, question_id=question.id).first()
+    
+    html = render_template(
+        'student/_question_card.html',
+        question=question,
+        number=number,
+        answer_form=build_answer_form(question, answer)
+    )
+    response = jsonify({
+        'success': True,
+        'number': number,
+        'total': len(questions),
+        'question_id': question.id,
+        'html': html
+    })
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+
 @student_bp.route('/exams/get_server_time', methods=['GET'])
 @login_required
 def get_server_time():
@@ -1241,61 +1291,64 @@ def search():
     if not query:
         return redirect(url_for('main.dashboard'))
 
+    # Ranked full-text search over titles, descriptions and questions, limited to visible exams
+    results = search_exams(current_user, query, request.args.get('page', 1, type=int))
+    exams = results.exams
+    partial = request.headers.get('HX-Request')
+
     if current_user.is_teacher():
-        # Teachers can search their own exams
-        exams = Exam.query.filter(
-            Exam.creator_id == current_user.id,
-            Exam.title.ilike(f'%{query}%')
-        ).all()
-        template = 'partials/teacher_search_results.html' if request.headers.get('HX-Request') else 'search.html'
-        return render_template(template, exams=exams, query=query)
+        template = 'partials/teacher_search_results.html' if partial else 'search.html'
+        return render_template(template, exams=exams, results=results, query=query,
+                               user_type='teacher', question_counts=question_counts([e.id for e in exams]))
     else:
-        # Students can search published exams
-        exams = Exam.query.filter(
-            Exam.is_published == True,
-            Exam.title.ilike(f'%{query}%')
-        ).all()
-        
         # Get student's attempts for these exams
         attempts = {
             a.exam_id: a for a in ExamAttempt.query.filter(
                 ExamAttempt.student_id == current_user.id,
                 ExamAttempt.exam_id.in_([e.id for e in exams])
             ).all()
-        }
+        } if exams else {}
         
-        template = 'partials/student_search_results.html' if request.headers.get('HX-Request') else 'search.html'
-        return render_template(template, exams=exams, attempts=attempts, query=query)
+        template = 'partials/student_search_results.html' if partial else 'search.html'
+        return render_template(template, exams=exams, results=results, query=query,
+                               user_type=current_user.user_type, attempts=attempts)
 
 
 @main_bp.route('/notifications', methods=['GET', 'POST'])
 @login_required
 def notifications():
-    # Get user's notifications ordered by creation time
-    notifications = Notification.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Notification.created_at.desc()).all()
+    # Newest first, one keyset page at a time
+    before = request.args.get('before')
+    notifications, next_before = notification_history(current_user, before)
     
     mark_all_form = MarkAllReadForm()
     mark_read_form = MarkReadForm()
     
     return render_template('notifications.html', 
                          notifications=notifications,
+                         before=before,
+                         next_before=next_before,
                          mark_all_form=mark_all_form,
                          mark_read_form=mark_read_form)
 
 
+@main_bp.route('/notifications/dropdown')
+@login_required
+def notifications_dropdown():
+    """Navbar dropdown fragment, fetched when the dropdown is opened"""
+    notifications = recent_notifications(current_user)
+    response = make_response(render_template('partials/notification_dropdown.html', notifications=notifications))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @main_bp.route('/notifications/mark-all-read', methods=['POST'])
 @login_required
 def mark_all_read():
     form = MarkAllReadForm()
     if form.validate_on_submit():
         try:
-            Notification.query.filter_by(
-                user_id=current_user.id,
-                is_read=False
-            ).update({'is_read': True})
-            db.session.commit()
+            mark_all_notifications_read(current_user)
             flash('All notifications marked as read.', 'success')
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -1313,8 +1366,22 @@ def mark_read(notification_id):
             notification = Notification.query.get_or_404(notification_id)
             if notification.user_id != current_user.id:
                 abort(403)
-            notification.is_read = True
-            db.session.commit()
+            mark_notifications_read(current_user.id, notification.id)
+            flash('Notification marked as read.', 'success')
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            flash('Error marking notification as read.', 'danger')
+    
+    return redirect(url_for('main.notifications'))
+
+
+@main_bp.route('/notifications/broadcasts/<int:broadcast_id>/mark-read', methods=['POST'])
+@login_required
+def mark_broadcast_read(broadcast_id):
+    form = MarkReadForm()
+    if form.validate_on_submit():
+        try:
+            mark_broadcast_notification_read(current_user, broadcast_id)
             flash('Notification marked as read.', 'success')
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -1379,13 +1446,18 @@ def view_result(attempt_id):
 @login_required
 @admin_required
 def admin_dashboard():
-    # Gather data for admin control center
-    from app.models import User, Exam, ExamAttempt, Notification
-    users = User.query.all()
-    exams = Exam.query.all()
-    attempts = ExamAttempt.query.all()
-    notifications = Notification.query.order_by(Notification.created_at.desc()).limit(10).all()
-    return render_template('dashboard/admin_dashboard.html', users=users, exams=exams, attempts=attempts, notifications=notifications)
+    # Gather data for admin control center: cached totals and the first page of each table
+    from app import admin_console
+    return render_template(
+        'dashboard/admin_dashboard.html',
+        stats=admin_console.platform_stats(),
+        recent_attempts=admin_console.recent_attempts(),
+        users=admin_console.user_page(),
+        exams=admin_console.exam_page(),
+        search=None,
+        role=None,
+        status=None
+    )
 
 
 @teacher_bp.route('/gradebook', methods=['GET'])
@@ -1485,111 +1557,30 @@ def export_gradebook():
     """
     Export gradebook as CSV file
     """
+    from app.jobs import enqueue_job
+    
     group_id = request.args.get('group_id', type=int)
     exam_id = request.args.get('exam_id', type=int)
     
-    # Build the query based on filters
-    exams_query = Exam.query.filter_by(creator_id=current_user.id)
-    
+    # Check access up front; the export itself runs as a background job
     if group_id:
         group = Group.query.get_or_404(group_id)
         if group.teacher_id != current_user.id:
             flash('You do not have access to this group\'s gradebook.', 'warning')
             return redirect(url_for('teacher.gradebook'))
-        
-        students = group.students.all()
-        exams_query = exams_query.filter_by(group_id=group_id)
-    else:
-        # Get all students who have taken the teacher's exams
-        students_query = db.session.query(User).join(
-            ExamAttempt, User.id == ExamAttempt.student_id
-        ).join(
-            Exam, ExamAttempt.exam_id == Exam.id
-        ).filter(
-            Exam.creator_id == current_user.id,
-            User.user_type == 'student'
-        ).distinct()
-        
-        students = students_query.all()
     
-    # Apply exam filter if provided
     if exam_id:
         exam = Exam.query.get_or_404(exam_id)
         if exam.creator_id != current_user.id:
             flash('You do not have access to this exam\'s gradebook.', 'warning')
             return redirect(url_for('teacher.gradebook'))
-        
-        exams = [exam]
-    else:
-        exams = exams_query.all()
-    
-    # Get all attempts
-    attempts_query = ExamAttempt.query.join(
-        Exam, ExamAttempt.exam_id == Exam.id
-    ).filter(
-        Exam.creator_id == current_user.id,
-        ExamAttempt.student_id.in_([s.id for s in students]) if students else True,
-        ExamAttempt.exam_id.in_([e.id for e in exams]) if exams else True
-    )
-    
-    # Create a dictionary of attempts for quick lookup
-    attempts = {}
-    for attempt in attempts_query:
-        attempts[(attempt.student_id, attempt.exam_id)] = attempt
-    
-    # Create CSV response
-    import csv
-    from io import StringIO
-    
-    output = StringIO()
-    writer = csv.writer(output)
     
-    # Write header row
-    header = ['Student', 'Email']
-    for exam in exams:
-        header.append(exam.title)
-    header.append('Average')
-    writer.writerow(header)
-    
-    # Write data rows
-    for student in students:
-        row = [student.username, student.email]
-        
-        # Add scores for each exam
-        total_score = 0
-        score_count = 0
-        
-        for exam in exams:
-            attempt = attempts.get((student.id, exam.id))
-            if attempt and attempt.is_graded:
-                row.append(f"{attempt.score:.1f}%")
-                total_score += attempt.score
-                score_count += 1
-            else:
-                row.append("Not Attempted" if not attempt else "Needs Grading")
-        
-        # Calculate average
-        if score_count > 0:
-            average = total_score / score_count
-            row.append(f"{average:.1f}%")
-        else:
-            row.append("N/A")
-        
-        writer.writerow(row)
-    
-    # Set response headers
-    from flask import Response
-    group_name = Group.query.get(group_id).name if group_id else "All-Classes"
-    filename = f"gradebook-{group_name}-{datetime.now().strftime('%Y-%m-%d')}.csv"
-    
-    return Response(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={
-            'Content-Disposition': f'attachment; filename="{filename}"',
-            'Cache-Control': 'no-cache'
-        }
-    )
+    job = enqueue_job('gradebook', {
+        'teacher_id': current_user.id,
+        'group_id': group_id,
+        'exam_id': exam_id
+    }, current_user.id)
+    return redirect(url_for('jobs.view_job', job_id=job.id))
 
 
 @teacher_bp.route('/attempts/<int:attempt_id>')
@@ -1639,12 +1630,12 @@ def review_exam(exam_id):
                     exam_id=exam_id,
                     student_id=current_user.id
                 )
-            review.rating = form.rating.data
+            review.rating = int(form.rating.data)
             review.feedback = form.feedback.data
             if not review.id:
                 db.session.add(review)
             db.session.commit()
-            notify_new_review(review.id)
+            notify_new_review(review.id, exam_id)
             flash('Your review has been submitted successfully!', 'success')
             return redirect(url_for('student.view_result', attempt_id=attempt.id))
         except Exception as e:
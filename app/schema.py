@@ -0,0 +1,69 @@
+"""
+Startup schema check.
+Instead of running db.create_all() on every boot, a process reads the alembic_version
+row once and compares it with the migration the code was written against. Only an
+empty database is created from the models (and stamped); an unversioned database
+built before migrations were tracked gets its missing tables as before.
+"""
+
+import logging
+
+from sqlalchemy import inspect, text
+
+from app import db
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Head of migrations/versions; bump it with every new migration
+SCHEMA_VERSION = 'add_user_auth_version'
+
+
+def current_schema_version():
+    """The revision recorded in alembic_version, or None when the table does not exist"""
+    try:
+        return db.session.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except Exception:
+        db.session.rollback()
+        return None
+
+
+def _stamp(version):
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS alembic_version (version_num VARCHAR(32) NOT NULL PRIMARY KEY)"
+        ))
+        connection.execute(text("DELETE FROM alembic_version"))
+        connection.execute(text("INSERT INTO alembic_version (version_num) VALUES (:version)"), {'version': version})
+
+
+def check_schema():
+    """
+    Compare the database with SCHEMA_VERSION (one query when they match).
+
+    Returns:
+        bool: True if the schema is at the expected version
+    """
+    version = current_schema_version()
+    if version == SCHEMA_VERSION:
+        return True
+    db.session.remove()
+
+    if version is not None:
+        logger.error(
+            f"Database schema is at {version} but this code expects {SCHEMA_VERSION}; apply the migrations"
+        )
+        return False
+
+    if not inspect(db.engine).get_table_names():
+        logger.info(f"Empty database: creating tables at schema version {SCHEMA_VERSION}")
+        db.create_all()
+        _stamp(SCHEMA_VERSION)
+        return True
+
+    logger.warning(
+        "Database schema is not versioned; creating any missing tables. "
+        f"Apply the migrations and stamp {SCHEMA_VERSION} to enable the fast startup check"
+    )
+    db.create_all()
+    return False
@@ -0,0 +1,415 @@
+"""
+Exam search.
+Searches exam titles, descriptions and question text, ranks the matches (title hits
+weigh most), keeps only exams the user may see and returns one page at a time.
+
+Two backends:
+    mysql  FULLTEXT indexes queried in boolean mode with prefix terms, so typeahead
+           lookups stay on the index instead of scanning exams with LIKE '%q%'
+    local  an in-process trigram index for SQLite and development, built by the first
+           search and then kept in sync by model events (bulk Query.delete() calls
+           included), so no request rescans the tables; it only sees this process's
+           writes, so multi-process deployments should use mysql
+
+SEARCH_BACKEND chooses one ('auto' uses mysql on MySQL and local otherwise).
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import desc, event, func, or_, select
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.orm import Session
+
+from app.membership import group_ids
+from app.models import db, Exam, Question
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TITLE_WEIGHT = 3
+MYSQL_MIN_TOKEN_LENGTH = 3  # innodb_ft_min_token_size; shorter words are not indexed
+MAX_TERMS = 8
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+class SearchResults:
+    """One page of ranked exams"""
+
+    def __init__(self, exams, total, page, per_page):
+        self.exams = exams
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def pages(self):
+        return max(1, -(-self.total // self.per_page))
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+
+class _Visibility:
+    """Which exams a user may find, as SQL criteria and as a check on indexed fields"""
+
+    def __init__(self, user):
+        self.creator_id = None
+        self.group_ids = None
+        if user.is_teacher():
+            self.creator_id = user.id
+        elif not user.is_admin():
+            self.group_ids = group_ids(user.id)
+
+    def criteria(self):
+        if self.creator_id is not None:
+            return [Exam.creator_id == self.creator_id]
+        criteria = [Exam.is_published == True]
+        if self.group_ids is not None:
+            # Ungrouped exams are open to every student, as in take_exam
+            criteria.append(or_(Exam.group_id.is_(None), Exam.group_id.in_(self.group_ids)))
+        return criteria
+
+    def allows(self, doc):
+        if self.creator_id is not None:
+            return doc['creator_id'] == self.creator_id
+        if not doc['is_published']:
+            return False
+        return self.group_ids is None or doc['group_id'] is None or doc['group_id'] in self.group_ids
+
+
+# MySQL backend
+
+def _mysql_search(terms, visibility, page, per_page):
+    indexed = [term for term in terms if len(term) >= MYSQL_MIN_TOKEN_LENGTH]
+    query_filter = visibility.criteria()
+
+    if not indexed:
+        # Too short for the FULLTEXT index: title prefix match within the visible exams
+        query = Exam.query.filter(*query_filter).filter(
+            Exam.title.startswith(' '.join(terms), autoescape=True)
+        )
+        total = query.count()
+        exams = query.order_by(Exam.id.desc()).limit(per_page).offset((page - 1) * per_page).all()
+        return exams, total
+
+    boolean_query = ' '.join(f'+{term}*' for term in indexed)
+    title_score = match(Exam.title, against=boolean_query).in_boolean_mode()
+    text_score = match(Exam.title, Exam.description, against=boolean_query).in_boolean_mode()
+    question_score = match(Question.question_text, against=boolean_query).in_boolean_mode()
+
+    question_hits = db.session.query(
+        Question.exam_id.label('exam_id'),
+        func.max(question_score).label('score')
+    ).filter(question_score > 0)\
+     .group_by(Question.exam_id)\
+     .subquery()
+
+    score = (title_score * TITLE_WEIGHT + text_score + func.coalesce(question_hits.c.score, 0)).label('score')
+    query = db.session.query(Exam, score)\
+        .outerjoin(question_hits, question_hits.c.exam_id == Exam.id)\
+        .filter(*query_filter)\
+        .filter(or_(text_score > 0, question_hits.c.exam_id.isnot(None)))
+
+    total = query.order_by(None).count()
+    rows = query.order_by(desc('score'), Exam.id.desc()).limit(per_page).offset((page - 1) * per_page).all()
+    return [exam for exam, _ in rows], total
+
+
+# Local backend
+
+def _grams(text):
+    """Trigrams of every word, plus its first one and two letters for short prefix queries"""
+    grams = set()
+    for token in tokenize(text):
+        grams.add(token[:1])
+        grams.add(token[:2])
+        grams.update(token[i:i + 3] for i in range(len(token) - 2))
+    return grams
+
+
+def _query_grams(term):
+    if len(term) < 3:
+        return {term}
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def _field_score(term, text):
+    """0 if the term is not in the text, 1 for a substring hit, 2 when a word starts with it"""
+    words = tokenize(text)
+    if len(term) < 3:
+        return 2 if any(word.startswith(term) for word in words) else 0
+    if any(word.startswith(term) for word in words):
+        return 2
+    return 1 if any(term in word for word in words) else 0
+
+
+class NgramIndex:
+    """In-process inverted trigram index over exams and their questions"""
+
+    def __init__(self):
+        self.docs = {}  # exam id -> indexed fields and question texts
+        self.postings = defaultdict(set)  # gram -> exam ids
+        self.question_exam = {}  # question id -> exam id
+        self.built_at = None
+        self.lock = threading.RLock()
+
+    def build(self):
+        exams = db.session.query(
+            Exam.id, Exam.title, Exam.description, Exam.creator_id, Exam.group_id, Exam.is_published
+        ).all()
+        questions = db.session.query(Question.id, Question.exam_id, Question.question_text).all()
+        with self.lock:
+            self.docs.clear()
+            self.postings.clear()
+            self.question_exam.clear()
+            for exam_id, title, description, creator_id, group_id, is_published in exams:
+                self.docs[exam_id] = self._new_doc(title, description, creator_id, group_id, is_published)
+            for question_id, exam_id, text in questions:
+                if exam_id in self.docs:
+                    self.docs[exam_id]['questions'][question_id] = text or ''
+                    self.question_exam[question_id] = exam_id
+            for exam_id in self.docs:
+                self._reindex(exam_id)
+            self.built_at = time.monotonic()
+
+    @staticmethod
+    def _new_doc(title, description, creator_id, group_id, is_published):
+        return {
+            'title': title or '',
+            'description': description or '',
+            'creator_id': creator_id,
+            'group_id': group_id,
+            'is_published': bool(is_published),
+            'questions': {},
+            'grams': set()
+        }
+
+    def _reindex(self, exam_id):
+        doc = self.docs[exam_id]
+        grams = _grams(doc['title']) | _grams(doc['description'])
+        for text in doc['questions'].values():
+            grams |= _grams(text)
+        for gram in doc['grams'] - grams:
+            self.postings[gram].discard(exam_id)
+        for gram in grams - doc['grams']:
+            self.postings[gram].add(exam_id)
+        doc['grams'] = grams
+
+    def _drop(self, exam_id):
+        doc = self.docs.pop(exam_id, None)
+        if doc is None:
+            return
+        for gram in doc['grams']:
+            self.postings[gram].discard(exam_id)
+        for question_id in doc['questions']:
+            self.question_exam.pop(question_id, None)
+
+    def apply(self, changes):
+        """Apply committed exam/question writes recorded by the model events"""
+        with self.lock:
+            touched = set()
+            for change in changes:
+                kind = change[0]
+                if kind == 'exam':
+                    _, exam_id, title, description, creator_id, group_id, is_published = change
+                    doc = self.docs.get(exam_id)
+                    if doc is None:
+                        self.docs[exam_id] = self._new_doc(title, description, creator_id, group_id, is_published)
+                    else:
+                        doc.update(title=title or '', description=description or '', creator_id=creator_id,
+                                   group_id=group_id, is_published=bool(is_published))
+                    touched.add(exam_id)
+                elif kind == 'exam_deleted':
+                    self._drop(change[1])
+                    touched.discard(change[1])
+                elif kind == 'question':
+                    _, question_id, exam_id, text = change
+                    previous = self.question_exam.get(question_id)
+                    if previous is not None and previous != exam_id and previous in self.docs:
+                        self.docs[previous]['questions'].pop(question_id, None)
+                        touched.add(previous)
+                    if exam_id in self.docs:
+                        self.docs[exam_id]['questions'][question_id] = text or ''
+                        self.question_exam[question_id] = exam_id
+                        touched.add(exam_id)
+                elif kind == 'question_deleted':
+                    exam_id = self.question_exam.pop(change[1], None)
+                    if exam_id in self.docs:
+                        self.docs[exam_id]['questions'].pop(change[1], None)
+                        touched.add(exam_id)
+            for exam_id in touched:
+                if exam_id in self.docs:
+                    self._reindex(exam_id)
+
+    def search(self, terms, visibility):
+        """Ranked exam ids the visibility allows, best first"""
+        with self.lock:
+            candidates = None
+            for term in terms:
+                for gram in _query_grams(term):
+                    posting = self.postings.get(gram, set())
+                    candidates = set(posting) if candidates is None else candidates & posting
+                    if not candidates:
+                        return []
+
+            ranked = []
+            for exam_id in candidates or ():
+                doc = self.docs[exam_id]
+                if not visibility.allows(doc):
+                    continue
+                score = 0
+                for term in terms:
+                    term_score = (
+                        _field_score(term, doc['title']) * TITLE_WEIGHT
+                        + _field_score(term, doc['description'])
+                        + max((_field_score(term, text) for text in doc['questions'].values()), default=0)
+                    )
+                    if not term_score:
+                        break  # Trigram false positive: every term must really occur
+                    score += term_score
+                else:
+                    ranked.append((score, exam_id))
+        ranked.sort(key=lambda item: (-item[0], -item[1]))
+        return [exam_id for _, exam_id in ranked]
+
+
+_index = NgramIndex()
+
+
+def _local_search(terms, visibility, page, per_page):
+    if _index.built_at is None:
+        _index.build()
+
+    ids = _index.search(terms, visibility)
+    page_ids = ids[(page - 1) * per_page:page * per_page]
+    if not page_ids:
+        return [], len(ids)
+    exams = {exam.id: exam for exam in Exam.query.filter(Exam.id.in_(page_ids), *visibility.criteria())}
+    return [exams[exam_id] for exam_id in page_ids if exam_id in exams], len(ids)
+
+
+def reset_local_index():
+    """Forget the local index; the next search rebuilds it"""
+    with _index.lock:
+        _index.built_at = None
+        _index.docs.clear()
+        _index.postings.clear()
+        _index.question_exam.clear()
+
+
+@event.listens_for(Exam, 'after_insert')
+@event.listens_for(Exam, 'after_update')
+def _exam_written(mapper, connection, target):
+    if _index.built_at is not None:
+        _record(target, ('exam', target.id, target.title, target.description,
+                         target.creator_id, target.group_id, target.is_published))
+
+
+@event.listens_for(Exam, 'after_delete')
+def _exam_deleted(mapper, connection, target):
+    if _index.built_at is not None:
+        _record(target, ('exam_deleted', target.id))
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+def _question_written(mapper, connection, target):
+    if _index.built_at is not None:
+        _record(target, ('question', target.id, target.exam_id, target.question_text))
+
+
+@event.listens_for(Question, 'after_delete')
+def _question_deleted(mapper, connection, target):
+    if _index.built_at is not None:
+        _record(target, ('question_deleted', target.id))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bulk_delete(orm_execute_state):
+    """Query.delete() skips the mapper events, so look up the rows it is about to remove"""
+    if _index.built_at is None or not orm_execute_state.is_delete:
+        return
+    mapper = orm_execute_state.bind_mapper
+    kinds = {Exam: 'exam_deleted', Question: 'question_deleted'}
+    if mapper is None or mapper.class_ not in kinds:
+        return
+    model = mapper.class_
+    query = select(model.id)
+    if orm_execute_state.statement.whereclause is not None:
+        query = query.where(orm_execute_state.statement.whereclause)
+    changes = orm_execute_state.session.info.setdefault('search_changes', [])
+    changes.extend((kinds[model], row_id) for row_id in orm_execute_state.session.scalars(query))
+
+
+def _record(target, change):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('search_changes', []).append(change)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    changes = session.info.pop('search_changes', None)
+    if changes:
+        _index.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('search_changes', None)
+
+
+def _backend():
+    backend = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        return 'mysql' if db.engine.dialect.name == 'mysql' else 'local'
+    return backend
+
+
+def search_exams(user, text, page=1, per_page=None):
+    """
+    Search the exams a user may see.
+
+    Args:
+        user: The searching user (teachers see their own exams, students published exams of their groups)
+        text: The search text; every word must match, as the start of a word (local: anywhere in a word)
+        page: 1-based page number
+        per_page: Page size (default SEARCH_PAGE_SIZE)
+
+    Returns:
+        SearchResults: The page of exams, best match first
+    """
+    per_page = per_page or current_app.config.get('SEARCH_PAGE_SIZE', 10)
+    page = max(page, 1)
+    terms = list(dict.fromkeys(tokenize(text)))[:MAX_TERMS]
+    if not terms:
+        return SearchResults([], 0, page, per_page)
+
+    visibility = _Visibility(user)
+    if _backend() == 'mysql':
+        exams, total = _mysql_search(terms, visibility, page, per_page)
+    else:
+        exams, total = _local_search(terms, visibility, page, per_page)
+    return SearchResults(exams, total, page, per_page)
+
+
+def question_counts(exam_ids):
+    """Number of questions per exam for a page of results, in one query"""
+    if not exam_ids:
+        return {}
+    return dict(db.session.query(Question.exam_id, func.count(Question.id))
+                .filter(Question.exam_id.in_(exam_ids))
+                .group_by(Question.exam_id))
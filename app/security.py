@@ -192,7 +192,8 @@ def login_rate_limit(max_requests=MAX_ATTEMPTS, window=RATE_LIMIT_WINDOW):
                 time_until_reset = int(window - (current_time - newest_attempt))
                 
                 flash(f'Too many login attempts. Please try again in {time_until_reset//60} minutes and {time_until_reset%60} seconds.', 'error')
-                return render_template('auth/login.html'), 429
+                from app.forms import LoginForm
+                return render_template('auth/login.html', form=LoginForm()), 429
             
             # Execute the view function and check result
             response = f(*args, **kwargs)
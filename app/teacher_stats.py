@@ -0,0 +1,152 @@
+"""
+Teacher dashboard read model.
+The exam list used to call exam.questions.count() and exam.attempts.count() per row
+(2N queries for N exams). Here the per-exam counts come from one grouped query and are
+handed to templates as plain rows, so the dashboard costs the same number of queries
+however many exams a teacher owns.
+"""
+
+from sqlalchemy import and_, case, func, or_
+
+from app.models import db, Answer, Exam, ExamAttempt, Question, QuestionOption
+from app.exam_snapshot import attempt_questions
+
+# Attempt ids per IN list when summing earned points
+EARNED_CHUNK_SIZE = 1000
+
+
+def exam_rows(teacher_id):
+    """
+    One row per exam created by a teacher, with its question and attempt counts.
+
+    Returns:
+        list: Rows with id, title, description, time_limit_minutes, is_published, created_at,
+              question_count, attempt_count, completed_count and ungraded_count
+    """
+    question_counts = db.session.query(
+        Question.exam_id.label('exam_id'),
+        func.count(Question.id).label('question_count')
+    ).join(Exam, Question.exam_id == Exam.id)\
+     .filter(Exam.creator_id == teacher_id)\
+     .group_by(Question.exam_id)\
+     .subquery()
+
+    attempt_counts = db.session.query(
+        ExamAttempt.exam_id.label('exam_id'),
+        func.count(ExamAttempt.id).label('attempt_count'),
+        func.sum(case((ExamAttempt.is_completed == True, 1), else_=0)).label('completed_count'),
+        func.sum(case(
+            ((ExamAttempt.is_completed == True) & (ExamAttempt.is_graded == False), 1), else_=0
+        )).label('ungraded_count')
+    ).join(Exam, ExamAttempt.exam_id == Exam.id)\
+     .filter(Exam.creator_id == teacher_id)\
+     .group_by(ExamAttempt.exam_id)\
+     .subquery()
+
+    return db.session.query(
+        Exam.id,
+        Exam.title,
+        Exam.description,
+        Exam.time_limit_minutes,
+        Exam.is_published,
+        Exam.created_at,
+        func.coalesce(question_counts.c.question_count, 0).label('question_count'),
+        func.coalesce(attempt_counts.c.attempt_count, 0).label('attempt_count'),
+        func.coalesce(attempt_counts.c.completed_count, 0).label('completed_count'),
+        func.coalesce(attempt_counts.c.ungraded_count, 0).label('ungraded_count')
+    ).outerjoin(question_counts, question_counts.c.exam_id == Exam.id)\
+     .outerjoin(attempt_counts, attempt_counts.c.exam_id == Exam.id)\
+     .filter(Exam.creator_id == teacher_id)\
+     .order_by(Exam.id)\
+     .all()
+
+
+def exam_totals(teacher_id):
+    """
+    Number of exams a teacher created and how many of them are published, in one query.
+
+    Returns:
+        tuple: (total, published)
+    """
+    total, published = db.session.query(
+        func.count(Exam.id),
+        func.sum(case((Exam.is_published == True, 1), else_=0))
+    ).filter(Exam.creator_id == teacher_id).one()
+    return total, int(published or 0)
+
+
+def dashboard_summary(teacher_id, rows):
+    """
+    Figures for the dashboard cards, derived from exam_rows() plus one distinct count.
+
+    Returns:
+        dict: pending_reviews and total_students
+    """
+    total_students = db.session.query(func.count(func.distinct(ExamAttempt.student_id)))\
+        .join(Exam, ExamAttempt.exam_id == Exam.id)\
+        .filter(Exam.creator_id == teacher_id)\
+        .scalar()
+    return {
+        'pending_reviews': sum(int(row.ungraded_count) for row in rows),
+        'total_students': total_students or 0
+    }
+
+
+def earned_points(attempt_ids):
+    """
+    Points earned per attempt, with one grouped query per EARNED_CHUNK_SIZE attempts.
+    MCQ answers not graded yet count when their selected option is correct, which is
+    how ExamAttempt.calculate_score() grades them.
+
+    Returns:
+        dict: attempt id -> earned points (attempts without a correct answer are absent)
+    """
+    correct = or_(
+        Answer.is_correct == True,
+        and_(Answer.is_correct.is_(None), Question.question_type == 'mcq', QuestionOption.is_correct == True)
+    )
+    earned = {}
+    for start in range(0, len(attempt_ids), EARNED_CHUNK_SIZE):
+        earned.update(db.session.query(
+            Answer.attempt_id,
+            func.sum(Question.points)
+        ).join(Question, Answer.question_id == Question.id)
+         .outerjoin(QuestionOption, Answer.selected_option_id == QuestionOption.id)
+         .filter(Answer.attempt_id.in_(attempt_ids[start:start + EARNED_CHUNK_SIZE]), correct)
+         .group_by(Answer.attempt_id)
+         .all())
+    return earned
+
+
+def attempt_scores(exam, questions, attempts, earned=None):
+    """
+    Earned/total points of an exam's completed attempts, with one grouped query for all of them
+    (ExamAttempt.calculate_score() runs two queries per attempt).
+
+    Args:
+        questions: The exam's questions (model rows or exam snapshot views)
+        earned: earned_points() of the attempts, when the caller loaded them for several exams at once
+
+    Returns:
+        dict: attempt id -> {'earned', 'total', 'percentage'}
+    """
+    completed = [attempt for attempt in attempts if attempt.is_completed]
+    if not completed:
+        return {}
+    if earned is None:
+        earned = earned_points([attempt.id for attempt in completed])
+
+    exam_total = sum(question.points for question in questions)
+    scores = {}
+    for attempt in completed:
+        total = exam_total
+        if attempt.random_seed is not None and exam.question_pool_size:
+            # Pool exams are scored over the questions drawn for each attempt
+            total = sum(question.points for question in attempt_questions(attempt, exam))
+        points = earned.get(attempt.id) or 0
+        scores[attempt.id] = {
+            'earned': points,
+            'total': total,
+            'percentage': round((points / total * 100), 2) if total > 0 else 0
+        }
+    return scores
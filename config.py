@@ -1,6 +1,8 @@
 import os
 from datetime import timedelta
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 class Config:
     # Security settings
     SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
@@ -31,6 +33,80 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
     
+    # Email outbox delivery (point MAIL_SERVER/MAIL_PORT at smtp_sink.py for local testing)
+    MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS', 2))
+    MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 50))  # Messages sent per SMTP connection
+    MAIL_RATE_LIMIT = float(os.environ.get('MAIL_RATE_LIMIT', 10))  # Messages per second per process
+    MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 5))  # Attempts before dead-lettering
+    MAIL_RETRY_BASE_SECONDS = int(os.environ.get('MAIL_RETRY_BASE_SECONDS', 30))
+    MAIL_RETRY_MAX_SECONDS = int(os.environ.get('MAIL_RETRY_MAX_SECONDS', 3600))
+    MAIL_POLL_INTERVAL = int(os.environ.get('MAIL_POLL_INTERVAL', 5))
+    
+    # Password checks run on a process pool so login bursts do not starve exam traffic
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')  # Older hashes are upgraded at login
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # 0 checks in the request thread
+    PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT', 64))  # Logins waiting or running before "busy"
+    PASSWORD_QUEUE_PER_IP = int(os.environ.get('PASSWORD_QUEUE_PER_IP', 16))  # Waiting logins per client address
+    PASSWORD_QUEUE_TIMEOUT = int(os.environ.get('PASSWORD_QUEUE_TIMEOUT', 10))  # Seconds a login waits for its check
+    
+    # Seconds a user's identity (name, email, role) is served from the process cache by the user_loader
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    USER_CACHE_CHECK_INTERVAL = int(os.environ.get('USER_CACHE_CHECK_INTERVAL', 5))  # Seconds between re-reads of the cached users' auth versions
+    
+    # Admin console: seconds the platform totals are reused, and rows per page in its user/exam tables
+    ADMIN_STATS_TTL = int(os.environ.get('ADMIN_STATS_TTL', 60))
+    ADMIN_TABLE_PAGE_SIZE = int(os.environ.get('ADMIN_TABLE_PAGE_SIZE', 25))
+    
+    # Exam search: 'mysql' (FULLTEXT), 'local' (in-process index) or 'auto' (mysql on MySQL databases)
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 10))
+    
+    # Request SQL profiler (development aid): per-request query counts, DB time and N+1 candidates
+    SQL_PROFILER = os.environ.get('SQL_PROFILER', 'false').lower() == 'true'
+    SQL_PROFILER_N1_THRESHOLD = int(os.environ.get('SQL_PROFILER_N1_THRESHOLD', 3))  # Repeats of one statement shape flagged as N+1
+    SQL_PROFILER_HISTORY = int(os.environ.get('SQL_PROFILER_HISTORY', 200))  # Requests kept for /admin/sql-profile
+    SQL_PROFILER_LOG = os.environ.get('SQL_PROFILER_LOG') or os.path.join(basedir, 'artifacts', 'sql_profile.jsonl')
+    
     # Application settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
-    ITEMS_PER_PAGE = 10
\ No newline at end of file
+    ITEMS_PER_PAGE = 10
+    
+    # Background export jobs
+    EXPORT_ARTIFACTS_DIR = os.environ.get('EXPORT_ARTIFACTS_DIR') or os.path.join(basedir, 'artifacts')
+    EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 2))
+    EXPORT_JOB_TIMEOUT = int(os.environ.get('EXPORT_JOB_TIMEOUT', 3600))  # Seconds a queued job may wait before it is considered stuck
+    EXPORT_JOB_HEARTBEAT_TIMEOUT = int(os.environ.get('EXPORT_JOB_HEARTBEAT_TIMEOUT', 300))  # Seconds without progress before a running job is failed
+    EXPORT_RETENTION_HOURS = int(os.environ.get('EXPORT_RETENTION_HOURS', 24))
+    
+    # Notification fan-out
+    FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS', 2))
+    
+    # Deadline reminders, in minutes before an exam closes (e.g. "1440,60,10")
+    REMINDER_OFFSETS = [int(value) for value in os.environ.get('REMINDER_OFFSETS', '1440,60,10').split(',') if value.strip()]
+    REMINDER_CHECK_INTERVAL = int(os.environ.get('REMINDER_CHECK_INTERVAL', 120))  # Seconds between reminder runs
+    
+    # Email digests for users who chose hourly or daily delivery
+    DIGEST_CHECK_INTERVAL = int(os.environ.get('DIGEST_CHECK_INTERVAL', 300))  # Seconds between digest runs
+    
+    # Server-sent events (/events/stream); serve with a threaded or gevent worker since each stream stays open
+    SSE_HEARTBEAT_SECONDS = int(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+    SSE_MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 300))  # Clients reconnect with Last-Event-ID
+    SSE_BUFFER_SIZE = int(os.environ.get('SSE_BUFFER_SIZE', 100))  # Events buffered per connection before a resync
+    BROADCAST_RELAY_INTERVAL = int(os.environ.get('BROADCAST_RELAY_INTERVAL', 5))  # Seconds between polls for broadcasts from other processes
+    
+    # Process role: 'web' serves requests only, 'worker' runs the periodic tasks (python scheduler.py),
+    # 'all' does both in one process (single-process deployments and local development)
+    APP_ROLE = os.environ.get('APP_ROLE', 'web')
+    SCHEMA_CHECK = os.environ.get('SCHEMA_CHECK', 'true').lower() == 'true'  # Compare alembic_version at startup
+    
+    # Background task scheduler. Only one leader runs the tasks; with several workers the others stand by
+    SCHEDULER_LEADER_CANDIDATE = os.environ.get('SCHEDULER_LEADER_CANDIDATE', 'true').lower() == 'true'
+    SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS', 4))  # Tasks that may run at the same time
+    SCHEDULER_TASK_TIMEOUT = int(os.environ.get('SCHEDULER_TASK_TIMEOUT', 600))  # Seconds before a run is reported as hung
+    SCHEDULER_LEADER_CHECK_SECONDS = int(os.environ.get('SCHEDULER_LEADER_CHECK_SECONDS', 30))
+    SCHEDULER_LOCK = os.environ.get('SCHEDULER_LOCK', 'auto')  # auto/mysql (GET_LOCK)/file
+    SCHEDULER_LOCK_NAME = os.environ.get('SCHEDULER_LOCK_NAME')  # Defaults to scheduler:<database>
+    SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE') or os.path.join(basedir, 'artifacts', 'scheduler.lock')
+    
+    # Question uploads waiting for confirmation are staged here instead of in the session
+    IMPORT_STAGING_DIR = os.environ.get('IMPORT_STAGING_DIR') or os.path.join(basedir, 'artifacts', 'imports')
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""Record per-block content digests for backups so incrementals capture updates and deletes
+
+Revision ID: add_backup_block_digests
+Revises: add_export_job_claims
+Create Date: 2026-10-22 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_backup_block_digests'
+down_revision = 'add_export_job_claims'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Runs recorded before this have no digests, so the next incremental falls back to a full backup
+    op.add_column('backup_runs', sa.Column('block_digests', sa.JSON(), nullable=True))
+    op.drop_column('backup_runs', 'watermarks')
+
+
+def downgrade():
+    op.add_column('backup_runs', sa.Column('watermarks', sa.JSON(), nullable=True))
+    op.drop_column('backup_runs', 'block_digests')
@@ -0,0 +1,34 @@
+"""Add backup_runs table for incremental backup watermarks
+
+Revision ID: add_backup_runs
+Revises: add_export_jobs
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_backup_runs'
+down_revision = 'add_export_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('backup_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('mode', sa.String(length=20), nullable=False, server_default='full'),
+        sa.Column('base_run_id', sa.Integer(), nullable=True),
+        sa.Column('watermarks', sa.JSON(), nullable=True),
+        sa.Column('row_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('artifact_path', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['base_run_id'], ['backup_runs.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('backup_runs')
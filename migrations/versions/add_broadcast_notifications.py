@@ -0,0 +1,65 @@
+"""Store group and role announcements once as broadcast notifications
+
+Revision ID: add_broadcast_notifications
+Revises: add_unread_counter
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_broadcast_notifications'
+down_revision = 'add_unread_counter'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('broadcast_notifications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('audience_type', sa.String(length=10), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('role', sa.String(length=20), nullable=True),
+        sa.Column('message', sa.String(length=255), nullable=False),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('related_id', sa.Integer(), nullable=True),
+        sa.Column('dedupe_key', sa.String(length=100), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('dedupe_key')
+    )
+    op.create_index('idx_broadcast_audience', 'broadcast_notifications',
+                    ['audience_type', 'group_id', 'role', 'id'], unique=False)
+    op.create_table('broadcast_reads',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('broadcast_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['broadcast_id'], ['broadcast_notifications.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'broadcast_id', name='uq_broadcast_read')
+    )
+    op.add_column('users', sa.Column('broadcast_read_through', sa.Integer(), nullable=False, server_default='0'))
+    # Deadline reminders are now one broadcast per exam and offset, deduplicated by dedupe_key
+    op.drop_table('reminder_ledger')
+
+
+def downgrade():
+    op.create_table('reminder_ledger',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exam_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('offset_minutes', sa.Integer(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['exam_id'], ['exams.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('exam_id', 'user_id', 'offset_minutes', name='uq_reminder_ledger')
+    )
+    op.drop_column('users', 'broadcast_read_through')
+    op.drop_table('broadcast_reads')
+    op.drop_index('idx_broadcast_audience', table_name='broadcast_notifications')
+    op.drop_table('broadcast_notifications')
@@ -0,0 +1,38 @@
+"""Add per-user email frequency and pending digest items
+
+Revision ID: add_email_digests
+Revises: add_broadcast_notifications
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_email_digests'
+down_revision = 'add_broadcast_notifications'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('email_frequency', sa.String(length=10), nullable=False, server_default='immediate'))
+    op.create_table('email_digest_items',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('category', sa.String(length=20), nullable=False),
+        sa.Column('summary', sa.String(length=255), nullable=False),
+        sa.Column('detail', sa.String(length=500), nullable=True),
+        sa.Column('related_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_digest_user_created', 'email_digest_items', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_digest_user_created', table_name='email_digest_items')
+    op.drop_table('email_digest_items')
+    op.drop_column('users', 'email_frequency')
@@ -0,0 +1,38 @@
+"""Add stored review aggregates to exams
+
+Revision ID: add_exam_rating_aggregates
+Revises: add_scheduled_task_state
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_exam_rating_aggregates'
+down_revision = 'add_scheduled_task_state'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['rating_count', 'rating_sum'] + [f'rating_{stars}_count' for stars in range(1, 6)]
+
+
+def upgrade():
+    for column in COLUMNS:
+        op.add_column('exams', sa.Column(column, sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE exams SET "
+        "rating_count = (SELECT COUNT(*) FROM exam_reviews WHERE exam_reviews.exam_id = exams.id), "
+        "rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM exam_reviews WHERE exam_reviews.exam_id = exams.id), "
+        + ", ".join(
+            f"rating_{stars}_count = (SELECT COUNT(*) FROM exam_reviews "
+            f"WHERE exam_reviews.exam_id = exams.id AND exam_reviews.rating = {stars})"
+            for stars in range(1, 6)
+        )
+    )
+
+
+def downgrade():
+    for column in reversed(COLUMNS):
+        op.drop_column('exams', column)
@@ -0,0 +1,33 @@
+"""Enforce export job dedupe in the database and record job heartbeats
+
+Revision ID: add_export_job_claims
+Revises: add_group_member_count
+Create Date: 2026-10-21 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_export_job_claims'
+down_revision = 'add_group_member_count'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('jobs', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+    op.add_column('jobs', sa.Column('active_hash', sa.String(length=64), nullable=True))
+    # Jobs in flight during the upgrade belonged to the processes being replaced
+    op.execute(
+        "UPDATE jobs SET status = 'failed', error = 'Interrupted by an upgrade', finished_at = CURRENT_TIMESTAMP "
+        "WHERE status IN ('queued', 'running')"
+    )
+    op.create_unique_constraint('uq_job_active_hash', 'jobs', ['active_hash'])
+
+
+def downgrade():
+    op.drop_constraint('uq_job_active_hash', 'jobs', type_='unique')
+    op.drop_column('jobs', 'active_hash')
+    op.drop_column('jobs', 'heartbeat_at')
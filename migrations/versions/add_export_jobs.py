@@ -0,0 +1,46 @@
+"""Add jobs table for background exports
+
+Revision ID: add_export_jobs
+Revises: add_exam_availability
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_export_jobs'
+down_revision = 'add_exam_availability'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('params', sa.JSON(), nullable=True),
+        sa.Column('params_hash', sa.String(length=64), nullable=False),
+        sa.Column('requested_by', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='queued'),
+        sa.Column('processed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('artifact_path', sa.String(length=255), nullable=True),
+        sa.Column('artifact_name', sa.String(length=255), nullable=True),
+        sa.Column('mimetype', sa.String(length=100), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['requested_by'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_job_dedupe', 'jobs', ['params_hash', 'status'])
+    op.create_index('idx_job_requester', 'jobs', ['requested_by', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('idx_job_requester', table_name='jobs')
+    op.drop_index('idx_job_dedupe', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,29 @@
+"""Add a cached member counter to groups
+
+Revision ID: add_group_member_count
+Revises: add_search_fulltext_indexes
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_group_member_count'
+down_revision = 'add_search_fulltext_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('groups', sa.Column('member_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE `groups` SET member_count = ("
+        "SELECT COUNT(*) FROM group_membership "
+        "WHERE group_membership.group_id = `groups`.id)"
+    )
+
+
+def downgrade():
+    op.drop_column('groups', 'member_count')
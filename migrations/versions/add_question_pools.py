@@ -0,0 +1,26 @@
+"""Add question pool size to exams and random seed to attempts
+
+Revision ID: add_question_pools
+Revises: add_backup_runs
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_question_pools'
+down_revision = 'add_backup_runs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('exams', sa.Column('question_pool_size', sa.Integer(), nullable=True))
+    op.add_column('exam_attempts', sa.Column('random_seed', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('exam_attempts', 'random_seed')
+    op.drop_column('exams', 'question_pool_size')
@@ -0,0 +1,33 @@
+"""Add persisted scheduler task state
+
+Revision ID: add_scheduled_task_state
+Revises: add_email_digests
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_scheduled_task_state'
+down_revision = 'add_email_digests'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scheduled_task_state',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('last_run_at', sa.DateTime(), nullable=True),
+        sa.Column('next_run_at', sa.DateTime(), nullable=True),
+        sa.Column('last_status', sa.String(length=20), nullable=True),
+        sa.Column('last_error', sa.String(length=500), nullable=True),
+        sa.Column('last_duration_ms', sa.Integer(), nullable=True),
+        sa.Column('run_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('scheduled_task_state')
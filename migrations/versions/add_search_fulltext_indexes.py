@@ -0,0 +1,27 @@
+"""Add FULLTEXT indexes for exam search
+
+Revision ID: add_search_fulltext_indexes
+Revises: add_exam_rating_aggregates
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_search_fulltext_indexes'
+down_revision = 'add_exam_rating_aggregates'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ft_exams_title', 'exams', ['title'], unique=False, mysql_prefix='FULLTEXT')
+    op.create_index('ft_exams_text', 'exams', ['title', 'description'], unique=False, mysql_prefix='FULLTEXT')
+    op.create_index('ft_questions_text', 'questions', ['question_text'], unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    op.drop_index('ft_questions_text', table_name='questions')
+    op.drop_index('ft_exams_text', table_name='exams')
+    op.drop_index('ft_exams_title', table_name='exams')
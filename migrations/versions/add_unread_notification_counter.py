@@ -0,0 +1,31 @@
+"""Add a per-user unread notification counter
+
+Revision ID: add_unread_counter
+Revises: add_reminder_ledger
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_unread_counter'
+down_revision = 'add_reminder_ledger'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('unread_notifications', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE users SET unread_notifications = ("
+        "SELECT COUNT(*) FROM notifications "
+        "WHERE notifications.user_id = users.id AND notifications.is_read = 0)"
+    )
+    op.create_index('idx_notifications_user_recent', 'notifications', ['user_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_notifications_user_recent', table_name='notifications')
+    op.drop_column('users', 'unread_notifications')
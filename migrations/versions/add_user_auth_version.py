@@ -0,0 +1,25 @@
+"""Add a per-user auth version carried by sessions
+
+Revision ID: add_user_auth_version
+Revises: restore_reminder_ledger
+Create Date: 2026-10-23 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_user_auth_version'
+down_revision = 'restore_reminder_ledger'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Bumped by password and role changes; sessions issued for an older version stop loading
+    op.add_column('users', sa.Column('auth_version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('users', 'auth_version')
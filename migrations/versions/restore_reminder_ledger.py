@@ -0,0 +1,35 @@
+"""Restore the reminder_ledger table next to deadline reminder broadcasts
+
+Revision ID: restore_reminder_ledger
+Revises: add_backup_block_digests
+Create Date: 2026-10-23 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'restore_reminder_ledger'
+down_revision = 'add_backup_block_digests'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # add_broadcast_notifications dropped the ledger; reminders record their students in it again
+    op.create_table('reminder_ledger',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exam_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('offset_minutes', sa.Integer(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['exam_id'], ['exams.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('exam_id', 'user_id', 'offset_minutes', name='uq_reminder_ledger')
+    )
+
+
+def downgrade():
+    op.drop_table('reminder_ledger')
@@ -0,0 +1,79 @@
+"""
+Bulk loader for backup archives and CSV files.
+
+Usage:
+    python restore_backup.py backup_full.tar [backup_incremental.tar ...]
+    python restore_backup.py --csv users=users.csv --csv exams=exams.csv
+
+Archives are verified against their manifest checksums before any rows are written.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the current directory to the path so we can import from the app package
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.restore import restore, RestoreError, BATCH_SIZE
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Restore backup archives or CSV files into the database')
+    parser.add_argument('archives', nargs='*', help='Backup archives, full backup first, then incrementals')
+    parser.add_argument('--csv', action='append', default=[], metavar='TABLE=PATH',
+                        help='Load a CSV file (with a header row) into a table')
+    parser.add_argument('--replace', action='store_true', help='Delete existing rows in the restored tables first')
+    parser.add_argument('--workers', type=int, default=4, help='Tables loaded in parallel')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per executemany batch')
+    parser.add_argument('--keep-indexes', action='store_true', help='Do not drop secondary indexes during the load')
+    parser.add_argument('--load-data', action='store_true',
+                        help='Use LOAD DATA LOCAL INFILE for CSV files on MySQL (needs allow_local_infile)')
+    parser.add_argument('--no-verify', action='store_true', help='Skip checksum verification')
+    return parser.parse_args(argv)
+
+
+def run_restore(argv=None):
+    """Run the bulk loader from the command line"""
+    args = parse_args(argv)
+    csv_files = {}
+    for item in args.csv:
+        table, _, path = item.partition('=')
+        if not path:
+            print(f"Invalid --csv value '{item}', expected TABLE=PATH", file=sys.stderr)
+            return 2
+        csv_files[table] = path
+
+    if not args.archives and not csv_files:
+        print("Nothing to restore.", file=sys.stderr)
+        return 2
+
+    app = create_app()
+    with app.app_context():
+        started = time.monotonic()
+        try:
+            totals = restore(
+                archives=args.archives,
+                csv_files=csv_files,
+                replace=args.replace,
+                workers=args.workers,
+                batch_size=args.batch_size,
+                rebuild_indexes=not args.keep_indexes,
+                use_load_data=args.load_data,
+                verify=not args.no_verify
+            )
+        except RestoreError as e:
+            print(f"Restore aborted: {str(e)}", file=sys.stderr)
+            return 1
+
+    elapsed = time.monotonic() - started
+    for table, count in totals.items():
+        print(f" - {table}: {count} rows")
+    print(f"Restored {sum(totals.values())} rows in {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_restore())
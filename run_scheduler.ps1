@@ -8,8 +8,8 @@ Set-Location "C:\Users\Ivermectin\Music\Tanush\Try 3"
 # Uncomment the following line if you have a virtual environment
 # & .\venv\Scripts\Activate.ps1
 
-# Run the scheduler
-python scheduler.py
+# Run every scheduled task once (or run "python scheduler.py" as a long-lived worker instead)
+python scheduler.py --once
 
 # Log completion
 Write-Output "Scheduler completed at $(Get-Date)"
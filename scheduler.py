@@ -1,6 +1,11 @@
 """
-Scheduler for periodic tasks like sending notifications about exam deadlines.
-This can be run independently via a cron job or scheduled task.
+Standalone worker for the periodic tasks (exam deadline reminders, digests, cleanups...).
+
+    python scheduler.py          # run the scheduler until SIGINT/SIGTERM
+    python scheduler.py --once   # run every task once and exit (cron / Task Scheduler)
+
+Web processes (APP_ROLE=web, the default) never run periodic tasks, so one worker like
+this must run next to them. Several workers may run; only the elected leader runs tasks.
 """
 
 import os
@@ -12,20 +17,36 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import the app and initialize it
 from app import create_app
-from app.notifications import notify_exam_deadline_approaching
+from app.background_tasks import run_scheduler_worker, run_tasks_once
+from config import Config
+
+
+class SchedulerWorkerConfig(Config):
+    # Registers the periodic tasks; the worker drives the scheduler from its main thread
+    APP_ROLE = 'worker'
+
 
 def run_scheduled_tasks():
-    """Run all scheduled tasks"""
+    """Run all scheduled tasks once"""
     print(f"[{datetime.now()}] Running scheduled tasks...")
-    
-    # Create app context
-    app = create_app()
-    with app.app_context():
-        # Send notifications about upcoming exam deadlines
-        notify_exam_deadline_approaching()
-        print(f"[{datetime.now()}] Sent notifications about upcoming exam deadlines")
-    
-    print(f"[{datetime.now()}] Scheduled tasks complete")
+
+    app = create_app(SchedulerWorkerConfig)
+    if run_tasks_once(app):
+        print(f"[{datetime.now()}] Scheduled tasks complete")
+    else:
+        print(f"[{datetime.now()}] Another scheduler is running the tasks; nothing to do")
+
+
+def run_worker():
+    """Run the scheduler until stopped"""
+    app = create_app(SchedulerWorkerConfig)
+    print(f"[{datetime.now()}] Scheduler worker started")
+    run_scheduler_worker(app)
+    print(f"[{datetime.now()}] Scheduler worker stopped")
+
 
 if __name__ == "__main__":
-    run_scheduled_tasks()
+    if '--once' in sys.argv[1:]:
+        run_scheduled_tasks()
+    else:
+        run_worker()
@@ -0,0 +1,145 @@
+"""
+Local SMTP sink for development and tests.
+Accepts every message and keeps it in memory (and prints a summary) instead of delivering it.
+
+Usage:
+    python smtp_sink.py [port]
+
+Then run the app with MAIL_SERVER=localhost, MAIL_PORT=<port> and MAIL_USE_TLS=false.
+"""
+
+import socketserver
+import sys
+import threading
+from email import message_from_bytes
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP conversation: HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        sink = self.server.sink
+        self._reply('220 smtp-sink ready')
+        mail_from, recipients = None, []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+
+            if verb == 'EHLO':
+                self._reply('250-smtp-sink')
+                self._reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self._reply('250 smtp-sink')
+            elif verb == 'MAIL':
+                mail_from, recipients = command.split(':', 1)[1].strip(' <>'), []
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip(' <>'))
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b'..') else chunk)
+                sink.record(mail_from, recipients, b''.join(data))
+                mail_from, recipients = None, []
+                self._reply('250 OK: queued')
+            elif verb == 'RSET':
+                mail_from, recipients = None, []
+                self._reply('250 OK')
+            elif verb == 'NOOP':
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class _ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class SMTPSink:
+    """
+    In-memory SMTP server.
+
+    Example:
+        with SMTPSink() as sink:
+            app.config.update(MAIL_SERVER='localhost', MAIL_PORT=sink.port)
+            ...
+            assert sink.messages[0]['to'] == ['student@example.com']
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, verbose=False):
+        self.messages = []
+        self.connections = 0
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._server = _ThreadedServer((host, port), _SMTPHandler)
+        self._server.sink = self
+        self._thread = None
+
+        original = self._server.process_request
+
+        def process_request(request, client_address):
+            with self._lock:
+                self.connections += 1
+            original(request, client_address)
+
+        self._server.process_request = process_request
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def record(self, mail_from, recipients, data):
+        message = message_from_bytes(data)
+        entry = {
+            'from': mail_from,
+            'to': list(recipients),
+            'subject': message.get('Subject'),
+            'message': message
+        }
+        with self._lock:
+            self.messages.append(entry)
+        if self.verbose:
+            print(f"From {mail_from} to {', '.join(recipients)}: {entry['subject']}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 1025
+    sink = SMTPSink(port=port, verbose=True)
+    print(f"SMTP sink listening on localhost:{port}")
+    try:
+        sink._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink._server.server_close()
@@ -1,5 +1,5 @@
 import pytest
-from app.models import User
+from app.models import db, User
 
 def test_register_and_login(client, app):    # Register a new user
     with app.app_context():
@@ -47,3 +47,123 @@ def test_logout(client, app, student_user):
     # Logout
     response = client.get('/logout', follow_redirects=True)
     assert b'logged out' in response.data or b'Login' in response.data
+
+
+def test_user_loader_caches_identity_until_the_user_changes(app, teacher_user):
+    from sqlalchemy import event
+    from app.identity import load_user, clear_identity_cache
+
+    user_id = teacher_user.get_id()
+    clear_identity_cache()
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    db.session.expunge_all()
+    assert load_user(user_id).is_teacher()
+    assert len(statements) == 1
+
+    # A later request rebuilds the user from the cache without a query
+    db.session.expunge_all()
+    user = load_user(user_id)
+    assert user.is_teacher() and user.username == 'teacher'
+    assert len(statements) == 1
+
+    user.user_type = 'admin'
+    db.session.commit()
+    new_id = user.get_id()
+    db.session.expunge_all()
+    # The role change bumped the auth version, so the old session no longer loads
+    assert load_user(user_id) is None
+    assert load_user(new_id).is_admin()
+
+
+def test_sessions_stop_loading_after_a_password_change_in_any_process(app, teacher_user):
+    from app.identity import load_user, clear_identity_cache, revalidate_identities
+    from app.models import User
+
+    clear_identity_cache()
+    user_id, old_id = teacher_user.id, teacher_user.get_id()
+    assert load_user(str(user_id)) is None  # Issued before auth versions existed
+    assert load_user(old_id).username == 'teacher'
+
+    # Another process changes the password: this process still has the old version cached
+    db.session.execute(User.__table__.update().values(auth_version=User.auth_version + 1))
+    db.session.commit()
+    db.session.expunge_all()
+    assert load_user(old_id) is not None
+    assert revalidate_identities() == 1
+    assert load_user(old_id) is None
+
+    user = User.query.get(user_id)
+    user.set_password('changed')
+    db.session.commit()
+    new_id, version = user.get_id(), user.auth_version
+    db.session.expunge_all()
+    assert load_user(f"{user_id}:{version - 1}") is None
+    assert load_user(new_id).username == 'teacher'
+
+
+def test_login_check_upgrades_outdated_hash_parameters():
+    from werkzeug.security import generate_password_hash
+    from app.passwords import verify_and_upgrade
+
+    old_hash = generate_password_hash('secret', method='pbkdf2:sha256:1000')
+    assert verify_and_upgrade(old_hash, 'wrong', 'pbkdf2:sha256') == (False, None)
+
+    matches, new_hash = verify_and_upgrade(old_hash, 'secret', 'pbkdf2:sha256')
+    assert matches and new_hash.startswith('pbkdf2:sha256:')
+    assert new_hash.split('$')[0] != 'pbkdf2:sha256:1000'
+    assert verify_and_upgrade(new_hash, 'secret', 'pbkdf2:sha256') == (True, None)
+
+
+def test_password_queue_is_bounded_and_fair_across_ips():
+    import threading
+    from werkzeug.security import generate_password_hash
+    from app.passwords import VerificationQueue
+
+    pwhash = generate_password_hash('secret', method='pbkdf2:sha256')
+    args = (pwhash, 'secret', 'pbkdf2:sha256')
+    queue = VerificationQueue(workers=1, max_pending=6, max_per_ip=3)
+    try:
+        queue.start()
+        # Pool workers never fork the threaded web process
+        assert queue.executor._mp_context.get_start_method() in ('forkserver', 'spawn')
+        checks = [(ip, queue.submit(ip, args)) for ip in ['a', 'a', 'a', 'a', 'b']]
+        # 'a' has one check running and three waiting, so its next one is turned away
+        assert queue.submit('a', args) is None
+        checks.append(('c', queue.submit('c', args)))
+        assert queue.submit('d', args) is None
+
+        order = []
+        waiters = [
+            threading.Thread(target=lambda ip=ip, check=check: check.done.wait(30) and order.append(ip))
+            for ip, check in checks
+        ]
+        for waiter in waiters:
+            waiter.start()
+        for waiter in waiters:
+            waiter.join()
+
+        assert all(check.result == (True, None) for _, check in checks)
+        # Round-robin dispatch: 'b' and 'c' do not wait behind every check of 'a'
+        assert order.index('b') < 4 and order.index('c') < 5
+    finally:
+        queue.shutdown()
+
+
+def test_password_queue_handles_checks_that_finish_before_dispatch_returns():
+    from concurrent.futures import Future
+    from app.passwords import VerificationQueue
+
+    class FinishedPool:
+        """Returns futures that are already done, so callbacks run inline"""
+        def submit(self, fn, *args):
+            future = Future()
+            future.set_result((True, None))
+            return future
+
+    queue = VerificationQueue(workers=1, max_pending=4, max_per_ip=4)
+    queue.executor = FinishedPool()
+    checks = [queue.submit('a', ('hash', 'secret', 'pbkdf2:sha256')) for _ in range(3)]
+    assert all(check.done.wait(5) and check.result == (True, None) for check in checks)
+    assert queue.pending == 0
@@ -0,0 +1,81 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from app.backup import encode_value, backup_tables
+
+
+def test_encode_value_handles_decimal_and_datetime():
+    row = {'score': Decimal('87.50'), 'started_at': datetime(2025, 5, 1, 9, 30)}
+    encoded = json.loads(json.dumps(row, default=encode_value))
+    assert encoded == {'score': '87.50', 'started_at': '2025-05-01T09:30:00'}
+
+
+def test_backup_covers_questions_and_answers(app):
+    names = [table.name for table in backup_tables()]
+    assert 'questions' in names and 'answers' in names
+    assert 'jobs' not in names and 'scheduled_task_state' not in names
+    # Parents come before children so a restore can load in order
+    assert names.index('exams') < names.index('questions') < names.index('answers')
+
+
+def test_restore_decodes_values_and_orders_levels(app):
+    from app.restore import decode_value, dependency_levels
+    tables = {table.name: table for table in backup_tables()}
+    assert decode_value(tables['exam_attempts'].c.started_at, '2025-05-01T09:30:00') == datetime(2025, 5, 1, 9, 30)
+
+    levels = [[table.name for table in level] for level in dependency_levels(list(tables.values()))]
+    level_of = {name: i for i, level in enumerate(levels) for name in level}
+    assert level_of['users'] < level_of['exams'] < level_of['questions'] < level_of['answers']
+
+
+
+def test_incremental_backup_restores_updates_and_deletes(app, teacher_user, tmp_path):
+    import pytest
+    from app.backup import run_backup
+    from app.models import db, Exam
+    from app.restore import RestoreError, read_manifest, restore
+
+    teacher_id = teacher_user.id
+    exams = [Exam(title=f'Exam {n}', time_limit_minutes=30, creator_id=teacher_id) for n in range(3)]
+    db.session.add_all(exams)
+    db.session.commit()
+    ids = [exam.id for exam in exams]
+    full, incremental = str(tmp_path / 'full.tar'), str(tmp_path / 'incremental.tar')
+    run_backup({'mode': 'full'}, full, lambda *args: None)
+
+    db.session.get(Exam, ids[0]).title = 'Exam 0 (edited)'
+    db.session.delete(db.session.get(Exam, ids[1]))
+    db.session.add(Exam(title='Exam 3', time_limit_minutes=30, creator_id=teacher_id))
+    db.session.commit()
+    run_backup({'mode': 'incremental'}, incremental, lambda *args: None)
+
+    tables = {entry['name']: entry for entry in read_manifest(incremental)['tables']}
+    assert tables['users']['chunks'] == []
+    assert [chunk['rows'] for chunk in tables['exams']['chunks']] == [3]
+
+    db.session.get(Exam, ids[2]).title = 'Changed after the backup'
+    db.session.commit()
+    db.session.remove()
+    with pytest.raises(RestoreError):
+        restore([incremental], replace=True)
+    restore([full, incremental], replace=True)
+    assert [exam.title for exam in Exam.query.order_by(Exam.id)] == ['Exam 0 (edited)', 'Exam 2', 'Exam 3']
+
+
+def test_restore_reports_load_error_when_index_rebuild_fails(app, monkeypatch):
+    import pytest
+    from sqlalchemy import Index
+    from app import restore as restore_module
+
+    def fail_load(*args, **kwargs):
+        raise ValueError('load failed')
+
+    def fail_create(self, bind, **kwargs):
+        raise RuntimeError('rebuild failed')
+
+    monkeypatch.setattr(restore_module, '_load_in_context', fail_load)
+    monkeypatch.setattr(restore_module, '_drop_indexes', lambda indexes: indexes)
+    monkeypatch.setattr(Index, 'create', fail_create)
+    with pytest.raises(ValueError, match='load failed'):
+        restore_module.restore(csv_files={'exams': 'exams.csv'})
@@ -0,0 +1,87 @@
+from smtp_sink import SMTPSink
+
+from datetime import datetime, timedelta
+
+from flask import render_template
+
+from app.models import db, EmailOutbox, DigestItem
+from app.mailer import enqueue_emails, claim_batch, deliver_batch
+from app.email import queue_new_exam_emails, new_exam_email
+from app.digest import send_email_digests
+
+
+def test_outbox_delivers_batch_over_one_connection(app, monkeypatch):
+    monkeypatch.setattr('app.mailer.wake_mail_workers', lambda: None)
+    with SMTPSink() as sink:
+        app.config.update(
+            MAIL_SERVER='127.0.0.1', MAIL_PORT=sink.port, MAIL_USE_TLS=False,
+            MAIL_SUPPRESS_SEND=False, MAIL_DEFAULT_SENDER='noreply@example.com'
+        )
+        from app import mail
+        mail.init_app(app)
+
+        queued = enqueue_emails(
+            {'recipient': f'student{i}@example.com', 'subject': 'Hello', 'text_body': 'Hi'}
+            for i in range(5)
+        )
+        assert queued == 5
+
+        items = claim_batch('test-worker', 10)
+        assert deliver_batch(items) == 5
+
+    assert sink.connections == 1
+    assert sorted(m['to'][0] for m in sink.messages) == [f'student{i}@example.com' for i in range(5)]
+    assert EmailOutbox.query.filter_by(status='sent').count() == 5
+
+
+def test_failed_delivery_is_retried_then_dead_lettered(app, monkeypatch):
+    monkeypatch.setattr('app.mailer.wake_mail_workers', lambda: None)
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=1, MAIL_SUPPRESS_SEND=False,
+                      MAIL_MAX_ATTEMPTS=2, MAIL_RETRY_BASE_SECONDS=0)
+    from app import mail
+    mail.init_app(app)
+
+    enqueue_emails([{'recipient': 'student@example.com', 'subject': 'Hello', 'text_body': 'Hi'}])
+    deliver_batch(claim_batch('test-worker', 10))
+    item = EmailOutbox.query.one()
+    assert item.status == 'pending' and item.attempts == 1
+
+    deliver_batch(claim_batch('test-worker', 10))
+    db.session.refresh(item)
+    assert item.status == 'dead' and item.attempts == 2
+
+
+def test_digest_collapses_pending_emails_per_user(app, student_user, sample_exam, monkeypatch):
+    monkeypatch.setattr('app.mailer.wake_mail_workers', lambda: None)
+    app.config['MAIL_DEFAULT_SENDER'] = 'noreply@example.com'
+    student_user.email_frequency = 'daily'
+    db.session.commit()
+
+    for _ in range(3):
+        queue_new_exam_emails([student_user], sample_exam)
+    assert EmailOutbox.query.count() == 0
+    assert DigestItem.query.count() == 3
+
+    # Nothing is sent until the oldest item has waited a full window
+    send_email_digests()
+    assert EmailOutbox.query.count() == 0
+
+    DigestItem.query.update({'created_at': datetime.utcnow() - timedelta(days=1, minutes=1)})
+    db.session.commit()
+    send_email_digests()
+
+    digest = EmailOutbox.query.one()
+    assert digest.recipient == student_user.email
+    assert digest.text_body.count(sample_exam.title) == 3
+    assert DigestItem.query.count() == 0
+
+
+def test_new_exam_email_matches_a_full_render(app, student_user, sample_exam):
+    app.config['MAIL_DEFAULT_SENDER'] = 'noreply@example.com'
+    student_user.username = "o'<brien>"
+    sample_exam.title = 'Sets & "Logic"'
+
+    with app.test_request_context():
+        message = new_exam_email(student_user, sample_exam)
+        assert message['text_body'] == render_template('email/new_exam.txt', user=student_user, exam=sample_exam)
+        assert message['html_body'] == render_template('email/new_exam.html', user=student_user, exam=sample_exam)
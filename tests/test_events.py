@@ -0,0 +1,46 @@
+from app.events import event_stream, publish_event, broker
+
+
+def _event_type(chunk):
+    return next(line[7:] for line in chunk.split('\n') if line.startswith('event: '))
+
+
+def test_stream_delivers_published_events_and_heartbeats():
+    stream = event_stream(101, heartbeat=0.05, max_seconds=5)
+    assert next(stream).startswith('retry:')
+
+    publish_event([101, 102], 'notification', {'unread_delta': 1})
+    assert _event_type(next(stream)) == 'notification'
+    assert next(stream) == ': keep-alive\n\n'
+
+    stream.close()
+    assert broker.connection_count() == 0
+
+
+def test_reconnect_replays_missed_events():
+    stream = event_stream(103, heartbeat=0.05, max_seconds=5)
+    next(stream)
+    publish_event([103], 'notification')
+    last_id = next(stream).split('\n')[0][len('id: '):]
+    stream.close()
+
+    publish_event([103], 'exam_published', {'exam_id': 1})
+    stream = event_stream(103, last_id, heartbeat=0.05, max_seconds=5)
+    next(stream)
+    assert _event_type(next(stream)) == 'exam_published'
+    stream.close()
+
+    # An id from another process or an earlier restart cannot be replayed
+    stream = event_stream(103, 'ffffffff-1', heartbeat=0.05, max_seconds=5)
+    next(stream)
+    assert _event_type(next(stream)) == 'resync'
+    stream.close()
+
+
+def test_slow_client_buffer_is_bounded():
+    stream = event_stream(104, heartbeat=0.05, max_seconds=5, buffer_size=2)
+    next(stream)
+    for _ in range(5):
+        publish_event([104], 'notification')
+    assert _event_type(next(stream)) == 'resync'
+    stream.close()
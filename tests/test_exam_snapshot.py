@@ -0,0 +1,27 @@
+from app.exam_snapshot import QuestionView, OptionView, select_questions
+
+
+def _questions(count):
+    return tuple(
+        QuestionView(
+            id=i, exam_id=1, question_text=f'Q{i}', question_type='mcq', points=1, order=i,
+            options=tuple(OptionView(i * 10 + j, i, f'O{j}', j == 0, j) for j in range(4))
+        )
+        for i in range(1, count + 1)
+    )
+
+
+def test_same_seed_draws_same_questions_and_options():
+    questions = _questions(20)
+    first = select_questions(questions, 1234, pool_size=5, shuffle=True)
+    again = select_questions(questions, 1234, pool_size=5, shuffle=True)
+    assert len(first) == 5
+    assert first == again
+    assert [q.id for q in select_questions(questions, 99, pool_size=5, shuffle=True)] != [q.id for q in first]
+
+
+def test_pool_without_shuffle_keeps_authored_order():
+    questions = _questions(10)
+    drawn = select_questions(questions, 42, pool_size=4, shuffle=False)
+    assert [q.order for q in drawn] == sorted(q.order for q in drawn)
+    assert select_questions(questions, None, pool_size=4, shuffle=True) == list(questions)
@@ -0,0 +1,95 @@
+from app.jobs import params_hash
+from app.models import ExportJob
+
+
+def test_params_hash_is_order_independent():
+    first = params_hash('gradebook', {'group_id': 1, 'exam_id': None}, 7)
+    second = params_hash('gradebook', {'exam_id': None, 'group_id': 1}, 7)
+    assert first == second
+    assert first != params_hash('gradebook', {'group_id': 1, 'exam_id': None}, 8)
+
+
+def test_export_exams_queues_job(auth_client, sample_exam):
+    response = auth_client.get('/teacher/exams/export')
+    assert response.status_code == 302
+    assert '/jobs/' in response.location
+
+    job = ExportJob.query.filter_by(kind='exams').first()
+    assert job is not None
+    assert job.params == {'teacher_id': sample_exam.creator_id}
+
+
+def test_identical_requests_share_one_active_job(app, teacher_user):
+    import pytest
+    from datetime import datetime, timedelta
+    from sqlalchemy.exc import IntegrityError
+    from app.jobs import _update_job, enqueue_job
+    from app.models import db
+
+    digest = params_hash('exams', {'teacher_id': teacher_user.id}, teacher_user.id)
+    db.session.add_all([
+        ExportJob(kind='exams', params_hash=digest, active_hash=digest, requested_by=teacher_user.id),
+        ExportJob(kind='exams', params_hash=digest, active_hash=digest, requested_by=teacher_user.id)
+    ])
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+    # A running job that stopped reporting progress is failed and the request gets a new job
+    stuck = ExportJob(kind='exams', params_hash=digest, active_hash=digest, requested_by=teacher_user.id,
+                      status='running', heartbeat_at=datetime.utcnow() - timedelta(hours=1))
+    db.session.add(stuck)
+    db.session.commit()
+    job = enqueue_job('exams', {'teacher_id': teacher_user.id}, teacher_user.id)
+    assert job.id != stuck.id
+    db.session.expire_all()
+    assert (stuck.status, stuck.active_hash) == ('failed', None)
+
+    # Only one process can claim a queued job
+    queued = ExportJob(kind='exams', params_hash='x' * 64, requested_by=teacher_user.id)
+    db.session.add(queued)
+    db.session.commit()
+    assert _update_job(queued.id, expected_status='queued', status='running')
+    assert not _update_job(queued.id, expected_status='queued', status='running')
+
+
+def test_exam_export_scores_pool_attempts_and_ungraded_mcq(app, teacher_user, student_user, tmp_path):
+    import csv
+    from app.export import export_exams
+    from app.exam_snapshot import attempt_questions
+    from app.models import db, Answer, Exam, ExamAttempt, Question, QuestionOption
+
+    plain = Exam(title='Plain', time_limit_minutes=30, creator_id=teacher_user.id, is_published=True)
+    pool = Exam(title='Pool', time_limit_minutes=30, creator_id=teacher_user.id, is_published=True,
+                question_pool_size=1)
+    db.session.add_all([plain, pool])
+    db.session.flush()
+    options = {}
+    for exam in (plain, pool):
+        for order in (1, 2):
+            question = Question(exam_id=exam.id, question_text=f'Q{order}', question_type='mcq', points=2, order=order)
+            db.session.add(question)
+            db.session.flush()
+            option = QuestionOption(question_id=question.id, option_text='Right', is_correct=True, order=1)
+            db.session.add(option)
+            db.session.flush()
+            options[question.id] = option.id
+
+    # Plain exam: an MCQ answer not graded yet still counts once its option is correct
+    attempt = ExamAttempt(exam_id=plain.id, student_id=student_user.id, is_completed=True)
+    pool_attempt = ExamAttempt(exam_id=pool.id, student_id=student_user.id, is_completed=True, random_seed=7)
+    db.session.add_all([attempt, pool_attempt])
+    db.session.flush()
+    first = Question.query.filter_by(exam_id=plain.id, order=1).one()
+    db.session.add(Answer(attempt_id=attempt.id, question_id=first.id, selected_option_id=options[first.id]))
+    # Pool exam: the one drawn question is the whole total
+    drawn = attempt_questions(pool_attempt, pool)[0]
+    db.session.add(Answer(attempt_id=pool_attempt.id, question_id=drawn.id, selected_option_id=options[drawn.id],
+                          is_correct=True))
+    db.session.commit()
+
+    path = tmp_path / 'exams.csv'
+    export_exams({'teacher_id': teacher_user.id}, str(path), lambda *args: None)
+    with open(path, newline='', encoding='utf-8') as f:
+        averages = {row['Title']: row['Avg Score'] for row in csv.DictReader(f)}
+    assert averages == {'Plain': '50.0', 'Pool': '100.0'}
@@ -0,0 +1,27 @@
+from app.models import db, Group
+from app.membership import add_member, group_ids, is_member, remove_member, reconcile_member_counts
+
+
+def test_membership_changes_keep_the_cached_count(app, teacher_user, student_user):
+    group = Group(name='Class A', code='CLSA01', teacher_id=teacher_user.id)
+    db.session.add(group)
+    db.session.commit()
+
+    with app.test_request_context():
+        assert not is_member(student_user.id, group.id)
+        assert add_member(student_user.id, group.id)
+        assert not add_member(student_user.id, group.id)
+        db.session.commit()
+        assert is_member(student_user.id, group.id)
+        assert group_ids(student_user.id) == {group.id}
+        assert group.member_count == 1
+
+        assert remove_member(student_user.id, group.id)
+        db.session.commit()
+        assert not is_member(student_user.id, group.id)
+        assert group.member_count == 0
+
+    group.member_count = 5
+    db.session.commit()
+    reconcile_member_counts()
+    assert group.member_count == 0
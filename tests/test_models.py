@@ -19,3 +19,22 @@ def test_exam_average_rating(app, teacher_user):
     db.session.add_all([review1, review2])
     db.session.commit()
     assert exam.get_average_rating() == 3.0
+
+def test_exam_rating_aggregates_follow_review_changes(app, teacher_user, student_user):
+    from app.models import db
+    exam = Exam(title='Exam', description='desc', time_limit_minutes=30, creator_id=teacher_user.id, is_published=True)
+    db.session.add(exam)
+    db.session.commit()
+    review = ExamReview(exam_id=exam.id, student_id=student_user.id, rating=5)
+    db.session.add_all([review, ExamReview(exam_id=exam.id, student_id=teacher_user.id, rating=4)])
+    db.session.commit()
+    assert (exam.rating_count, exam.rating_sum) == (2, 9)
+    # A student changing their review moves it between stars
+    review.rating = 1
+    db.session.commit()
+    assert (exam.rating_count, exam.rating_sum) == (2, 5)
+    assert exam.get_rating_counts() == {5: 0, 4: 1, 3: 0, 2: 0, 1: 1}
+    db.session.delete(review)
+    db.session.commit()
+    assert exam.get_average_rating() == 4.0
+    assert exam.get_rating_counts()[1] == 0
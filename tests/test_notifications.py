@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+
+from app.models import (
+    db, User, Group, GroupMembership, Notification, ExamAttempt, BroadcastNotification, ReminderLedger
+)
+from app.notifications import (
+    exam_recipients, bulk_send_notifications, notify_exam_deadline_approaching,
+    send_notification, mark_notifications_read, notification_history,
+    unread_total, mark_broadcast_notification_read, mark_all_notifications_read
+)
+from app.broadcasts import create_broadcast, publish_broadcast, BroadcastRelay
+from app.events import event_stream
+
+
+def test_new_exam_recipients_are_group_members(app, teacher_user, student_user, sample_exam):
+    outsider = User(username='outsider', email='outsider@example.com', user_type='student')
+    outsider.set_password('password')
+    group = Group(name='Algebra', code='ALG101', teacher_id=teacher_user.id)
+    db.session.add_all([outsider, group])
+    db.session.flush()
+    db.session.add(GroupMembership(user_id=student_user.id, group_id=group.id))
+    sample_exam.group_id = group.id
+    db.session.commit()
+
+    recipients = exam_recipients(sample_exam)
+    assert [r.id for r in recipients] == [student_user.id]
+
+    assert bulk_send_notifications([r.id for r in recipients], 'New exam', 'new_exam', sample_exam.id) == 1
+    assert Notification.query.filter_by(user_id=outsider.id).count() == 0
+
+
+def test_deadline_reminders_are_sent_once_per_offset(app, student_user, sample_exam):
+    finished = User(username='finished', email='finished@example.com', user_type='student')
+    finished.set_password('password')
+    db.session.add(finished)
+    db.session.flush()
+    db.session.add(ExamAttempt(exam_id=sample_exam.id, student_id=finished.id, is_completed=True))
+    sample_exam.is_published = True
+    sample_exam.available_until = datetime.utcnow() + timedelta(hours=5)
+    db.session.commit()
+
+    assert notify_exam_deadline_approaching() == 1
+    assert notify_exam_deadline_approaching() == 0
+
+    sample_exam.available_until = datetime.utcnow() + timedelta(minutes=30)
+    db.session.commit()
+    assert notify_exam_deadline_approaching() == 1
+
+    # Stored once per exam and offset, not once per student; the ledger records who was reminded
+    assert BroadcastNotification.query.filter_by(type='exam_ending').count() == 2
+    assert sorted(row.offset_minutes for row in ReminderLedger.query.filter_by(user_id=student_user.id)) == [60, 1440]
+    assert ReminderLedger.query.filter_by(user_id=finished.id).count() == 0
+    reminders, _ = notification_history(student_user)
+    assert [item.type for item in reminders] == ['exam_ending', 'exam_ending']
+    assert notification_history(finished)[0] == []
+
+
+def test_unread_counter_follows_inserts_and_reads(app, student_user):
+    for i in range(3):
+        send_notification(student_user.id, f'Message {i}', 'info')
+    bulk_send_notifications([student_user.id], 'Bulk', 'info')
+    db.session.refresh(student_user)
+    assert student_user.unread_notifications == 4
+
+    first = Notification.query.filter_by(user_id=student_user.id).first()
+    assert mark_notifications_read(student_user.id, first.id) == 1
+    assert mark_notifications_read(student_user.id, first.id) == 0
+    db.session.refresh(student_user)
+    assert student_user.unread_notifications == 3
+
+    mark_notifications_read(student_user.id)
+    db.session.refresh(student_user)
+    assert student_user.unread_notifications == 0
+
+
+def test_notification_history_uses_keyset_pages(app, student_user):
+    bulk_send_notifications([student_user.id] * 5, 'Hello', 'info')
+    create_broadcast('Announcement', 'info', role='student')
+    page, cursor = notification_history(student_user, per_page=4)
+    assert len(page) == 4 and cursor is not None
+
+    older, cursor = notification_history(student_user, before=cursor, per_page=4)
+    assert len(older) == 2 and cursor is None
+    seen = [(item.kind, item.id) for item in page + older]
+    assert len(set(seen)) == 6
+    assert [kind for kind, _ in seen].count('broadcast') == 1
+
+
+def test_broadcast_read_state_uses_watermark_and_read_set(app, teacher_user, student_user):
+    group = Group(name='Physics', code='PHY101', teacher_id=teacher_user.id)
+    db.session.add(group)
+    db.session.flush()
+    db.session.add(GroupMembership(user_id=student_user.id, group_id=group.id,
+                                   joined_at=datetime.utcnow() - timedelta(days=1)))
+    db.session.commit()
+
+    first = create_broadcast('Quiz 1 published', 'new_exam', group_id=group.id)
+    create_broadcast('Quiz 2 published', 'new_exam', group_id=group.id)
+    assert unread_total(student_user) == 2
+    assert unread_total(teacher_user) == 0
+
+    assert mark_broadcast_notification_read(student_user, first.id) == 1
+    assert mark_broadcast_notification_read(student_user, first.id) == 0
+    assert unread_total(student_user) == 1
+
+    mark_all_notifications_read(student_user)
+    db.session.refresh(student_user)
+    assert unread_total(student_user) == 0
+    latest = BroadcastNotification.query.order_by(BroadcastNotification.id.desc()).first()
+    assert student_user.broadcast_read_through == latest.id
+
+
+def test_relay_pushes_broadcasts_created_by_other_processes(app, student_user):
+    import app.broadcasts as broadcasts
+    relay = BroadcastRelay(app, interval=1)
+    stream = event_stream(student_user.id, heartbeat=0.05, max_seconds=5)
+    next(stream)
+    try:
+        assert relay.poll() == 0  # Starts from the newest broadcast
+
+        # Posted by the scheduler worker: only the relay reaches this process's streams
+        create_broadcast('Exam ends soon', 'exam_ending', role='student')
+        assert relay.poll() == 1
+        assert 'event: notification' in next(stream)
+
+        # Already pushed here by the process that created it, so not pushed twice
+        broadcasts._relay = relay
+        publish_broadcast(create_broadcast('New exam', 'new_exam', role='student'))
+        assert 'event: notification' in next(stream)
+        assert relay.poll() == 0
+    finally:
+        broadcasts._relay = None
+        stream.close()
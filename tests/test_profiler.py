@@ -0,0 +1,24 @@
+from app.profiler import RequestProfile, statement_shape
+
+
+def test_statement_shape_collapses_literals_and_in_lists():
+    assert statement_shape("SELECT * FROM users\n  WHERE id IN (?, ?, ?) AND name = 'o''brien' AND age > 30") == \
+        "SELECT * FROM users WHERE id IN (?) AND name = ? AND age > ?"
+    assert statement_shape("SELECT * FROM answers WHERE attempt_id = %s") == \
+        statement_shape("SELECT  *  FROM answers WHERE attempt_id = %s")
+
+
+def test_repeated_shapes_are_flagged_as_n_plus_one():
+    profile = RequestProfile()
+    profile.record("SELECT * FROM exams", (), 0.002)
+    for attempt_id in (1, 2, 3, 3):
+        profile.record("SELECT * FROM answers WHERE attempt_id = ?", (attempt_id,), 0.001)
+
+    summary = profile.summary(threshold=3)
+    assert summary['queries'] == 5
+    assert summary['db_ms'] == 6.0
+    assert [(item['shape'], item['count']) for item in summary['n_plus_one']] == [
+        ("SELECT * FROM answers WHERE attempt_id = ?", 4)
+    ]
+    assert [(item['parameters'], item['count']) for item in summary['duplicates']] == [("(3,)", 2)]
+    assert profile.summary(threshold=5)['n_plus_one'] == []
@@ -0,0 +1,28 @@
+import pytest
+
+from app.question_import import parse_questions, ImportValidationError
+
+
+def test_parse_questions_reports_every_bad_row(tmp_path):
+    path = tmp_path / 'questions.csv'
+    path.write_text(
+        'question_text,question_type,points,options,correct_answer\n'
+        '"What is 2+2?",mcq,5,"2|3|4|5",2\n'
+        ',text,10,,\n'
+        '"Pick one",mcq,1,"a|b",7\n'
+    )
+    with pytest.raises(ImportValidationError) as excinfo:
+        parse_questions(str(path))
+    assert [error.split(':')[0] for error in excinfo.value.errors] == ['Row 3', 'Row 4']
+
+
+def test_parse_questions_accepts_valid_file(tmp_path):
+    path = tmp_path / 'questions.csv'
+    path.write_text(
+        'question_text,question_type,points,options,correct_answer\n'
+        '"What is 2+2?",mcq,5,"2|3|4|5",2\n'
+        '"Explain recursion.",text,10,,\n'
+    )
+    questions = parse_questions(str(path))
+    assert [q['question_type'] for q in questions] == ['mcq', 'text']
+    assert questions[0]['options'] == ['2', '3', '4', '5'] and questions[0]['correct_answer'] == 2
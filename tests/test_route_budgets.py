@@ -0,0 +1,115 @@
+"""
+Query-count and latency budgets for the busiest routes.
+Each route runs against a seeded class (30 students, 12 questions, 15 graded attempts),
+so a per-row query (N+1) or a full-table load overshoots its budget by a wide margin.
+Statements are counted with the request SQL profiler. Latency budgets are generous
+wall-clock ceilings; scale them with ROUTE_BUDGET_SLACK on slow machines.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import profiler
+from app.models import db, User, Exam, Question, QuestionOption, ExamAttempt, Answer, Group, GroupMembership
+
+STUDENTS = 30
+QUESTIONS = 12
+LATENCY_SLACK = float(os.environ.get('ROUTE_BUDGET_SLACK', 1))
+
+
+@pytest.fixture
+def budget_data(app, teacher_user, student_user):
+    app.config['SQL_PROFILER_LOG'] = None
+    profiler.init_profiler(app)
+
+    group = Group(name='Budget Class', code='BUDG01', teacher_id=teacher_user.id, member_count=STUDENTS + 1)
+    db.session.add(group)
+    db.session.flush()
+    exam = Exam(title='Budget Exam', description='Seeded for route budgets', time_limit_minutes=60,
+                creator_id=teacher_user.id, group_id=group.id, is_published=True)
+    db.session.add(exam)
+    db.session.flush()
+
+    correct_options = {}
+    for number in range(QUESTIONS):
+        question = Question(exam_id=exam.id, question_text=f'Question {number}?', question_type='mcq',
+                            points=2, order=number + 1)
+        db.session.add(question)
+        db.session.flush()
+        options = [QuestionOption(question_id=question.id, option_text=f'Option {choice}',
+                                  is_correct=(choice == 0), order=choice) for choice in range(4)]
+        db.session.add_all(options)
+        db.session.flush()
+        correct_options[question.id] = options[0].id
+
+    db.session.add(GroupMembership(user_id=student_user.id, group_id=group.id))
+    finished = datetime.utcnow()
+    for number in range(STUDENTS):
+        student = User(username=f'budget{number}', email=f'budget{number}@example.com',
+                       user_type='student', password_hash='-')
+        db.session.add(student)
+        db.session.flush()
+        db.session.add(GroupMembership(user_id=student.id, group_id=group.id))
+        if number % 2:
+            continue
+        attempt = ExamAttempt(exam_id=exam.id, student_id=student.id, started_at=finished - timedelta(minutes=30),
+                              completed_at=finished, submitted_at=finished, is_completed=True, is_graded=True,
+                              score=50)
+        db.session.add(attempt)
+        db.session.flush()
+        db.session.add_all([
+            Answer(attempt_id=attempt.id, question_id=question_id, selected_option_id=option_id,
+                   is_correct=bool(index % 2))
+            for index, (question_id, option_id) in enumerate(correct_options.items())
+        ])
+    db.session.commit()
+    profiler.clear_profiles()
+    return {'exam_id': exam.id, 'options': correct_options}
+
+
+def login(client, username):
+    client.post('/login', data={'username': username, 'password': 'password'}, follow_redirects=True)
+
+
+def assert_within_budget(response, max_queries, max_ms=500, status=200):
+    """Check the status and the profile of the request that produced `response`"""
+    assert response.status_code == status
+    profile = profiler.recent_profiles(limit=1)[0]
+    candidates = '\n'.join(f"{item['count']}x {item['shape']}" for item in profile['n_plus_one'])
+    assert profile['queries'] <= max_queries, \
+        f"{profile['path']} ran {profile['queries']} statements (budget {max_queries})\n{candidates}"
+    assert profile['total_ms'] <= max_ms * LATENCY_SLACK, \
+        f"{profile['path']} took {profile['total_ms']} ms (budget {max_ms * LATENCY_SLACK} ms)"
+
+
+def test_teacher_route_budgets(client, budget_data):
+    exam_id = budget_data['exam_id']
+    login(client, 'teacher')
+
+    assert_within_budget(client.get('/dashboard'), 6)
+    assert_within_budget(client.get(f'/teacher/exams/{exam_id}'), 10)
+    assert_within_budget(client.get(f'/teacher/exams/{exam_id}/analytics'), 8)
+    assert_within_budget(client.get('/teacher/gradebook'), 8)
+    assert_within_budget(client.get('/search?q=Budget'), 7)
+
+
+def test_student_route_budgets(client, budget_data):
+    exam_id = budget_data['exam_id']
+    answers = {f'answer_{question_id}': str(option_id) for question_id, option_id in budget_data['options'].items()}
+    ajax = {'X-Requested-With': 'XMLHttpRequest'}
+    login(client, 'student')
+
+    assert_within_budget(client.get('/dashboard'), 8)
+    assert_within_budget(client.get('/search?q=Budget'), 7)
+    assert_within_budget(client.get(f'/student/exams/{exam_id}/take'), 15)
+    assert_within_budget(client.get(f'/student/exams/{exam_id}/take'), 10)
+
+    # The first autosave inserts one row per answer; later ones only update what changed
+    assert_within_budget(client.post(f'/student/exams/{exam_id}/take', data=answers, headers=ajax), QUESTIONS + 12)
+    assert_within_budget(client.post(f'/student/exams/{exam_id}/take', data=answers, headers=ajax), 12)
+
+    response = client.post(f'/student/exams/{exam_id}/take', data=dict(answers, submit_exam='1'))
+    assert_within_budget(response, 20, max_ms=1000)
+    assert response.get_json()['success']
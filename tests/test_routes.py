@@ -1,5 +1,7 @@
 import pytest
 
+from app.models import db
+
 def test_dashboard_access(client, student_user):
     # Login as student
     client.post('/login', data={
@@ -19,3 +21,55 @@ def test_search_functionality(auth_client, sample_exam):
     response = auth_client.get('/search?q=Test')
     assert response.status_code == 200
     assert b'Test Exam' in response.data
+
+def test_paged_exam_delivers_questions_as_fragments(client, student_user, sample_exam):
+    sample_exam.one_question_at_time = True
+    db.session.commit()
+    client.post('/login', data={
+        'username': 'student',
+        'password': 'password'
+    }, follow_redirects=True)
+    response = client.get(f'/student/exams/{sample_exam.id}/take')
+    assert response.status_code == 200
+    assert b'Question 1 of 1' in response.data
+
+    data = client.get(f'/student/exams/{sample_exam.id}/questions/1').get_json()
+    assert data['success'] and data['total'] == 1
+    assert 'What is 2+2?' in data['html']
+    assert client.get(f'/student/exams/{sample_exam.id}/questions/2').status_code == 404
+
+def test_teacher_dashboard_counts_come_from_one_row_per_exam(auth_client, teacher_user, student_user, sample_exam):
+    from app.models import ExamAttempt, User
+    from app.teacher_stats import exam_rows
+    other = User(username='other', email='other@example.com', user_type='student', password_hash='-')
+    db.session.add(other)
+    db.session.flush()
+    db.session.add_all([
+        ExamAttempt(exam_id=sample_exam.id, student_id=student_user.id, is_completed=True, is_graded=False),
+        ExamAttempt(exam_id=sample_exam.id, student_id=other.id, is_completed=False)
+    ])
+    db.session.commit()
+    [row] = exam_rows(teacher_user.id)
+    assert (row.question_count, row.attempt_count, row.completed_count, row.ungraded_count) == (1, 2, 1, 1)
+
+    response = auth_client.get('/dashboard')
+    assert response.status_code == 200
+    assert b'Test Exam' in response.data
+
+def test_admin_tables_are_paged_fragments(app, client, admin_user, student_user, sample_exam):
+    app.config['ADMIN_TABLE_PAGE_SIZE'] = 1
+    client.post('/login', data={
+        'username': 'admin',
+        'password': 'password'
+    }, follow_redirects=True)
+    response = client.get('/admin/dashboard')
+    assert response.status_code == 200
+    assert b'id="users-table"' in response.data
+
+    fragment = client.get('/admin/users/table?role=student')
+    assert b'student@example.com' in fragment.data
+    assert b'admin@example.com' not in fragment.data
+    assert b'<html' not in fragment.data
+
+    fragment = client.get('/admin/exams/table?q=Test&status=published')
+    assert b'Test Exam' in fragment.data
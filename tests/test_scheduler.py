@@ -0,0 +1,41 @@
+from app import background_tasks
+from app.background_tasks import FileLeaderLock, register_task, run_tasks_once
+from app.models import ScheduledTaskState
+
+
+def test_file_lock_allows_one_leader(tmp_path):
+    path = str(tmp_path / 'locks' / 'scheduler.lock')
+    first, second = FileLeaderLock(path), FileLeaderLock(path)
+
+    assert first.acquire()
+    assert not second.acquire()
+
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_run_tasks_once_persists_state(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(background_tasks, 'tasks', {})
+    app.config.update(SCHEDULER_LOCK='file', SCHEDULER_LOCK_FILE=str(tmp_path / 'scheduler.lock'))
+    calls = []
+    register_task(lambda: calls.append(1), 3600, 'hourly_job')
+    register_task(lambda: (False, 'nothing to do'), 60, 'failing_job')
+    register_task(lambda: calls.append(2), 60, 'process_job', leader_only=False)
+
+    assert run_tasks_once(app)
+    assert calls == [1]
+
+    hourly = ScheduledTaskState.query.get('hourly_job')
+    assert hourly.last_status == 'ok'
+    assert (hourly.next_run_at - hourly.last_run_at).total_seconds() == 3600
+    failing = ScheduledTaskState.query.get('failing_job')
+    assert failing.last_status == 'failed'
+    assert failing.last_error == 'nothing to do'
+    assert ScheduledTaskState.query.get('process_job') is None
+
+    # A second invocation is refused while another process holds leadership
+    other = background_tasks.FileLeaderLock(app.config['SCHEDULER_LOCK_FILE'])
+    assert other.acquire()
+    assert not run_tasks_once(app)
+    other.release()
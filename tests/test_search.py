@@ -0,0 +1,65 @@
+from app.models import db, Exam, Group, GroupMembership
+from app.search import NgramIndex, _index, reset_local_index, search_exams
+
+
+class _Everyone:
+    def allows(self, doc):
+        return doc['is_published']
+
+
+def test_local_index_ranks_title_hits_and_follows_changes():
+    index = NgramIndex()
+    index.apply([
+        ('exam', 1, 'Algebra midterm', 'Linear equations', 7, None, True),
+        ('exam', 2, 'Weekly quiz', 'Algebra warm-up', 7, None, True),
+        ('exam', 3, 'Algebra draft', None, 7, None, False),
+        ('question', 10, 2, 'Solve the quadratic'),
+    ])
+    assert index.search(['algebra'], _Everyone()) == [1, 2]
+    assert index.search(['quadr'], _Everyone()) == [2]
+    assert index.search(['al', 'mid'], _Everyone()) == [1]
+
+    index.apply([('question_deleted', 10), ('exam_deleted', 1)])
+    assert index.search(['quadr'], _Everyone()) == []
+    assert index.search(['algebra'], _Everyone()) == [2]
+
+
+def test_students_only_find_exams_of_their_groups(client, teacher_user, student_user, sample_exam):
+    reset_local_index()
+    group = Group(name='Class A', code='CLSA01', teacher_id=teacher_user.id)
+    other = Group(name='Class B', code='CLSB01', teacher_id=teacher_user.id)
+    db.session.add_all([group, other])
+    db.session.flush()
+    hidden = Exam(title='Test Exam (other class)', description='Not for you', time_limit_minutes=30,
+                  creator_id=teacher_user.id, is_published=True, group_id=other.id)
+    open_exam = Exam(title='Test Exam (everyone)', description='No group', time_limit_minutes=30,
+                     creator_id=teacher_user.id, is_published=True)
+    sample_exam.group_id = group.id
+    db.session.add_all([hidden, open_exam, GroupMembership(user_id=student_user.id, group_id=group.id)])
+    db.session.commit()
+
+    client.post('/login', data={
+        'username': 'student',
+        'password': 'password'
+    }, follow_redirects=True)
+    response = client.get('/search?q=test', headers={'HX-Request': 'true'})
+    assert response.status_code == 200
+    assert b'This is a test exam' in response.data
+    assert b'everyone' in response.data
+    assert b'other class' not in response.data
+
+
+def test_local_index_follows_bulk_deletes_without_rebuilding(app, teacher_user, sample_exam):
+    reset_local_index()
+    assert [exam.id for exam in search_exams(teacher_user, 'test').exams] == [sample_exam.id]
+    built_at = _index.built_at
+
+    extra = Exam(title='Test Exam (extra)', time_limit_minutes=30, creator_id=teacher_user.id)
+    db.session.add(extra)
+    db.session.commit()
+    assert search_exams(teacher_user, 'extra').total == 1
+
+    Exam.query.filter_by(id=extra.id).delete()
+    db.session.commit()
+    assert search_exams(teacher_user, 'extra').total == 0
+    assert _index.built_at == built_at
@@ -0,0 +1,70 @@
+import os
+import re
+import subprocess
+import sys
+
+from app.schema import SCHEMA_VERSION
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold start budget for importing the app package, measured with python -X importtime
+IMPORT_BUDGET_SECONDS = 1.5
+
+STARTUP_SCRIPT = """
+import sys
+from config import Config
+from app import create_app
+
+class WebConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SCHEMA_CHECK = False
+    APP_ROLE = 'web'
+
+create_app(WebConfig)
+print(' '.join(sorted(sys.modules)))
+"""
+
+
+def _cold_start():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout.split(), result.stderr
+
+
+def test_web_process_cold_start_within_budget():
+    modules, importtime = _cold_start()
+
+    cumulative = re.search(r"^import time:\s+\d+ \|\s+(\d+) \| app$", importtime, re.MULTILINE)
+    assert int(cumulative.group(1)) / 1e6 < IMPORT_BUDGET_SECONDS
+
+    # Migration tooling and the periodic task machinery stay out of web processes
+    assert 'alembic' not in modules
+    assert 'app.background_tasks' not in modules
+    assert 'app.maintenance' not in modules
+
+
+def test_schema_version_is_migration_head():
+    parent_of = {}
+    versions = os.path.join(ROOT, 'migrations', 'versions')
+    for filename in os.listdir(versions):
+        if filename.endswith('.py'):
+            with open(os.path.join(versions, filename)) as f:
+                source = f.read()
+            revision = re.search(r"^revision = '([^']+)'", source, re.MULTILINE)
+            if revision:
+                parent = re.search(r"^down_revision = (?:'([^']+)'|None)", source, re.MULTILINE)
+                parent_of[revision.group(1)] = parent.group(1)
+
+    def depth(revision):
+        return 0 if revision is None else 1 + depth(parent_of.get(revision))
+
+    # The newest migration heads the longest chain and nothing builds on it yet
+    heads = set(parent_of) - set(parent_of.values())
+    assert SCHEMA_VERSION in heads
+    assert depth(SCHEMA_VERSION) == max(depth(head) for head in heads)